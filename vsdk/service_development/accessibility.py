@@ -0,0 +1,117 @@
+"""
+Batched checks whether the audio files of Voice Fragments are accessible.
+
+Checking every file on its own (storage.exists() or a request to its URL)
+is too slow to validate a service, especially with remote storages. Here
+files are checked in batches: every directory of a storage is listed once,
+and storages that can not be listed are checked with concurrent HEAD
+requests. Results are cached for AUDIO_ACCESSIBILITY_TTL seconds.
+"""
+import logging
+import posixpath
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# Whether an audio file is accessible, per (storage, file name)
+audio_accessibility_cache = ProcessCache('audio file accessibility',
+        ttl = getattr(settings, 'AUDIO_ACCESSIBILITY_TTL', 300))
+
+
+def cache_key(storage, name):
+    return (id(storage), name)
+
+
+def url_accessible(url):
+    """
+    Returns True if a HEAD request to url succeeds.
+    """
+    request = urllib.request.Request(url, method = 'HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout = getattr(settings, 'AUDIO_ACCESSIBILITY_TIMEOUT', 5)):
+            return True
+    except (urllib.error.URLError, OSError, ValueError) as error:
+        logger.info('Audio file at %s is not accessible: %s', url, error)
+        return False
+
+
+def list_directory(storage, directory):
+    """
+    Returns the names of the files in directory of storage, or None if the
+    storage can not be listed.
+    """
+    try:
+        return set(storage.listdir(directory)[1])
+    except NotImplementedError:
+        return None
+    except (OSError, IOError):
+        # The directory does not exist (or is not readable)
+        return set()
+
+
+def check_storage(storage, names):
+    """
+    Returns a dict mapping names to whether they exist in storage.
+    """
+    results = {}
+    by_directory = {}
+    for name in names:
+        by_directory.setdefault(posixpath.dirname(name), []).append(name)
+    unlisted = []
+    for directory, directory_names in by_directory.items():
+        files = list_directory(storage, directory)
+        if files is None:
+            unlisted.extend(directory_names)
+        else:
+            for name in directory_names:
+                results[name] = posixpath.basename(name) in files
+
+    if unlisted:
+        workers = max(1, min(getattr(settings, 'AUDIO_ACCESSIBILITY_WORKERS', 8), len(unlisted)))
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            accessible = executor.map(url_accessible, [storage.url(name) for name in unlisted])
+            results.update(zip(unlisted, accessible))
+    return results
+
+
+def check_audio_files(field_files):
+    """
+    Checks whether the files in field_files (FieldFiles) are accessible,
+    in a batch. Returns a dict mapping (storage id, name) to the result.
+    Results that are cached are not checked again.
+    """
+    results = {}
+    missing = {}
+    for field_file in field_files:
+        if not field_file:
+            continue
+        key = cache_key(field_file.storage, field_file.name)
+        if key in results:
+            continue
+        accessible = audio_accessibility_cache.lookup(key)
+        if accessible is None:
+            missing.setdefault(id(field_file.storage), (field_file.storage, set()))[1].add(field_file.name)
+        else:
+            results[key] = accessible
+
+    for storage, names in missing.values():
+        for name, accessible in check_storage(storage, sorted(names)).items():
+            key = cache_key(storage, name)
+            audio_accessibility_cache.set(key, accessible)
+            results[key] = accessible
+    return results
+
+
+def audio_file_accessible(field_file):
+    """
+    Returns True if the file in field_file (a FieldFile) is accessible.
+    """
+    if not field_file:
+        return False
+    return check_audio_files([field_file])[cache_key(field_file.storage, field_file.name)]
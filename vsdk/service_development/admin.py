@@ -1,10 +1,21 @@
 from django.contrib import messages
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.http import StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
+from django.utils.timezone import localtime
 
 from vsdk import settings
 from .models import *
+from .call_trace import flush_call_traces
+from .export import ReportExport
+from .retention import schedule_compaction
+from .telephony import activate_voice_service
+from .validation import element_validation_errors, prefetch_service_validations
 
 
 def format_validation_result(obj):
@@ -12,40 +23,44 @@ def format_validation_result(obj):
     return '<br/>'.join(obj.validator())
 
 
+def format_trace_waterfall(trace):
+    """Creates a HTML table with a bar per request of a CallTrace"""
+    hops = trace.hop_list()
+    total = max([hop.offset + hop.server_time for hop in hops] + [1])
+    rows = format_html_join('\n', '<tr><td>{}</td><td>{}</td><td>+{} ms</td><td>{} ms</td><td>{} ms</td><td>{}</td><td>{} ms</td>'
+            '<td style="width: 300px"><div style="margin-left: {}%; width: {}%; min-width: 1px; height: 10px; background: #79aec8"></div></td></tr>',
+            ((hop.view, hop.status, hop.offset, hop.server_time, hop.db_time, hop.queries, round(hop.gap),
+                    round(100.0 * hop.offset / total, 2), round(100.0 * hop.server_time / total, 2)) for hop in hops))
+    header = format_html('<tr><th>{}</th><th>{}</th><th>{}</th><th>{}</th><th>{}</th><th>{}</th><th>{}</th><th></th></tr>',
+            _('Request'), _('Status'), _('Start'), _('Server time'), _('Database time'), _('Queries'), _('Time before'))
+    return format_html('<table>{}{}</table>', header, rows)
+
+
+def format_archived_history(archive):
+    """Creates a HTML table with the archived steps and choices of a CallSession"""
+    steps = format_html_join('\n', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+            ((localtime(step.time), step.element or '', step.description or '') for step in archive.steps()))
+    choices = format_html_join('\n', '<tr><td>{}</td><td>{}</td></tr>',
+            ((localtime(choice.time), choice.choice_option or '') for choice in archive.choices()))
+    return format_html('<table><tr><th>{}</th><th>{}</th><th>{}</th></tr>{}</table>'
+            '<table><tr><th>{}</th><th>{}</th></tr>{}</table>',
+            _('Time'), _('Visited element'), _('Description'), steps, _('Time'), _('Choice option selected'), choices)
+
+
 class VoiceServiceAdmin(admin.ModelAdmin):
-    fieldsets = [(_('General'),    {'fields' : ['name', 'description', 'vxml_url', 'active', 'is_valid', 'validation_details', 'supported_languages']}),
+    fieldsets = [(_('General'),    {'fields' : ['name', 'description', 'vxml_url', 'active', 'activation', 'is_valid', 'validation_details', 'supported_languages']}),
                     (_('Registration process'), {'fields': ['registration', 'registration_language']}),
-                    (_('Call flow'), {'fields': ['_start_element']})]
-    list_display = ('name','active')
-    readonly_fields = ('vxml_url', 'is_valid', 'validation_details')
+                    (_('Call flow'), {'fields': ['_start_element']}),
+                    (_('Call history'), {'fields': ['call_history_retention_days']})]
+    list_display = ('name','active', 'activation_status')
+    actions = ['compact_call_history']
+    readonly_fields = ('vxml_url', 'activation', 'is_valid', 'validation_details')
 
     def save_model(self, request, obj, form, change):
-        if obj.active and 'active' in form.changed_data and settings.KASADAKA:
-            #set all other voice services to inactive
-            other_vs = VoiceService.objects.exclude(pk=obj.id)
-            for vs in other_vs:
-                vs.active = False
-                vs.save()
-            #change asterisk config here
-            from pathlib import Path
-            my_file = Path(settings.ASTERISK_EXTENSIONS_FILE)
-            if my_file.is_file():
-                extensions = ''
-                with open(settings.ASTERISK_EXTENSIONS_FILE) as infile:
-                    import re
-                    extensions = infile.read()
-                    regex = r"(Vxml\()(.+)(\?callerid\=\$\{CALLERID\(num\)\}\))"
-                    subst = "\\1"+ settings.VXML_HOST_ADDRESS + str(obj.get_vxml_url()) + "\\3"
-                    extensions = re.sub(regex, subst, extensions, 0)
-                with open(settings.ASTERISK_EXTENSIONS_FILE, 'w') as outfile:
-                    outfile.write(extensions)
-                #Reload asterisk
-                import subprocess
-                subprocess.getoutput("sudo /etc/init.d/asterisk reload")
-                messages.add_message(request, messages.WARNING, _('Voice service activated. Other voice services have been deactivated, the Asterisk configuration has been changed to point to this service, and this new configuration has been loaded.'))
-            else:
-                messages.add_message(request, messages.ERROR, _('Voice service activated. Other voice services have been deactivated. THE ASTERISK CONFIGURATION COULD NOT BE FOUND!'))
         super(VoiceServiceAdmin, self).save_model(request, obj, form, change)
+        if obj.active and 'active' in form.changed_data and settings.KASADAKA:
+            activate_voice_service(obj)
+            messages.add_message(request, messages.INFO, _('Voice service activated. Other voice services have been deactivated. The Asterisk configuration is changed to point to this service in the background; the result is shown as the activation status.'))
 
     def get_readonly_fields(self, request, obj=None):
         """
@@ -60,15 +75,44 @@ class VoiceServiceAdmin(admin.ModelAdmin):
         return mark_safe(format_validation_result(obj))
     validation_details.short_description = _('Validation errors')
 
+    def compact_call_history(self, request, queryset):
+        schedule_compaction(list(queryset.values_list('pk', flat = True)))
+        messages.add_message(request, messages.INFO, _('The call history older than the retention period of the selected voice services is compacted in the background.'))
+    compact_call_history.short_description = _('Compact expired call history')
+
+    def activation(self, obj=None):
+        if obj is None or not obj.activation_status:
+            return '-'
+        return format_html('{}<br/>{}', obj.get_activation_status_display(), obj.activation_message)
+    activation.short_description = _('Activation status')
+
+
+class ValidatedChangeList(ChangeList):
+    """Looks up the validation of the services of a page of elements at once"""
+
+    def get_results(self, request):
+        super(ValidatedChangeList, self).get_results(request)
+        prefetch_service_validations(self.result_list)
+
 
 class VoiceServiceElementAdmin(admin.ModelAdmin):
     fieldsets = [(_('General'),    {'fields' : [ 'name', 'description','service','is_valid', 'validation_details', 'voice_label']})]
     list_filter = ['service']
     list_display = ('name', 'service', 'is_valid')
+    list_select_related = ('service',)
     readonly_fields = ('is_valid', 'validation_details')
 
+    def get_changelist(self, request, **kwargs):
+        return ValidatedChangeList
+
+    def is_valid(self, obj=None):
+        return len(element_validation_errors(obj)) == 0
+    is_valid.boolean = True
+    is_valid.short_description = _('Is valid')
+
     def validation_details(self, obj=None):
-        return mark_safe(format_validation_result(obj))
+        """Uses the (cached) validation of the service of the element"""
+        return mark_safe('<br/>'.join(element_validation_errors(obj)))
     validation_details.short_description = _('Validation errors')
 
 
@@ -89,8 +133,8 @@ class VoiceLabelInline(admin.TabularInline):
     model = VoiceFragment
     extra = 2
     fk_name = 'parent'
-    fieldsets = [(_('General'),    {'fields' : [ 'language', 'is_valid', 'audio', 'audio_file_player']})]
-    readonly_fields = ('audio_file_player','is_valid')
+    fieldsets = [(_('General'),    {'fields' : [ 'language', 'is_valid', 'audio', 'audio_file_player', 'conversion_status']})]
+    readonly_fields = ('audio_file_player','is_valid', 'conversion_status')
 
 
 class VoiceLabelByVoiceServicesFilter(admin.SimpleListFilter):
@@ -132,37 +176,117 @@ class VoiceLabelAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not settings.KASADAKA:
             messages.add_message(request, messages.WARNING, _('Automatic .wav file conversion only works when running on real KasaDaka system. MANUALLY ensure your files are in the correct format! Wave (.wav) : Sample rate 8KHz, 16 bit, mono, Codec: PCM 16 LE (s16l)'))
+        else:
+            messages.add_message(request, messages.INFO, _('New audio files are converted to the correct format in the background. The conversion status is shown for every Voice Fragment.'))
         super(VoiceLabelAdmin,self).save_model(request, obj, form, change)
 
 
-class CallSessionStepsInline(admin.TabularInline):
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset with a single page of the related objects. The page is
+    read from the <prefix>-page parameter (see PaginatedInline), which is
+    also submitted with the change form, so a POST is bound to the page
+    that was shown.
+    """
+    per_page = 50
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            self.page = Paginator(super(PaginatedInlineFormSet, self).get_queryset(), self.per_page).get_page(self.page_number)
+            self.prepare_page(list(self.page.object_list))
+        return self.page.object_list
+
+    def prepare_page(self, objects):
+        for obj in objects:
+            # The parent is shown in the string representation of every object
+            setattr(obj, self.fk.name, self.instance)
+
+
+class CallSessionStepsFormSet(PaginatedInlineFormSet):
+
+    def prepare_page(self, objects):
+        super(CallSessionStepsFormSet, self).prepare_page(objects)
+        CallSessionStep.prefetch_visited_elements(objects)
+
+
+class PaginatedInline(admin.TabularInline):
+    """Read-only tabular inline that is split into pages of per_page rows"""
+    template = 'admin/service_development/paginated_tabular.html'
+    formset = PaginatedInlineFormSet
+    per_page = 50
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super(PaginatedInline, self).get_formset(request, obj, **kwargs)
+        page_parameter = formset.get_default_prefix() + '-page'
+        page_number = request.POST.get(page_parameter) or request.GET.get(page_parameter, 1)
+        return type(formset.__name__, (formset,), {'per_page': self.per_page, 'page_number': page_number})
+
+
+class CallSessionStepsInline(PaginatedInline):
     model = CallSessionStep
+    formset = CallSessionStepsFormSet
     extra = 0
     fk_name = 'session'
     can_delete = False
     fieldsets = [(_('General'), {'fields' : ['visited_element', 'time', 'description']})]
     readonly_fields = ('time','session','visited_element', 'description')
+    ordering = ('time', 'pk')
     max_num = 0
 
 
-class CallSessionChoicesInline(admin.TabularInline):
+class CallSessionChoicesInline(PaginatedInline):
     model = CallSessionChoice
     extra = 0
     fk_name = 'session'
     can_delete = False
     fieldsets = [(_('General'), {'fields' : ['choice_element', 'choice_option_selected']})]
     readonly_fields = ('session', 'choice_element', 'choice_option_selected')
+    ordering = ('time', 'pk')
     max_num = 0
 
+    def get_queryset(self, request):
+        return super(CallSessionChoicesInline, self).get_queryset(request).select_related(
+                'choice_element', 'choice_option_selected__parent')
+
 
 class CallSessionAdmin(admin.ModelAdmin):
-    list_display = ('start','user','service','caller_id','language')
+    list_display = ('start','user','service','caller_id','session_language')
     list_filter = ('service','user','caller_id')
-    fieldsets = [(_('General'), {'fields' : ['service', 'user','caller_id','start','end','language']})]
-    readonly_fields = ('service','user','caller_id','start','end','language')
+    list_select_related = ('user', 'service', '_language')
+    fieldsets = [(_('General'), {'fields' : ['service', 'user','caller_id','start','end','session_language']}),
+                    (_('Trace'), {'fields': ['trace_waterfall']}),
+                    (_('Archived history'), {'fields': ['archived_history']})]
+    readonly_fields = ('service','user','caller_id','start','end','session_language', 'trace_waterfall', 'archived_history')
     inlines = [CallSessionStepsInline, CallSessionChoicesInline]
     can_delete = True
 
+    def get_queryset(self, request):
+        return super(CallSessionAdmin, self).get_queryset(request).select_related('user', 'service', '_language')
+
+    def session_language(self, obj=None):
+        """The stored language, determining it might save the session"""
+        return obj._language
+    session_language.short_description = _('Language')
+    session_language.admin_order_field = '_language'
+
+    def trace_waterfall(self, obj=None):
+        flush_call_traces()
+        try:
+            trace = obj.trace
+        except CallTrace.DoesNotExist:
+            return _('This call has not been traced')
+        return format_trace_waterfall(trace)
+    trace_waterfall.short_description = _('Requests')
+
+    def archived_history(self, obj=None):
+        try:
+            archive = obj.archive
+        except CallSessionArchive.DoesNotExist:
+            return _('The history of this call has not been compacted')
+        return format_archived_history(archive)
+    archived_history.short_description = _('Steps and choices')
+
     def has_add_permission(self, request):
         return False
 
@@ -175,15 +299,73 @@ class CallSessionAdmin(admin.ModelAdmin):
     #        del actions['delete_selected']
     #    return actions
 
+class CallTraceAdmin(admin.ModelAdmin):
+    list_display = ('session', 'start', 'hop_count', 'server_time', 'db_time', 'queries', 'gap_time')
+    list_select_related = ('session', 'session__user')
+    ordering = ('-server_time',)
+    fields = ('session', 'start', 'hop_count', 'server_time', 'db_time', 'queries', 'gap_time', 'waterfall')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def waterfall(self, obj=None):
+        return format_trace_waterfall(obj)
+    waterfall.short_description = _('Requests')
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """Read-only statistics, maintained by analytics.py"""
+    list_filter = ('period', 'service')
+    date_hierarchy = 'start'
+    ordering = ('-start',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class CallRollupAdmin(RollupAdmin):
+    list_display = ('start', 'period', 'service', 'calls', 'mean_duration', 'reports')
+    list_select_related = ('service',)
+
+    def mean_duration(self, obj):
+        if obj.mean_duration is None:
+            return '-'
+        return '%.0f s' % obj.mean_duration
+    mean_duration.short_description = _('Mean duration')
+
+
+class ElementRollupAdmin(RollupAdmin):
+    list_display = ('start', 'period', 'element', 'visits', 'exits', 'exit_rate')
+    list_select_related = ('element',)
+
+    def exit_rate(self, obj):
+        return '%.0f%%' % (100.0 * obj.exits / obj.visits) if obj.visits else '-'
+    exit_rate.short_description = _('Calls ended here (%)')
+
+
+class ChoiceOptionRollupAdmin(RollupAdmin):
+    list_display = ('start', 'period', 'choice_option', 'selections')
+    list_select_related = ('choice_option__parent',)
+
+
 class MessagePresentationAdmin(VoiceServiceElementAdmin):
     fieldsets = VoiceServiceElementAdmin.fieldsets + [(_('Message Presentation'), {'fields': ['_redirect','final_element']})]
 
 class KasaDakaUserAdmin(admin.ModelAdmin):
     list_filter = ['service','language','caller_id']
     list_display = ('__str__','caller_id', 'service', 'language')
+    list_select_related = ('service', 'language')
+
+class UserInputCategoryAdmin(admin.ModelAdmin):
+    list_select_related = ('service',)
 
 class SpokenUserInputAdmin(admin.ModelAdmin):
     list_display = ('__str__','category','description','audio_file_player')
+    list_select_related = ('category__service', 'session__service')
     list_filter = ('category',)
     fieldsets = [(_('General'), {'fields' : ['audio', 'audio_file_player', 'session','category','description']})]
     readonly_fields = ('audio','session','category', 'audio_file_player')
@@ -234,10 +416,34 @@ class UserReportAdmin(admin.ModelAdmin):
     inlines = [UserReportSpokenUserInputInline, UserReportChoicesInline]
     fieldsets = [(None, {'fields': ['report_element', 'session']})]
     readonly_fields = ('report_element', 'session')
+    list_select_related = ('report_element', 'session__service')
+    actions = ['export_csv', 'export_ndjson', 'export_zip']
 
     def has_add_permission(self, request):
         return False
 
+    def export_response(self, export, content_type, zip_archive = False):
+        if zip_archive:
+            response = StreamingHttpResponse(export.zip_chunks(), content_type = 'application/zip')
+            filename = 'reports.zip'
+        else:
+            response = StreamingHttpResponse(export.lines(), content_type = content_type)
+            filename = export.filename
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+    def export_csv(self, request, queryset):
+        return self.export_response(ReportExport(queryset, 'csv'), 'text/csv; charset=utf-8')
+    export_csv.short_description = _('Export selected reports (CSV)')
+
+    def export_ndjson(self, request, queryset):
+        return self.export_response(ReportExport(queryset, 'ndjson'), 'application/x-ndjson; charset=utf-8')
+    export_ndjson.short_description = _('Export selected reports (NDJSON)')
+
+    def export_zip(self, request, queryset):
+        return self.export_response(ReportExport(queryset, 'csv'), None, zip_archive = True)
+    export_zip.short_description = _('Export selected reports with recordings (ZIP)')
+
 
 class RetrieveReportsFilterInline(admin.TabularInline):
     model = RetrieveReportsFilter
@@ -258,11 +464,15 @@ admin.site.register(VoiceService, VoiceServiceAdmin)
 admin.site.register(MessagePresentation, MessagePresentationAdmin)
 admin.site.register(Choice, ChoiceAdmin)
 admin.site.register(CallSession, CallSessionAdmin)
+admin.site.register(CallTrace, CallTraceAdmin)
+admin.site.register(CallRollup, CallRollupAdmin)
+admin.site.register(ElementRollup, ElementRollupAdmin)
+admin.site.register(ChoiceOptionRollup, ChoiceOptionRollupAdmin)
 admin.site.register(KasaDakaUser, KasaDakaUserAdmin)
 admin.site.register(Language)
 admin.site.register(VoiceLabel, VoiceLabelAdmin)
 admin.site.register(SpokenUserInput, SpokenUserInputAdmin)
-admin.site.register(UserInputCategory)
+admin.site.register(UserInputCategory, UserInputCategoryAdmin)
 admin.site.register(Record)
 admin.site.register(Report, ReportAdmin)
 admin.site.register(UserReport, UserReportAdmin)
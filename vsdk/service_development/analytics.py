@@ -0,0 +1,246 @@
+"""
+Incremental call analytics.
+
+The visits and exits (last visited element of a call) per element, the
+selections per Choice Option, and the calls, their duration and the reports
+submitted during them are rolled up per Voice Service and per hour and day
+in which the calls started (CallRollup, ElementRollup, ChoiceOptionRollup).
+Statistics in the admin are read from these tables only.
+
+Sessions are added to the rollups once, in order of their id: the
+RollupWatermark remembers the last session that was added. Sessions are
+only added once they have been inactive for CALL_ANALYTICS_IDLE_MINUTES, so
+calls that are still going on are not counted half. Sessions are read in
+chunks of CALL_ANALYTICS_CHUNK, and every chunk is added in a transaction
+together with the new watermark.
+
+The steps and choices of compacted sessions (see retention.py) are read
+from their archives, so the rollups can be rebuilt over all history.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .call_log import flush_call_log
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = 'call-analytics'
+PERIODS = ('hour', 'day')
+
+
+def period_start(time, period):
+    """
+    Returns the start of the hour or day (in the current time zone) of time.
+    """
+    if period == 'hour':
+        return time.replace(minute = 0, second = 0, microsecond = 0)
+    # The UTC offset at the start of the day might differ from the one at time
+    return timezone.make_aware(timezone.localtime(time).replace(hour = 0, minute = 0, second = 0, microsecond = 0,
+            tzinfo = None))
+
+
+def watermark():
+    """
+    Returns the id of the last CallSession that was added to the rollups.
+    """
+    from .models import RollupWatermark
+    return RollupWatermark.objects.filter(name = WATERMARK).values_list('session_id', flat = True).first() or 0
+
+
+class SessionRollups(object):
+    """
+    The rollups of a chunk of CallSessions, which are added to the tables.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.timed_calls = Counter()
+        self.duration = Counter()
+        self.reports = Counter()
+        self.visits = Counter()
+        self.exits = Counter()
+        self.selections = Counter()
+
+    def add_sessions(self, sessions):
+        """
+        Adds sessions, (id, service id, start, end) tuples.
+        """
+        from .models import CallSessionArchive, CallSessionChoice, CallSessionStep, UserReport
+
+        buckets = {}
+        for session_id, service_id, start, end in sessions:
+            if service_id is None:
+                continue
+            buckets[session_id] = [(service_id, period, period_start(start, period)) for period in PERIODS]
+            for bucket in buckets[session_id]:
+                self.calls[bucket] += 1
+                if end is not None:
+                    self.timed_calls[bucket] += 1
+                    self.duration[bucket] += max(0.0, (end - start).total_seconds())
+        session_ids = list(buckets)
+        if not session_ids:
+            return
+
+        visited = defaultdict(list)
+        for session_id, element_id in CallSessionStep.objects.filter(session_id__in = session_ids,
+                _visited_element__isnull = False).order_by('time', 'pk').values_list('session_id', '_visited_element_id'):
+            visited[session_id].append(element_id)
+        options = Counter(CallSessionChoice.objects.filter(session_id__in = session_ids,
+                choice_option_selected__isnull = False).values_list('session_id', 'choice_option_selected_id'))
+        for archive in CallSessionArchive.objects.filter(session_id__in = session_ids):
+            # Steps are compacted entirely, choices only when they do not belong to a report
+            visited[archive.session_id] = [step.element_id for step in archive.steps() if step.element_id is not None]
+            options.update((archive.session_id, choice.choice_option_id) for choice in archive.choices()
+                    if choice.choice_option_id is not None)
+        reports = dict(UserReport.objects.filter(session_id__in = session_ids).values('session').annotate(
+                count = Count('pk')).values_list('session', 'count'))
+
+        for session_id in session_ids:
+            for bucket in buckets[session_id]:
+                for element_id in visited[session_id]:
+                    self.visits[bucket + (element_id,)] += 1
+                if visited[session_id]:
+                    self.exits[bucket + (visited[session_id][-1],)] += 1
+                self.reports[bucket] += reports.get(session_id, 0)
+        for (session_id, option_id), count in options.items():
+            for bucket in buckets[session_id]:
+                self.selections[bucket + (option_id,)] += count
+
+    def save(self):
+        """
+        Adds the rollups to the tables, in the current transaction.
+        """
+        from .models import CallRollup, ChoiceOptionRollup, ChoiceOption, ElementRollup, VoiceServiceElement
+
+        def call_values(rollup, bucket):
+            rollup.calls += self.calls[bucket]
+            rollup.timed_calls += self.timed_calls[bucket]
+            rollup.duration += self.duration[bucket]
+            rollup.reports += self.reports[bucket]
+
+        def element_values(rollup, key):
+            rollup.visits += self.visits[key]
+            rollup.exits += self.exits[key]
+
+        def option_values(rollup, key):
+            rollup.selections += self.selections[key]
+
+        # Elements and options might have been deleted in the meantime
+        element_ids = set(VoiceServiceElement.objects.filter(
+                pk__in = set(key[3] for key in self.visits)).values_list('pk', flat = True))
+        option_ids = set(ChoiceOption.objects.filter(
+                pk__in = set(key[3] for key in self.selections)).values_list('pk', flat = True))
+
+        self.merge(CallRollup, (), list(self.calls), call_values, ['calls', 'timed_calls', 'duration', 'reports'])
+        self.merge(ElementRollup, ('element_id',), [key for key in self.visits if key[3] in element_ids],
+                element_values, ['visits', 'exits'])
+        self.merge(ChoiceOptionRollup, ('choice_option_id',), [key for key in self.selections if key[3] in option_ids],
+                option_values, ['selections'])
+
+    def merge(self, model, key_fields, keys, add_values, value_fields):
+        """
+        Adds the values of keys, (service id, period, start, ...key_fields)
+        tuples, to the existing rows of model, or creates them.
+        """
+        if not keys:
+            return
+        fields = ('service_id', 'period', 'start') + key_fields
+        existing = {}
+        rows = model.objects.select_for_update().filter(service_id__in = set(key[0] for key in keys),
+                start__in = set(key[2] for key in keys))
+        for row in rows:
+            existing[tuple(getattr(row, field) for field in fields)] = row
+        new_rows = []
+        for key in keys:
+            row = existing.get(key)
+            if row is None:
+                row = model(**dict(zip(fields, key)))
+                new_rows.append(row)
+            add_values(row, key)
+        model.objects.bulk_create(new_rows)
+        model.objects.bulk_update([existing[key] for key in keys if key in existing], value_fields)
+
+
+def idle_before():
+    return timezone.now() - timedelta(minutes = getattr(settings, 'CALL_ANALYTICS_IDLE_MINUTES', 60))
+
+
+def update_rollups(chunk_size = None):
+    """
+    Adds the CallSessions after the watermark that are no longer active to
+    the rollups, in chunks. Returns the number of sessions added.
+    """
+    from .models import CallSession, RollupWatermark
+
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'CALL_ANALYTICS_CHUNK', 500)
+    flush_call_log()
+    before = idle_before()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Serializes concurrent updates
+            mark = RollupWatermark.objects.select_for_update().get_or_create(name = WATERMARK)[0]
+            sessions = list(CallSession.objects.filter(pk__gt = mark.session_id).order_by('pk').values_list(
+                    'pk', 'service_id', 'start', 'end')[:chunk_size])
+            complete = []
+            for session in sessions:
+                if max(session[2], session[3] or session[2]) >= before:
+                    # Later sessions are added once this one has finished
+                    break
+                complete.append(session)
+            if not complete:
+                return total
+            rollups = SessionRollups()
+            rollups.add_sessions(complete)
+            rollups.save()
+            mark.session_id = complete[-1][0]
+            mark.save()
+        total += len(complete)
+        if len(complete) < chunk_size:
+            return total
+
+
+def rebuild_rollups(service_ids = None, chunk_size = None):
+    """
+    Deletes the rollups (of the Voice Services with service_ids) and adds
+    all sessions up to the watermark again, in chunks. Returns the number of
+    sessions added.
+    """
+    from .models import CallRollup, CallSession, ChoiceOptionRollup, ElementRollup
+
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'CALL_ANALYTICS_CHUNK', 500)
+    flush_call_log()
+    last_id = watermark()
+    sessions = CallSession.objects.filter(pk__lte = last_id, service__isnull = False)
+    with transaction.atomic():
+        for model in (CallRollup, ElementRollup, ChoiceOptionRollup):
+            rollups = model.objects.all()
+            if service_ids is not None:
+                rollups = rollups.filter(service_id__in = service_ids)
+            rollups.delete()
+    if service_ids is not None:
+        sessions = sessions.filter(service_id__in = service_ids)
+
+    total = 0
+    previous_id = 0
+    while True:
+        chunk = list(sessions.filter(pk__gt = previous_id).order_by('pk').values_list(
+                'pk', 'service_id', 'start', 'end')[:chunk_size])
+        if not chunk:
+            break
+        with transaction.atomic():
+            rollups = SessionRollups()
+            rollups.add_sessions(chunk)
+            rollups.save()
+        total += len(chunk)
+        previous_id = chunk[-1][0]
+    # Sessions after the watermark are added by update_rollups
+    return total + update_rollups(chunk_size)
@@ -4,3 +4,7 @@ from django.utils.translation import ugettext_lazy as _
 class ServiceDevelopmentConfig(AppConfig):
     name = 'vsdk.service_development'
     verbose_name = _("Voice Service Development")
+
+    def ready(self):
+        # Connect the cache invalidation signal receivers
+        from . import signals
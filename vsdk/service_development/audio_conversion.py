@@ -0,0 +1,98 @@
+"""
+Background conversion of uploaded Voice Fragments.
+
+Uploaded audio that is not in the format required by the telephony
+platform (see validators.validate_audio_file_format) is converted with
+sox. Instead of doing this while saving the fragment in the admin, saving
+only marks the fragment as pending. The fragments table is the queue: a
+bounded pool of worker threads claims pending fragments and converts them,
+and the process_audio_conversions management command picks up anything
+that was left behind (e.g. when a worker process was restarted).
+"""
+import logging
+import subprocess
+
+from django.conf import settings
+from django.db.models.signals import post_save
+
+from .background import BackgroundQueue
+
+logger = logging.getLogger(__name__)
+
+
+def conversion_enabled():
+    return getattr(settings, 'KASADAKA', False)
+
+
+def convert_audio_file(path, new_path):
+    """
+    Converts the wave file at path to 8 kHz, 16 bit, mono, signed PCM at
+    new_path. Raises an OSError when sox fails.
+    """
+    result = subprocess.run(['sox', '-S', path, '-r', '8k', '-b', '16', '-c', '1', '-e', 'signed-integer', new_path],
+            stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    if result.returncode != 0:
+        raise OSError(result.stdout.strip() or 'sox exited with status %s' % result.returncode)
+
+
+def convert_voice_fragment(fragment_id):
+    """
+    Claims the pending Voice Fragment with fragment_id, and converts its
+    audio when it is not in the correct format. Returns the new conversion
+    status, or None if the fragment was not pending (anymore).
+    """
+    from .models import VoiceFragment
+    from .models.validators import validate_audio_file_format
+
+    claimed = VoiceFragment.objects.filter(pk = fragment_id,
+            conversion_status = VoiceFragment.CONVERSION_PENDING).update(
+                    conversion_status = VoiceFragment.CONVERSION_CONVERTING)
+    if not claimed:
+        return None
+
+    fragment = VoiceFragment.objects.get(pk = fragment_id)
+    audio_name = fragment.audio.name
+    changes = {'conversion_status': VoiceFragment.CONVERSION_CONVERTED, 'conversion_error': ''}
+    try:
+        if not validate_audio_file_format(fragment.audio):
+            new_name = fragment.converted_audio_name()
+            convert_audio_file(fragment.audio.path, fragment.audio.storage.path(new_name))
+            changes['audio'] = new_name
+    except Exception as error:
+        logger.exception('Could not convert the audio of %s', fragment)
+        changes = {'conversion_status': VoiceFragment.CONVERSION_FAILED, 'conversion_error': str(error)}
+
+    # The audio might have been replaced while converting, in which case the
+    # fragment is pending again and the result is discarded.
+    updated = VoiceFragment.objects.filter(pk = fragment_id, audio = audio_name,
+            conversion_status = VoiceFragment.CONVERSION_CONVERTING).update(**changes)
+    if not updated:
+        return None
+    for field, value in changes.items():
+        setattr(fragment, field, value)
+    post_save.send(sender = VoiceFragment, instance = fragment, created = False,
+            update_fields = frozenset(changes), raw = False, using = fragment._state.db)
+    return fragment.conversion_status
+
+
+def process_pending_conversions(limit = None):
+    """
+    Converts pending Voice Fragments in the current thread. Returns the
+    number of fragments that were processed.
+    """
+    from .models import VoiceFragment
+
+    pending = VoiceFragment.objects.filter(
+            conversion_status = VoiceFragment.CONVERSION_PENDING).order_by('pk').values_list('pk', flat = True)
+    if limit is not None:
+        pending = pending[:limit]
+    processed = 0
+    for fragment_id in list(pending):
+        if convert_voice_fragment(fragment_id) is not None:
+            processed += 1
+    return processed
+
+
+# Pool of worker threads converting Voice Fragments. With AUDIO_CONVERSION_WORKERS
+# set to 0 fragments are converted in the thread that saves them.
+audio_conversion_queue = BackgroundQueue('audio-conversion', 'AUDIO_CONVERSION_WORKERS')
@@ -0,0 +1,55 @@
+"""
+Bounded pools of worker threads, for work that should not block the
+request that causes it (e.g. converting audio or writing to slow storage).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueue(object):
+    """
+    Runs tasks in a pool of worker threads, which is started on first use.
+    The number of workers is read from the workers_setting setting. With 0
+    workers, tasks run in the thread that submits them.
+    """
+
+    def __init__(self, name, workers_setting, default_workers = 2):
+        self.name = name
+        self.workers_setting = workers_setting
+        self.default_workers = default_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def workers(self):
+        return getattr(settings, self.workers_setting, self.default_workers)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers = self.workers(),
+                        thread_name_prefix = self.name)
+            return self._executor
+
+    def submit(self, task, *args):
+        """
+        Runs task(*args) in the background. Returns a Future, or the result
+        of the task when it was run in the current thread.
+        """
+        if not self.workers():
+            return task(*args)
+        return self._get_executor().submit(self._run, task, *args)
+
+    def _run(self, task, *args):
+        try:
+            return task(*args)
+        except Exception:
+            logger.exception('%s: %s failed', self.name, getattr(task, '__name__', task))
+        finally:
+            # Worker threads have their own database connection
+            connection.close()
@@ -0,0 +1,109 @@
+"""
+Process-wide caches, used to avoid resolving the same voice service data
+from the database on every VoiceXML request.
+"""
+import threading
+import time
+import weakref
+
+
+class ProcessCache(object):
+    """
+    A thread-safe key/value cache that lives as long as the worker process
+    and keeps hit and miss counters.
+
+    An entry can carry a version: looking it up with a different version
+    counts as a miss and recomputes the value. When a ``ttl`` (in seconds)
+    is given, entries older than that are recomputed as well.
+    """
+
+    # All caches that were created, see invalidate_all()
+    _instances = weakref.WeakSet()
+
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        ProcessCache._instances.add(self)
+
+    def get(self, key, compute, version=None):
+        """
+        Returns the cached value for key, calling compute() to (re)create
+        it when it is missing, outdated or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and not self._expired(entry, now):
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            # Do not store a value that was computed while the cache was
+            # being invalidated, it might already be stale.
+            if generation == self._generation:
+                self._entries[key] = (version, now, value)
+        return value
+
+    def lookup(self, key, default=None, version=None):
+        """
+        Returns the cached value for key, or default when it is missing,
+        outdated or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and not self._expired(entry, now):
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+
+    def invalidate(self, key=None):
+        """
+        Removes key from the cache, or all entries when no key is given.
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    @classmethod
+    def all(cls):
+        """
+        Returns all caches, ordered by name.
+        """
+        return sorted(cls._instances, key=lambda cache: cache.name)
+
+    @classmethod
+    def invalidate_all(cls):
+        """
+        Empties all caches, e.g. when switching to another database.
+        """
+        for cache in cls.all():
+            cache.invalidate()
+
+    def stats(self):
+        with self._lock:
+            return {'name': self.name,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._entries)}
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry[1] >= self.ttl
+
+    def __str__(self):
+        return "%(name)s: %(hits)s hits, %(misses)s misses, %(size)s entries" % self.stats()
@@ -0,0 +1,142 @@
+"""
+Write-behind logging of call sessions.
+
+Normally every hop of a call writes the end time of the CallSession and
+inserts a CallSessionStep (and a CallSessionChoice when an option is
+chosen). With CALL_LOG_WRITE_BEHIND enabled, these writes are queued in
+the worker process and flushed in bulk: every CALL_LOG_FLUSH_INTERVAL
+milliseconds, when CALL_LOG_MAX_BUFFERED rows are queued, at the end of a
+call, or before anything reads the call log (see flush_call_log()).
+
+Rows that could not be written because the database was temporarily
+unavailable (e.g. locked) are queued again and retried with the next
+flush; other errors fall back to writing the rows one by one.
+
+flush_call_log() only writes the rows queued in the current process. With
+several worker processes, rows queued by another worker can be read up to
+CALL_LOG_FLUSH_INTERVAL milliseconds after they were logged.
+"""
+import atexit
+import logging
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+from .write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled():
+    return getattr(settings, 'CALL_LOG_WRITE_BEHIND', False)
+
+
+class CallLogBuffer(WriteBehindBuffer):
+    """
+    Thread-safe queue of unsaved CallSessionSteps, CallSessionChoices and
+    CallSession end times.
+    """
+
+    flush_interval_setting = 'CALL_LOG_FLUSH_INTERVAL'
+    default_flush_interval = 500
+
+    def __init__(self):
+        super(CallLogBuffer, self).__init__()
+        self._steps = []
+        self._choices = []
+        self._session_ends = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._steps) + len(self._choices)
+
+    def add_step(self, step):
+        with self._lock:
+            self._steps.append(step)
+            self._session_ends[step.session_id] = step.session.end
+        self._added()
+
+    def add_choice(self, choice):
+        with self._lock:
+            self._choices.append(choice)
+        self._added()
+
+    def _added(self):
+        if len(self) >= getattr(settings, 'CALL_LOG_MAX_BUFFERED', 200):
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def flush(self):
+        """
+        Writes all queued rows to the database: one bulk insert per model,
+        and a single UPDATE of the end time per session. Waits for a flush
+        in progress, so the rows queued before are written on return.
+        """
+        from .models import CallSession, CallSessionStep, CallSessionChoice
+
+        with self._flush_lock:
+            with self._lock:
+                steps, self._steps = self._steps, []
+                choices, self._choices = self._choices, []
+                session_ends, self._session_ends = self._session_ends, {}
+                self._cancel_flush()
+
+            if not (steps or choices or session_ends):
+                return
+            try:
+                with transaction.atomic():
+                    for session_id, end in session_ends.items():
+                        CallSession.objects.filter(pk = session_id).update(end = end)
+                    CallSessionStep.objects.bulk_create(steps)
+                    CallSessionChoice.objects.bulk_create(choices)
+            except OperationalError as error:
+                logger.warning('Could not write %s call session steps and %s choices, retrying: %s',
+                        len(steps), len(choices), error)
+                self._requeue(steps, choices, session_ends)
+            except Exception:
+                logger.exception('Could not write %s call session steps and %s choices in bulk', len(steps), len(choices))
+                self._write_each(steps, choices, session_ends)
+
+    def _requeue(self, steps, choices, session_ends):
+        """
+        Queues rows that could not be written again, before the rows that
+        were queued in the meantime.
+        """
+        with self._lock:
+            self._steps = steps + self._steps
+            self._choices = choices + self._choices
+            for session_id, end in session_ends.items():
+                # Rows queued in the meantime have a later end time
+                self._session_ends.setdefault(session_id, end)
+        self._schedule_flush()
+
+    def _write_each(self, steps, choices, session_ends):
+        """
+        Writes rows one by one, so a row that cannot be written (e.g. of a
+        session that was deleted) does not prevent writing the others.
+        """
+        from .models import CallSession
+
+        for session_id, end in session_ends.items():
+            CallSession.objects.filter(pk = session_id).update(end = end)
+        for row in steps + choices:
+            try:
+                with transaction.atomic():
+                    row.save()
+            except Exception:
+                logger.exception('Could not write %s', row.__class__.__name__)
+
+
+call_log_buffer = CallLogBuffer()
+atexit.register(call_log_buffer.flush)
+
+
+def flush_call_log():
+    """
+    Writes all queued call log rows to the database. Should be called
+    before reading steps or choices of a session that might still be queued.
+    Rows queued by other worker processes are not written.
+    """
+    if write_behind_enabled() or len(call_log_buffer):
+        call_log_buffer.flush()
@@ -0,0 +1,188 @@
+"""
+Tracing of calls across their HTTP requests.
+
+A call consists of many requests (hops): the start of the voice service,
+language selection, user registration and every element. With
+CALL_TRACING enabled, the VxmlMetricsMiddleware records the server time,
+database time and number of queries of every hop of a CallSession. The
+time between two hops is spent by the VoiceXML interpreter, e.g. playing
+audio and waiting for input.
+
+Hops are queued in the worker process and merged into the CallTrace of
+their session every CALL_TRACE_FLUSH_INTERVAL milliseconds, or when
+CALL_TRACE_MAX_BUFFERED hops are queued. Hops of the same call served by
+different processes end up in the same trace. Hops that could not be
+written because the database was temporarily unavailable are queued again.
+"""
+import atexit
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+
+from .write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# A hop as stored in a CallTrace: the offset from the start of the trace,
+# server and database time (all in ms), queries, URL name and status code.
+# gap is the time since the end of the previous hop.
+TraceHop = namedtuple('TraceHop', ('offset', 'server_time', 'db_time', 'queries', 'view', 'status', 'gap'))
+
+
+def tracing_enabled():
+    return getattr(settings, 'CALL_TRACING', False)
+
+
+def decode_hops(hops_json):
+    """
+    Returns the TraceHops in the JSON of CallTrace.hops.
+    """
+    hops = []
+    previous_end = None
+    for offset, server_time, db_time, queries, view, status in json.loads(hops_json):
+        gap = 0 if previous_end is None else max(0, offset - previous_end)
+        hops.append(TraceHop(offset, server_time, db_time, queries, view, status, gap))
+        previous_end = offset + server_time
+    return hops
+
+
+def merge_hops(trace, hops):
+    """
+    Adds hops, (start time, server ms, database ms, queries, URL name, status)
+    tuples with the start time in seconds since the epoch, to trace and
+    updates its totals.
+    """
+    if trace.hop_count:
+        trace_start = trace.start.timestamp()
+        hops = [(trace_start + hop.offset / 1000.0,) + tuple(hop[1:6]) for hop in trace.hop_list()] + list(hops)
+    hops = sorted(hops, key = lambda hop: hop[0])
+    start = hops[0][0]
+    trace.start = datetime.fromtimestamp(start, timezone.utc)
+    stored = [[round((hop_start - start) * 1000), round(server_time, 1), round(db_time, 1), queries, view, status]
+            for hop_start, server_time, db_time, queries, view, status in hops]
+    trace.hops = json.dumps(stored, separators = (',', ':'))
+    decoded = decode_hops(trace.hops)
+    trace.hop_count = len(decoded)
+    trace.server_time = sum(hop.server_time for hop in decoded)
+    trace.db_time = sum(hop.db_time for hop in decoded)
+    trace.queries = sum(hop.queries for hop in decoded)
+    trace.gap_time = sum(hop.gap for hop in decoded)
+    return trace
+
+
+class CallTraceBuffer(WriteBehindBuffer):
+    """
+    Thread-safe queue of hops per CallSession id.
+    """
+
+    flush_interval_setting = 'CALL_TRACE_FLUSH_INTERVAL'
+    default_flush_interval = 2000
+
+    def __init__(self):
+        super(CallTraceBuffer, self).__init__()
+        self._hops = {}
+        self._count = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def add(self, session_id, start, server_time, db_time, queries, view, status):
+        with self._lock:
+            self._hops.setdefault(session_id, []).append((start, server_time, db_time, queries, view, status))
+            self._count += 1
+            count = self._count
+        if count >= getattr(settings, 'CALL_TRACE_MAX_BUFFERED', 500):
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def flush(self):
+        """
+        Merges all queued hops into the CallTraces of their sessions. Waits
+        for a flush in progress.
+        """
+        with self._flush_lock:
+            with self._lock:
+                hops, self._hops = self._hops, {}
+                self._count = 0
+                self._cancel_flush()
+
+            if not hops:
+                return
+            try:
+                self._write(hops)
+            except OperationalError as error:
+                logger.warning('Could not write the traces of %s calls, retrying: %s', len(hops), error)
+                self._requeue(hops)
+            except IntegrityError:
+                # Another process created the trace of one of the sessions in the meantime
+                self._write_each(hops)
+            except Exception:
+                logger.exception('Could not write the traces of %s calls', len(hops))
+
+    def _write(self, hops):
+        from .models import CallSession, CallTrace
+
+        with transaction.atomic():
+            # Sessions might have been deleted in the meantime
+            session_ids = set(CallSession.objects.filter(pk__in = hops).values_list('pk', flat = True))
+            traces = CallTrace.objects.select_for_update().in_bulk(session_ids)
+            new_traces = []
+            for session_id in session_ids:
+                trace = traces.get(session_id)
+                if trace is None:
+                    new_traces.append(merge_hops(CallTrace(session_id = session_id), hops[session_id]))
+                else:
+                    merge_hops(trace, hops[session_id])
+            CallTrace.objects.bulk_create(new_traces)
+            CallTrace.objects.bulk_update(traces.values(),
+                    ['start', 'hop_count', 'server_time', 'db_time', 'queries', 'gap_time', 'hops'])
+
+    def _requeue(self, hops):
+        """
+        Queues hops that could not be written again, before the hops that
+        were queued in the meantime.
+        """
+        with self._lock:
+            for session_id, session_hops in hops.items():
+                self._hops[session_id] = session_hops + self._hops.get(session_id, [])
+                self._count += len(session_hops)
+        self._schedule_flush()
+
+    def _write_each(self, hops):
+        """
+        Writes the hops of every session in its own transaction. A trace
+        that was created by another process since it was read is updated
+        on the second attempt.
+        """
+        for session_id, session_hops in hops.items():
+            for attempt in range(2):
+                try:
+                    self._write({session_id: session_hops})
+                    break
+                except IntegrityError:
+                    if attempt:
+                        logger.exception('Could not write the trace of call %s', session_id)
+                except OperationalError:
+                    self._requeue({session_id: session_hops})
+                    break
+                except Exception:
+                    logger.exception('Could not write the trace of call %s', session_id)
+                    break
+
+
+call_trace_buffer = CallTraceBuffer()
+atexit.register(call_trace_buffer.flush)
+
+
+def flush_call_traces():
+    """
+    Writes all queued hops to the database.
+    """
+    if len(call_trace_buffer):
+        call_trace_buffer.flush()
@@ -0,0 +1,234 @@
+"""
+Compiled, in-memory call flow graphs of Voice Services.
+
+Serving a VoiceXML hop used to walk the ORM: every redirect, choice option
+and voice label was resolved with its own (polymorphic) query. A
+CallFlowGraph holds everything that is needed to serve a hop of a
+service, and is built once per worker and rebuilt whenever an element of
+the service changes.
+"""
+from types import MappingProxyType
+
+from django.db.models import Count, Max, Subquery
+from django.http import Http404
+
+from .cache import ProcessCache
+from .models import VoiceService, VoiceServiceSubElement, VoiceLabel, VoiceFragment
+from .models import ChoiceOption, ReportContent, RetrieveReportsFilter, ContentVersion
+
+
+# Compiled graphs, per VoiceService id
+call_flow_graph_cache = ProcessCache('call flow graphs')
+
+REDIRECT_FIELDS = ('_redirect', '_redirect_yes', '_redirect_no')
+
+
+class CallFlowGraph(object):
+    """
+    Immutable graph of the elements of a Voice Service.
+
+    The nodes are the elements of the service, as instances of their actual
+    subclass. The edges are the redirects between them. Choice options are
+    kept in order per Choice, and the URLs of the Voice Fragments of all
+    voice labels used in the service are resolved for every language.
+
+    Elements that are not part of the graph (e.g. elements of another
+    service) are resolved through the database, so the graph can always be
+    used in place of the model properties.
+    """
+
+    def __init__(self, service_id, version, start_element_id = None, elements = None,
+            redirects = None, choice_options = None, report_contents = None,
+            retrieve_reports_filters = None, voice_fragment_urls = None):
+        self.service_id = service_id
+        self.version = version
+        self.start_element_id = start_element_id
+        self._elements = MappingProxyType(elements or {})
+        self._redirects = MappingProxyType(redirects or {})
+        self._choice_options = MappingProxyType(choice_options or {})
+        self._report_contents = MappingProxyType(report_contents or {})
+        self._retrieve_reports_filters = MappingProxyType(retrieve_reports_filters or {})
+        self._voice_fragment_urls = MappingProxyType(voice_fragment_urls or {})
+
+    def __contains__(self, element):
+        return element.pk in self._elements and self._elements[element.pk] is element
+
+    def __len__(self):
+        return len(self._elements)
+
+    def element(self, element_id, element_class = VoiceServiceSubElement):
+        """
+        Returns the element with element_id if it is part of this graph and an
+        instance of element_class, None otherwise.
+        """
+        try:
+            element = self._elements.get(int(element_id))
+        except (TypeError, ValueError):
+            return None
+        if isinstance(element, element_class):
+            return element
+        return None
+
+    def get_element_or_404(self, element_class, element_id):
+        """
+        Like get_object_or_404(), but returns the element from the graph
+        when it is part of it.
+        """
+        element = self.element(element_id, element_class)
+        if element is None:
+            try:
+                element = element_class.objects.get(pk = element_id)
+            except (element_class.DoesNotExist, ValueError):
+                raise Http404('No %s matches the given query.' % element_class._meta.object_name)
+        return element
+
+    @property
+    def start_element(self):
+        if self.start_element_id is None:
+            return None
+        if self.start_element_id in self._elements:
+            return self._elements[self.start_element_id]
+        return VoiceServiceSubElement.objects.get_subclass_by_id(self.start_element_id)
+
+    def redirect(self, element, field = '_redirect'):
+        """
+        Returns the (subclassed) element that element redirects to through
+        field (one of REDIRECT_FIELDS). For ChoiceOptions this is the element
+        that is redirected to when the option is chosen.
+        """
+        if element not in self:
+            return getattr(element, field.lstrip('_'))
+        target_id = self._redirects.get((element.pk, field))
+        if target_id is None:
+            return None
+        if target_id in self._elements:
+            return self._elements[target_id]
+        # Redirect to an element of another service
+        return VoiceServiceSubElement.objects.get_subclass_by_id(target_id)
+
+    def choice_options(self, choice):
+        """
+        Returns the ChoiceOptions of choice, in order.
+        """
+        if choice not in self:
+            return tuple(choice.choice_options.all())
+        return self._choice_options.get(choice.pk, ())
+
+    def report_contents(self, report):
+        if report not in self:
+            return tuple(report.report_contents.all())
+        return self._report_contents.get(report.pk, ())
+
+    def retrieve_reports_filters(self, retrieve_reports):
+        if retrieve_reports not in self:
+            return tuple(retrieve_reports.choices_filter.all())
+        return self._retrieve_reports_filters.get(retrieve_reports.pk, ())
+
+    def voice_label_url(self, voice_label_id, language):
+        """
+        Returns the URL of the Voice Fragment of the voice label in language.
+        """
+        url = self._voice_fragment_urls.get((voice_label_id, language.pk))
+        if url is None:
+            # Not part of the graph, or no fragment for this language. The latter
+            # raises the same error as an uncompiled lookup would.
+            return VoiceLabel.objects.get(pk = voice_label_id).get_voice_fragment_url(language)
+        return url
+
+    def voice_fragment_url(self, element, language, field = 'voice_label'):
+        """
+        Returns the URL of the Voice Fragment of the voice label in field of
+        element (an element, choice option or report content), in language.
+        """
+        return self.voice_label_url(getattr(element, field + '_id'), language)
+
+
+def voice_label_ids(obj):
+    """
+    Returns the ids of all voice labels referenced by obj.
+    """
+    return [getattr(obj, field.attname) for field in obj._meta.concrete_fields
+            if field.is_relation and field.related_model is VoiceLabel and getattr(obj, field.attname)]
+
+
+def build_call_flow_graph(service_id, version = None):
+    """
+    Compiles the call flow graph of a Voice Service from the database.
+    """
+    elements = {}
+    redirects = {}
+    choice_options = {}
+    report_contents = {}
+    retrieve_reports_filters = {}
+    label_ids = set()
+
+    start_element_id = VoiceService.objects.filter(pk = service_id).values_list('_start_element', flat = True).first()
+
+    service_elements = VoiceServiceSubElement.objects.subclasses_in_bulk(service_id = service_id)
+    for element_id in sorted(service_elements):
+        element = service_elements[element_id]
+        elements[element.pk] = element
+        label_ids.update(voice_label_ids(element))
+        for field in REDIRECT_FIELDS:
+            if getattr(element, field + '_id', None):
+                redirects[(element.pk, field)] = getattr(element, field + '_id')
+        if isinstance(element, ChoiceOption):
+            choice_options.setdefault(element.parent_id, []).append(element)
+
+    for report_content in ReportContent.objects.filter(parent__service_id = service_id).order_by('pk'):
+        report_contents.setdefault(report_content.parent_id, []).append(report_content)
+        label_ids.update(voice_label_ids(report_content))
+
+    for choice_filter in RetrieveReportsFilter.objects.filter(parent__service_id = service_id).order_by('pk'):
+        retrieve_reports_filters.setdefault(choice_filter.parent_id, []).append(choice_filter)
+
+    voice_fragment_urls = {}
+    for fragment in VoiceFragment.objects.filter(parent_id__in = label_ids).order_by('pk'):
+        key = (fragment.parent_id, fragment.language_id)
+        if key not in voice_fragment_urls:
+            voice_fragment_urls[key] = fragment.get_url()
+
+    def frozen(groups):
+        return dict((key, tuple(value)) for key, value in groups.items())
+
+    return CallFlowGraph(service_id, version,
+            start_element_id = start_element_id,
+            elements = elements,
+            redirects = redirects,
+            choice_options = frozen(choice_options),
+            report_contents = frozen(report_contents),
+            retrieve_reports_filters = frozen(retrieve_reports_filters),
+            voice_fragment_urls = voice_fragment_urls)
+
+
+def call_flow_graph_version(service_id):
+    """
+    Returns a value that changes whenever the service or one of its
+    elements is modified, or the voice labels, languages or report contents
+    they use (see ContentVersion), or None if the service does not exist.
+    Changes made by other worker processes are included.
+    """
+    content_version = ContentVersion.objects.filter(name = ContentVersion.VOICE_CONTENT).values('version')[:1]
+    version = VoiceService.objects.filter(pk = service_id).annotate(
+            elements_modified = Max('voiceservicesubelement__modification_date'),
+            elements_count = Count('voiceservicesubelement'),
+            content_version = Subquery(content_version)).values_list(
+                    'modification_date', '_start_element', 'elements_modified', 'elements_count',
+                    'content_version').first()
+    return version
+
+
+def get_call_flow_graph(service_id):
+    """
+    Returns the (cached) compiled call flow graph of the Voice Service with
+    service_id. Returns an empty graph if the service does not exist, which
+    resolves everything through the database.
+    """
+    if service_id is None:
+        return CallFlowGraph(None, None)
+    version = call_flow_graph_version(service_id)
+    if version is None:
+        return CallFlowGraph(service_id, None)
+    return call_flow_graph_cache.get(service_id,
+            lambda: build_call_flow_graph(service_id, version),
+            version = version)
@@ -0,0 +1,199 @@
+"""
+Streaming export of UserReports, with their choices and recordings.
+
+Reports are read with a server-side iterator in order of time, and their
+choices and recordings are looked up per chunk of REPORT_EXPORT_CHUNK_SIZE
+reports, so memory use does not grow with the number of reports. Rows are
+written as CSV or NDJSON (one JSON object per line), optionally in a ZIP
+archive together with the audio of the recordings, which is generated
+while it is streamed.
+
+An export can be resumed: it only includes reports after a cursor, and
+remembers the cursor of the last report it wrote. A cursor is the time and
+id of a report, so reports with the same time are not skipped.
+"""
+import csv
+import json
+import logging
+import zipfile
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+CSV_COLUMNS = ('id', 'time', 'service', 'report', 'session', 'caller_id', 'answers', 'recordings')
+RECORDINGS_DIRECTORY = 'recordings/'
+
+
+def format_cursor(cursor):
+    """
+    Returns the (time, id) cursor as a string, e.g. for --since.
+    """
+    time, report_id = cursor
+    return '%s,%s' % (time.isoformat(), report_id)
+
+
+def parse_cursor(value):
+    """
+    Returns the (time, id) cursor in value, a string of format_cursor() or
+    just a time (ISO 8601), in which case the id is None. Raises a
+    ValueError if it is not valid.
+    """
+    time, separator, report_id = value.rpartition(',')
+    if not separator:
+        time, report_id = value, None
+    time = parse_datetime(time)
+    if time is None or not (report_id is None or report_id.isdigit()):
+        raise ValueError('Not a valid cursor: %s' % value)
+    return time, int(report_id) if report_id is not None else None
+
+
+def after_cursor(cursor):
+    """
+    Returns the filter of the reports after the (time, id) cursor, or after
+    the time when the id is None.
+    """
+    time, report_id = cursor
+    if report_id is None:
+        return Q(time__gt = time)
+    return Q(time__gt = time) | Q(time = time, pk__gt = report_id)
+
+
+class Echo(object):
+    """File-like object that returns what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+class ZipStream(object):
+    """
+    Write-only, non-seekable file for a ZipFile, of which the written data
+    is taken out while the archive is generated.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ReportExport(object):
+    """
+    Export of the UserReports in a queryset, after the cursor since (if
+    given): a (time, id) tuple, or a time.
+    """
+
+    def __init__(self, reports, format = 'csv', since = None, chunk_size = None):
+        if format not in FORMATS:
+            raise ValueError('Unknown export format: %s' % format)
+        self.format = format
+        self.chunk_size = chunk_size or getattr(settings, 'REPORT_EXPORT_CHUNK_SIZE', 500)
+        if since is not None:
+            if not isinstance(since, tuple):
+                since = (since, None)
+            reports = reports.filter(after_cursor(since))
+        self.reports = reports
+        # (time, id) of the last exported report, to resume from
+        self.cursor = None
+
+    @property
+    def filename(self):
+        return 'reports.%s' % self.format
+
+    def rows(self):
+        """
+        Yields a dict per report, with the choice options selected per
+        Choice (answers), and the names of the recording files.
+        """
+        from .models import CallSessionChoice, SpokenUserInput
+
+        reports = self.reports.select_related('report_element', 'session__service').order_by(
+                'time', 'pk').iterator(chunk_size = self.chunk_size)
+        while True:
+            chunk = list(islice(reports, self.chunk_size))
+            if not chunk:
+                return
+            report_ids = [report.pk for report in chunk]
+            answers = defaultdict(dict)
+            for report_id, choice, option in CallSessionChoice.objects.filter(report_id__in = report_ids).order_by(
+                    'time', 'pk').values_list('report_id', 'choice_element__name', 'choice_option_selected__name'):
+                answers[report_id][choice] = option
+            recordings = defaultdict(list)
+            for report_id, audio in SpokenUserInput.objects.filter(report_id__in = report_ids).order_by(
+                    'time', 'pk').values_list('report_id', 'audio'):
+                recordings[report_id].append(audio)
+
+            for report in chunk:
+                session = report.session
+                yield {
+                    'id': report.pk,
+                    'time': report.time.isoformat(),
+                    'service': session.service.name if session.service else None,
+                    'report': report.report_element.name if report.report_element else None,
+                    'session': session.pk,
+                    'caller_id': session.caller_id,
+                    'answers': answers[report.pk],
+                    'recordings': recordings[report.pk],
+                }
+                self.cursor = (report.time, report.pk)
+
+    def lines(self):
+        """
+        Yields the export as lines of CSV or NDJSON.
+        """
+        if self.format == 'csv':
+            writer = csv.writer(Echo())
+            yield writer.writerow(CSV_COLUMNS)
+            for row in self.rows():
+                row['answers'] = '; '.join('%s: %s' % answer for answer in row['answers'].items())
+                row['recordings'] = ' '.join(row['recordings'])
+                yield writer.writerow([row[column] for column in CSV_COLUMNS])
+        else:
+            for row in self.rows():
+                yield json.dumps(row, ensure_ascii = False) + '\n'
+
+    def zip_chunks(self):
+        """
+        Yields a ZIP archive with the export and the audio of the recordings
+        of the reports (in the recordings directory), as it is generated.
+        """
+        from .models import SpokenUserInput
+
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, 'w', compression = zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(self.filename, 'w') as export:
+                for line in self.lines():
+                    export.write(line.encode('utf-8'))
+                    yield stream.take()
+
+            # The rows have been written, the recordings of the same reports are read again
+            recordings = SpokenUserInput.objects.none()
+            if self.cursor is not None:
+                recordings = SpokenUserInput.objects.filter(report__in = self.reports.exclude(after_cursor(self.cursor)))
+            for recording in recordings.order_by('time', 'pk').iterator(chunk_size = self.chunk_size):
+                try:
+                    audio = recording.audio.open('rb')
+                except (OSError, ValueError) as error:
+                    logger.warning('Could not export recording %s: %s', recording.audio.name, error)
+                    continue
+                with audio, archive.open(RECORDINGS_DIRECTORY + recording.audio.name, 'w') as destination:
+                    for chunk in audio.chunks():
+                        destination.write(chunk)
+                        yield stream.take()
+        yield stream.take()
@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DatabaseError
+from django.test.utils import setup_databases, teardown_databases
+
+from ...cache import ProcessCache
+
+
+@contextmanager
+def fixture_database(fixture):
+    """
+    Creates test databases with the data in fixture loaded, and destroys
+    them afterwards. Raises a CommandError when the fixture can not be
+    loaded (e.g. when it was dumped from an older version of the models).
+    """
+    old_config = setup_databases(verbosity = 0, interactive = False)
+    # Cached data of the previous database would be used for the new one
+    ProcessCache.invalidate_all()
+    try:
+        # Dumps of this project include the content types, which would
+        # conflict with the ones created with the test database
+        ContentType.objects.all().delete()
+        ContentType.objects.clear_cache()
+        try:
+            call_command('loaddata', fixture, verbosity = 0)
+        except (DeserializationError, DatabaseError) as error:
+            raise CommandError('Could not load %s: %s' % (fixture, error.__cause__ or error))
+        yield
+    finally:
+        teardown_databases(old_config, verbosity = 0)
+        ProcessCache.invalidate_all()
@@ -0,0 +1,28 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+
+from ...models import VoiceServiceSubElement
+
+
+class Command(BaseCommand):
+    help = 'Stores the subclass type of voice service elements that were saved without it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 500,
+                help = 'Number of elements to resolve per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        while True:
+            ids = list(VoiceServiceSubElement.objects.filter(
+                _subclass_type__isnull = True).order_by('pk').values_list('pk', flat = True)[:batch_size])
+            if not ids:
+                break
+            ids_by_type = {}
+            for element in VoiceServiceSubElement.objects.filter(pk__in = ids).select_subclasses():
+                ids_by_type.setdefault(ContentType.objects.get_for_model(element), []).append(element.pk)
+            for subclass_type, type_ids in ids_by_type.items():
+                VoiceServiceSubElement.objects.filter(pk__in = type_ids).update(_subclass_type = subclass_type)
+            total += len(ids)
+        self.stdout.write(self.style.SUCCESS('Stored the subclass type of %s elements' % total))
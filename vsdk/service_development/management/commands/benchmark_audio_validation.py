@@ -0,0 +1,61 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models.fields.files import FieldFile
+
+from ...models import VoiceFragment
+from ...models.validators import audio_file_format_cache
+from ...models.validators import validate_audio_file_format, validate_audio_file_format_mediainfo
+
+
+class Command(BaseCommand):
+    help = 'Compares the in-process wave header validator with the mediainfo based validator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs = '?', default = None,
+                help = 'Directory with .wav files (default: MEDIA_ROOT)')
+        parser.add_argument('--repeat', type = int, default = 3,
+                help = 'Number of times every file is validated')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.MEDIA_ROOT
+        field = VoiceFragment._meta.get_field('audio')
+        files = []
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith('.wav'):
+                audio = FieldFile(None, field, os.path.relpath(os.path.join(directory, name), settings.MEDIA_ROOT))
+                files.append(audio)
+        if not files:
+            self.stdout.write(self.style.WARNING('No .wav files in %s' % directory))
+            return
+
+        def run(validator, clear_cache = False):
+            results = []
+            start = time.perf_counter()
+            for i in range(options['repeat']):
+                if clear_cache:
+                    audio_file_format_cache.invalidate()
+                results = [validator(audio) for audio in files]
+            elapsed = time.perf_counter() - start
+            return results, elapsed * 1000 / (len(files) * options['repeat'])
+
+        self.stdout.write('%s files, validated %s times' % (len(files), options['repeat']))
+        header_results, header_time = run(validate_audio_file_format, clear_cache = True)
+        self.stdout.write('wave header: %.3f ms per file, %s valid' % (header_time, sum(header_results)))
+        cached_results, cached_time = run(validate_audio_file_format)
+        self.stdout.write('wave header (cached): %.3f ms per file, %s valid' % (cached_time, sum(cached_results)))
+
+        if shutil.which('mediainfo') is None:
+            self.stdout.write(self.style.WARNING('mediainfo is not installed, skipping the mediainfo validator'))
+            return
+        mediainfo_results, mediainfo_time = run(validate_audio_file_format_mediainfo)
+        self.stdout.write('mediainfo: %.3f ms per file, %s valid' % (mediainfo_time, sum(mediainfo_results)))
+        differences = [audio.name for audio, header, mediainfo in zip(files, header_results, mediainfo_results)
+                if header != mediainfo]
+        for name in differences:
+            self.stdout.write(self.style.ERROR('Validators disagree on %s' % name))
+        if not differences:
+            self.stdout.write(self.style.SUCCESS('Validators agree on all files (%.0fx faster)' % (mediainfo_time / header_time)))
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from ...models import VoiceService
+from ...replay import CallFlowReplay
+from ._fixtures import fixture_database
+
+DEFAULT_FIXTURES = ['final_version.json', 'retrieve_reports.json', 'vacarpa_port_db.json']
+
+
+class Command(BaseCommand):
+    help = ('Replays every path through the voice services in fixtures like a VoiceXML browser, and reports '
+            'the latency and SQL queries per hop. Optionally compares the queries with a baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs = '*', default = DEFAULT_FIXTURES,
+                help = 'Fixtures to load, each into a new test database (default: %s)' % ', '.join(DEFAULT_FIXTURES))
+        parser.add_argument('--service', type = int, action = 'append', dest = 'service_ids',
+                help = 'Only replay the Voice Service with this id (can be repeated)')
+        parser.add_argument('--max-paths', type = int, default = 200,
+                help = 'Maximum number of paths (calls) to replay per service')
+        parser.add_argument('--baseline', default = None,
+                help = 'JSON file with the maximum number of queries per kind of hop')
+        parser.add_argument('--save-baseline', action = 'store_true',
+                help = 'Write the query counts of this run to the baseline file')
+        parser.add_argument('--tolerance', type = int, default = 0,
+                help = 'Number of queries a hop may exceed the baseline by')
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline requires --baseline')
+
+        queries = {}
+        # Fixtures that could not be loaded, failed paths and hops with errors
+        failures = []
+        media_root = tempfile.mkdtemp()
+        try:
+            # Recordings are written to a temporary MEDIA_ROOT
+            with override_settings(MEDIA_ROOT = media_root):
+                for fixture in options['fixtures']:
+                    try:
+                        with fixture_database(fixture):
+                            queries.update(self.replay_fixture(fixture, options, failures))
+                    except CommandError as error:
+                        self.stdout.write(self.style.ERROR(str(error)))
+                        failures.append(str(error))
+        finally:
+            shutil.rmtree(media_root, ignore_errors = True)
+
+        if options['baseline'] is None:
+            return
+        if failures:
+            # The query counts are incomplete, or include failed requests
+            raise CommandError('Replaying failed: %s' % '; '.join(failures))
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(queries, baseline_file, indent = 2, sort_keys = True)
+            self.stdout.write(self.style.SUCCESS('Baseline written to %s' % options['baseline']))
+        else:
+            self.check_baseline(queries, options)
+
+    def replay_fixture(self, fixture, options, failures):
+        """
+        Replays the services in the currently loaded fixture. Returns a dict
+        mapping "fixture service kind" to the maximum number of queries, and
+        adds failed paths and hops with errors to failures.
+        """
+        queries = {}
+        services = VoiceService.objects.order_by('pk')
+        if options['service_ids']:
+            services = services.filter(pk__in = options['service_ids'])
+        for service in services:
+            self.stdout.write('%s, %s' % (os.path.basename(fixture), service))
+            if not service._start_element_id:
+                self.stdout.write(self.style.WARNING('  Skipped, no starting element'))
+                continue
+            replay = CallFlowReplay(service, max_paths = options['max_paths'])
+            replay.run()
+            self.stdout.write('  %s paths, %s hops, %s failed paths' % (replay.paths, len(replay.hops), replay.failed_paths))
+            if replay.failed_paths:
+                failures.append('%s service %s: %s failed paths' % (os.path.basename(fixture), service.pk,
+                        replay.failed_paths))
+            self.stdout.write('  %-34s %6s %6s %8s %8s %8s %8s %8s' % (
+                    'hop', 'count', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'max'))
+            for kind, statistics in sorted(replay.statistics().items()):
+                summary = statistics.summary()
+                self.stdout.write('  %-34s %6d %6d %8.1f %8.1f %8.1f %8d %8d' % (kind,
+                        summary['count'], summary['errors'], summary['p50'], summary['p90'], summary['p99'],
+                        summary['queries_median'], summary['queries_max']))
+                queries['%s %s %s' % (os.path.basename(fixture), service.pk, kind)] = summary['queries_max']
+                if summary['errors']:
+                    failures.append('%s service %s: %s errors in %s' % (os.path.basename(fixture), service.pk,
+                            summary['errors'], kind))
+        return queries
+
+    def check_baseline(self, queries, options):
+        try:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as error:
+            raise CommandError('Could not read the baseline: %s' % error)
+
+        regressions = []
+        for key, count in sorted(queries.items()):
+            if key not in baseline:
+                self.stdout.write(self.style.WARNING('Not in the baseline: %s (%s queries)' % (key, count)))
+            elif count > baseline[key] + options['tolerance']:
+                regressions.append('%s: %s queries, baseline %s' % (key, count, baseline[key]))
+        # Kinds of hops of the replayed fixtures and services that were not reached
+        fixtures = set(os.path.basename(fixture) for fixture in options['fixtures'])
+        for key in sorted(set(baseline) - set(queries)):
+            fixture, service_id, kind = key.split(' ', 2)
+            if fixture in fixtures and (not options['service_ids'] or int(service_id) in options['service_ids']):
+                regressions.append('%s: not replayed' % key)
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError('%s kinds of hops need more queries than the baseline, or were not replayed'
+                    % len(regressions))
+        self.stdout.write(self.style.SUCCESS('No query count regressions'))
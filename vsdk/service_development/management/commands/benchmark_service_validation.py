@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import ugettext
+
+from ...models import VoiceService, VoiceServiceSubElement
+from ...validation import get_service_validation, validate_service, service_validation_cache
+from ._fixtures import fixture_database
+
+
+def validate_per_element(service):
+    """Validates service element by element, like VoiceService.validator() used to"""
+    errors = []
+    if not service._start_element:
+        errors.append(ugettext('No starting element'))
+    else:
+        for element in VoiceServiceSubElement.objects.filter(service = service).select_subclasses():
+            errors.extend(element.validator())
+    if len(service.supported_languages.all()) == 0:
+        errors.append(ugettext('No supported languages'))
+    return set(errors)
+
+
+class Command(BaseCommand):
+    help = 'Compares the queries and time of validating voice services per element, in bulk and cached'
+
+    def add_arguments(self, parser):
+        parser.add_argument('service_ids', nargs = '*', type = int,
+                help = 'Voice Services to validate (default: all)')
+        parser.add_argument('--fixture', default = None,
+                help = 'Load this fixture (e.g. vacarpa_port_db.json) into a test database first')
+        parser.add_argument('--repeat', type = int, default = 10,
+                help = 'Number of times every service is validated')
+
+    def handle(self, *args, **options):
+        if options['fixture'] is None:
+            self.benchmark(options)
+            return
+        with fixture_database(options['fixture']):
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        services = VoiceService.objects.order_by('pk')
+        if options['service_ids']:
+            services = services.filter(pk__in = options['service_ids'])
+
+        def run(validator, service):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for i in range(options['repeat']):
+                    result = validator(service)
+                elapsed = time.perf_counter() - start
+            return result, len(queries) // options['repeat'], elapsed * 1000 / options['repeat']
+
+        def uncached(service):
+            return validate_service(VoiceService.objects.get(pk = service.pk)).errors
+
+        def cached(service):
+            return get_service_validation(service.pk).errors
+
+        for service in services:
+            elements = VoiceServiceSubElement.objects.filter(service = service).count()
+            self.stdout.write('%s (%s elements)' % (service, elements))
+            legacy_errors, legacy_queries, legacy_time = run(validate_per_element, service)
+            self.stdout.write('  per element: %s queries, %.1f ms' % (legacy_queries, legacy_time))
+            bulk_errors, bulk_queries, bulk_time = run(uncached, service)
+            self.stdout.write('  bulk:        %s queries, %.1f ms' % (bulk_queries, bulk_time))
+            service_validation_cache.invalidate(service.pk)
+            get_service_validation(service.pk)
+            cached_errors, cached_queries, cached_time = run(cached, service)
+            self.stdout.write('  cached:      %s queries, %.1f ms' % (cached_queries, cached_time))
+
+            if set(bulk_errors) != legacy_errors or cached_errors != bulk_errors:
+                self.stdout.write(self.style.ERROR('  Validators disagree: %s' % sorted(legacy_errors ^ set(bulk_errors))))
+            else:
+                self.stdout.write(self.style.SUCCESS('  %s errors, same result' % len(bulk_errors)))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ...retention import compact_expired_history
+
+
+class Command(BaseCommand):
+    help = 'Compacts the steps and choices of call sessions older than the retention period into archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service', type = int, action = 'append', default = None,
+                help = 'Only sessions of the Voice Service with this id (can be repeated)')
+        parser.add_argument('--days', type = int, default = None,
+                help = 'Compact sessions older than this number of days, instead of the retention period of their service')
+        parser.add_argument('--batch-size', type = int, default = None,
+                help = 'Number of sessions compacted per transaction')
+        parser.add_argument('--pause', type = float, default = None,
+                help = 'Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        result = compact_expired_history(options['service'], options['days'], options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS('Compacted %s call sessions: %s steps, %s choices' % result))
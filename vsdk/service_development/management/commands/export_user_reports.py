@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...export import FORMATS, ReportExport, format_cursor, parse_cursor
+from ...models import UserReport
+
+
+class Command(BaseCommand):
+    help = 'Exports user reports with their choices (and recordings) as CSV or NDJSON, optionally in a ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices = FORMATS, default = 'csv',
+                help = 'Format of the rows')
+        parser.add_argument('--zip', action = 'store_true',
+                help = 'Write a ZIP archive with the rows and the audio of the recordings')
+        parser.add_argument('--output', default = None,
+                help = 'File to write to (default: standard output)')
+        parser.add_argument('--since', default = None,
+                help = 'Only reports after this time (ISO 8601), or the cursor of a previous export')
+        parser.add_argument('--service', type = int, default = None,
+                help = 'Only reports of the Voice Service with this id')
+        parser.add_argument('--report', type = int, default = None,
+                help = 'Only reports of the Report element with this id')
+        parser.add_argument('--chunk-size', type = int, default = None,
+                help = 'Number of reports read per query')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_cursor(options['since'])
+            except ValueError as error:
+                raise CommandError(str(error))
+        reports = UserReport.objects.all()
+        if options['service'] is not None:
+            reports = reports.filter(session__service_id = options['service'])
+        if options['report'] is not None:
+            reports = reports.filter(report_element_id = options['report'])
+        export = ReportExport(reports, options['format'], since, options['chunk_size'])
+
+        if options['zip']:
+            if options['output'] is None:
+                raise CommandError('A ZIP archive is only written to a file, use --output')
+            with open(options['output'], 'wb') as output:
+                for chunk in export.zip_chunks():
+                    output.write(chunk)
+        elif options['output'] is None:
+            for line in export.lines():
+                self.stdout.write(line, ending = '')
+        else:
+            with open(options['output'], 'w', encoding = 'utf-8', newline = '') as output:
+                for line in export.lines():
+                    output.write(line)
+
+        if export.cursor is not None:
+            # On standard error, standard output might hold the export
+            self.stderr.write('Exported up to %s, resume with --since %s' % (export.cursor[0].isoformat(),
+                    format_cursor(export.cursor)))
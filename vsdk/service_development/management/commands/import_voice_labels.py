@@ -0,0 +1,36 @@
+import csv
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...voice_label_import import ImportResult, import_voice_labels
+
+
+class Command(BaseCommand):
+    help = 'Imports Voice Labels from a ZIP archive or directory of <label>/<language code>.wav files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help = 'ZIP archive or directory to import')
+        parser.add_argument('--workers', type = int, default = None,
+                help = 'Number of processes that validate and convert the audio files')
+        parser.add_argument('--report', default = None,
+                help = 'Write the result per file to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            results = import_voice_labels(options['path'], options['workers'])
+        except (OSError, zipfile.BadZipFile) as error:
+            raise CommandError('Could not import %s: %s' % (options['path'], error))
+
+        for result in results:
+            self.stdout.write('%s: %s%s' % (result.path, result.status, ' (%s)' % result.message if result.message else ''))
+        if options['report']:
+            with open(options['report'], 'w', newline = '') as report:
+                writer = csv.writer(report)
+                writer.writerow(ImportResult._fields)
+                writer.writerows(results)
+
+        counts = dict((status, len([result for result in results if result.status == status]))
+                for status in ('created', 'updated', 'skipped', 'failed'))
+        self.stdout.write(self.style.SUCCESS(
+                'Created %(created)s, updated %(updated)s, skipped %(skipped)s, failed %(failed)s voice fragments' % counts))
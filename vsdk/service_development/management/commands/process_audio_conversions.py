@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ...audio_conversion import process_pending_conversions
+from ...models import VoiceFragment
+
+
+class Command(BaseCommand):
+    help = 'Converts the audio of Voice Fragments that are pending conversion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type = int, default = None,
+                help = 'Maximum number of fragments to convert')
+        parser.add_argument('--requeue-stale', action = 'store_true',
+                help = 'Also convert fragments that were being converted by a worker that stopped')
+        parser.add_argument('--retry-failed', action = 'store_true',
+                help = 'Also retry fragments of which the conversion failed')
+
+    def handle(self, *args, **options):
+        requeue = []
+        if options['requeue_stale']:
+            requeue.append(VoiceFragment.CONVERSION_CONVERTING)
+        if options['retry_failed']:
+            requeue.append(VoiceFragment.CONVERSION_FAILED)
+        if requeue:
+            VoiceFragment.objects.filter(conversion_status__in = requeue).update(
+                    conversion_status = VoiceFragment.CONVERSION_PENDING)
+        processed = process_pending_conversions(options['limit'])
+        failed = VoiceFragment.objects.filter(conversion_status = VoiceFragment.CONVERSION_FAILED).count()
+        self.stdout.write(self.style.SUCCESS('Processed %s Voice Fragments, %s failed conversions' % (processed, failed)))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import CallSessionChoice, ReportAttribute, UserReport
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the report attributes (used by Retrieve Reports elements) from the choices of all user reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 500,
+                help = 'Number of user reports to process per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        with transaction.atomic():
+            ReportAttribute.objects.all().delete()
+            last_id = 0
+            while True:
+                user_reports = list(UserReport.objects.filter(pk__gt = last_id).order_by('pk')[:batch_size])
+                if not user_reports:
+                    break
+                last_id = user_reports[-1].pk
+                choices = {}
+                for choice in CallSessionChoice.objects.filter(report__in = user_reports).order_by('pk'):
+                    choices.setdefault(choice.report_id, []).append(choice)
+                attributes = []
+                for user_report in user_reports:
+                    attributes.extend(ReportAttribute.for_choices(user_report, choices.get(user_report.pk, [])))
+                ReportAttribute.objects.bulk_create(attributes)
+                total += len(attributes)
+        self.stdout.write(self.style.SUCCESS('Stored %s report attributes' % total))
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.utils import timezone
+
+from ...call_trace import flush_call_traces
+from ...models import CallTrace
+
+ORDERINGS = {
+    'server': '-server_time',
+    'db': '-db_time',
+    'queries': '-queries',
+    'per-request': '-server_time_per_request',
+}
+
+
+class Command(BaseCommand):
+    help = 'Lists the traced calls with the highest server-side overhead'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type = int, default = 20,
+                help = 'Number of calls to list')
+        parser.add_argument('--days', type = int, default = None,
+                help = 'Only calls of the last number of days')
+        parser.add_argument('--service', type = int, default = None,
+                help = 'Only calls of the Voice Service with this id')
+        parser.add_argument('--order', choices = sorted(ORDERINGS), default = 'server',
+                help = 'Order by total server time, database time, queries or server time per request')
+
+    def handle(self, *args, **options):
+        flush_call_traces()
+        traces = CallTrace.objects.select_related('session', 'session__user', 'session__service').annotate(
+                server_time_per_request = ExpressionWrapper(F('server_time') / F('hop_count'), output_field = FloatField()))
+        if options['days'] is not None:
+            traces = traces.filter(start__gte = timezone.now() - timedelta(days = options['days']))
+        if options['service'] is not None:
+            traces = traces.filter(session__service_id = options['service'])
+        traces = traces.order_by(ORDERINGS[options['order']])[:options['limit']]
+
+        self.stdout.write('%8s  %-40s %5s %10s %10s %8s %10s %7s' % ('session', 'call', 'hops', 'server ms',
+                'db ms', 'queries', 'gap ms', 'server'))
+        for trace in traces:
+            total = trace.server_time + trace.gap_time
+            self.stdout.write('%8s  %-40s %5d %10.1f %10.1f %8d %10.0f %6.1f%%' % (trace.session_id,
+                    str(trace.session)[:40], trace.hop_count, trace.server_time, trace.db_time, trace.queries,
+                    trace.gap_time, 100.0 * trace.server_time / total if total else 0))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...analytics import rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Adds the call sessions that finished since the last run to the call statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action = 'store_true',
+                help = 'Delete the statistics and add all call sessions again')
+        parser.add_argument('--service', type = int, action = 'append', default = None,
+                help = 'Only rebuild the statistics of the Voice Service with this id (can be repeated)')
+        parser.add_argument('--chunk-size', type = int, default = None,
+                help = 'Number of call sessions added per transaction')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            added = rebuild_rollups(options['service'], options['chunk_size'])
+        else:
+            added = update_rollups(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Added %s call sessions to the statistics' % added))
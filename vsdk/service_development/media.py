@@ -0,0 +1,65 @@
+"""
+Content hashes of media files, used to version their URLs and as ETags
+when serving them (see views/media.py).
+
+A versioned URL changes whenever the content of the file changes, so the
+VoiceXML browser can cache audio for a long time, and still fetches a new
+version as soon as it is uploaded.
+"""
+import hashlib
+import os
+
+from .cache import ProcessCache
+
+# Content hashes of media files, per (path, size, modification time)
+media_file_hash_cache = ProcessCache('media file hashes')
+
+VERSION_LENGTH = 12
+
+
+def file_hash(path):
+    """
+    Returns the SHA-1 hex digest of the file at path, or None if it does not
+    exist. Hashes are cached until the size or modification time of the
+    file changes.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    def compute():
+        digest = hashlib.sha1()
+        with open(path, 'rb') as media_file:
+            for chunk in iter(lambda: media_file.read(64 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    return media_file_hash_cache.get((path, stat.st_size, stat.st_mtime_ns), compute)
+
+
+def media_file_version(field_file):
+    """
+    Returns the version of the file in field_file (a FieldFile), or None if
+    it is not stored on the local file system.
+    """
+    if not field_file:
+        return None
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        return None
+    digest = file_hash(path)
+    return digest[:VERSION_LENGTH] if digest else None
+
+
+def versioned_media_url(field_file):
+    """
+    Returns the URL of the file in field_file, with its version appended
+    when it is known.
+    """
+    url = field_file.url
+    version = media_file_version(field_file)
+    if version is None:
+        return url
+    return '%s%sv=%s' % (url, '&' if '?' in url else '?', version)
@@ -0,0 +1,177 @@
+"""
+Metrics of the VoiceXML requests served by this worker process.
+
+The VxmlMetricsMiddleware (see middleware.py) records the wall time,
+database time, number of queries and response size of every request to
+the VoiceXML views, labeled by URL name and Voice Service. Every thread
+records into its own histograms, so recording does not take a lock; the
+histograms of all threads are only added up when the metrics are
+collected by the metrics view, in the Prometheus text format.
+
+Metrics are per worker process: every process serves its own metrics.
+"""
+import bisect
+import threading
+
+from .cache import ProcessCache
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram(object):
+    """
+    Counts of observations per bucket, and their sum. Not thread-safe.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def add(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative_counts(self):
+        """
+        Returns (upper bound, number of observations <= upper bound) pairs,
+        ending with '+Inf'.
+        """
+        total = 0
+        counts = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+
+class RequestMetrics(object):
+    """The metrics of the requests with the same labels"""
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_size = 0
+
+    def observe(self, duration, db_duration, queries, response_size):
+        self.duration.observe(duration)
+        self.db_duration.observe(db_duration)
+        self.queries.observe(queries)
+        self.response_size += response_size
+
+    def add(self, other):
+        self.duration.add(other.duration)
+        self.db_duration.add(other.db_duration)
+        self.queries.add(other.queries)
+        self.response_size += other.response_size
+
+
+class MetricsRegistry(object):
+    """
+    RequestMetrics per (URL name, Voice Service id), kept per thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stores = []
+        self._stores_lock = threading.Lock()
+
+    def _store(self):
+        store = getattr(self._local, 'store', None)
+        if store is None:
+            # Only once per thread
+            store = self._local.store = {}
+            with self._stores_lock:
+                self._stores.append(store)
+        return store
+
+    def observe(self, view_name, service_id, duration, db_duration, queries, response_size):
+        store = self._store()
+        key = (view_name, service_id)
+        metrics = store.get(key)
+        if metrics is None:
+            metrics = store[key] = RequestMetrics()
+        metrics.observe(duration, db_duration, queries, response_size)
+
+    def collect(self):
+        """
+        Returns a dict mapping (URL name, Voice Service id) to the
+        RequestMetrics of all threads.
+        """
+        with self._stores_lock:
+            stores = list(self._stores)
+        collected = {}
+        for store in stores:
+            for key, metrics in list(store.items()):
+                collected.setdefault(key, RequestMetrics()).add(metrics)
+        return collected
+
+    def reset(self):
+        with self._stores_lock:
+            for store in self._stores:
+                store.clear()
+
+
+registry = MetricsRegistry()
+
+
+def format_labels(labels):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for name, value in labels)
+
+
+def histogram_lines(name, labels, histogram):
+    lines = []
+    for bound, count in histogram.cumulative_counts():
+        lines.append('%s_bucket{%s} %s' % (name, format_labels(labels + [('le', bound)]), count))
+    lines.append('%s_sum{%s} %s' % (name, format_labels(labels), histogram.sum))
+    lines.append('%s_count{%s} %s' % (name, format_labels(labels), histogram.count))
+    return lines
+
+
+def prometheus_text(metrics_registry = registry):
+    """
+    Returns the metrics in the Prometheus text exposition format.
+    """
+    collected = sorted(metrics_registry.collect().items(), key = lambda item: (item[0][0], str(item[0][1])))
+    histograms = (
+            ('vxml_request_duration_seconds', 'Wall time of VoiceXML requests', 'duration'),
+            ('vxml_request_db_duration_seconds', 'Time spent in database queries per VoiceXML request', 'db_duration'),
+            ('vxml_request_queries', 'Database queries per VoiceXML request', 'queries'))
+    lines = []
+    for name, description, attribute in histograms:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s histogram' % name)
+        for (view_name, service_id), metrics in collected:
+            labels = [('view', view_name), ('service', '' if service_id is None else service_id)]
+            lines.extend(histogram_lines(name, labels, getattr(metrics, attribute)))
+
+    lines.append('# HELP vxml_response_size_bytes_total Size of the responses to VoiceXML requests')
+    lines.append('# TYPE vxml_response_size_bytes_total counter')
+    for (view_name, service_id), metrics in collected:
+        labels = [('view', view_name), ('service', '' if service_id is None else service_id)]
+        lines.append('vxml_response_size_bytes_total{%s} %s' % (format_labels(labels), metrics.response_size))
+
+    caches = [cache.stats() for cache in ProcessCache.all()]
+    for name, description in (('hits', 'Hits'), ('misses', 'Misses')):
+        lines.append('# HELP vxml_cache_%s_total %s of the process-wide caches' % (name, description))
+        lines.append('# TYPE vxml_cache_%s_total counter' % name)
+        for stats in caches:
+            lines.append('vxml_cache_%s_total{%s} %s' % (name, format_labels([('cache', stats['name'])]), stats[name]))
+    lines.append('# HELP vxml_cache_entries Entries in the process-wide caches')
+    lines.append('# TYPE vxml_cache_entries gauge')
+    for stats in caches:
+        lines.append('vxml_cache_entries{%s} %s' % (format_labels([('cache', stats['name'])]), stats['size']))
+    return '\n'.join(lines) + '\n'
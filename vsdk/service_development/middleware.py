@@ -0,0 +1,140 @@
+import functools
+import logging
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+from .call_trace import call_trace_buffer, tracing_enabled
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Namespace of the VoiceXML URLconf
+VXML_NAMESPACE = 'service-development'
+
+
+@functools.lru_cache(maxsize = 4096)
+def _session_service_id(session_id):
+    from .models import CallSession
+    service_id = CallSession.objects.filter(pk = session_id).values_list('service_id', flat = True).first()
+    if service_id is None:
+        # Not cached, the session might not be visible yet
+        raise LookupError(session_id)
+    return service_id
+
+
+def session_service_id(session_id):
+    """
+    Returns the id of the Voice Service of the CallSession with session_id,
+    which never changes, or None if it is not known (yet).
+    """
+    try:
+        return _session_service_id(session_id)
+    except LookupError:
+        return None
+
+
+class QueryTimer(object):
+    """
+    Database execute wrapper that counts queries and their duration, and
+    keeps their SQL when keep_sql is set.
+    """
+
+    def __init__(self, keep_sql = False):
+        self.keep_sql = keep_sql
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.keep_sql:
+                self.queries.append((duration, sql, params))
+
+
+class VxmlMetricsMiddleware(object):
+    """
+    Records the wall time, database time, number of queries and response
+    size of requests to the VoiceXML views (see metrics.py); other requests
+    (e.g. of the admin) are passed on untouched. With
+    CALL_TRACING enabled adds them to the trace of their call (see
+    call_trace.py). With VXML_SLOW_REQUEST_SECONDS set, requests that take
+    longer are logged with their SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics_enabled = getattr(settings, 'VXML_METRICS', True)
+        if not metrics_enabled and not tracing_enabled():
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        if match.namespace != VXML_NAMESPACE or match.url_name == 'metrics':
+            return self.get_response(request)
+
+        slow_request_seconds = getattr(settings, 'VXML_SLOW_REQUEST_SECONDS', None)
+        timer = QueryTimer(keep_sql = slow_request_seconds is not None)
+        wall_clock_start = time.time()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        if metrics_enabled:
+            registry.observe(match.view_name, self.service_id(match.kwargs), duration, timer.duration, timer.count,
+                    self.response_size(response))
+        if tracing_enabled():
+            session_id = self.session_id(match.kwargs, response)
+            if session_id is not None:
+                call_trace_buffer.add(session_id, wall_clock_start, duration * 1000, timer.duration * 1000,
+                        timer.count, match.url_name, response.status_code)
+        if slow_request_seconds is not None and duration >= slow_request_seconds:
+            self.log_slow_request(request, duration, timer)
+        return response
+
+    def service_id(self, kwargs):
+        if 'voice_service_id' in kwargs:
+            return int(kwargs['voice_service_id'])
+        if 'session_id' in kwargs:
+            return session_service_id(int(kwargs['session_id']))
+        return None
+
+    def session_id(self, kwargs, response):
+        """
+        Returns the id of the CallSession of a request. The session is created
+        by the start of the voice service, which redirects to a URL with it.
+        """
+        if 'session_id' in kwargs:
+            return int(kwargs['session_id'])
+        if response.status_code in (301, 302, 303) and response.has_header('Location'):
+            try:
+                redirect_kwargs = resolve(urlsplit(response['Location']).path).kwargs
+            except Resolver404:
+                return None
+            if 'session_id' in redirect_kwargs:
+                return int(redirect_kwargs['session_id'])
+        return None
+
+    def response_size(self, response):
+        if response.streaming:
+            return 0
+        return len(response.content)
+
+    def log_slow_request(self, request, duration, timer):
+        queries = '\n'.join('  %.1f ms: %s; %r' % (query_duration * 1000, sql, params)
+                for query_duration, sql, params in timer.queries)
+        logger.warning('Slow request %s %s: %.1f ms, %s queries in %.1f ms\n%s', request.method, request.get_full_path(),
+                duration * 1000, timer.count, timer.duration * 1000, queries)
@@ -8,3 +8,5 @@ from .vse_message import *
 from .vse_record import *
 from .user_input import *
 from .vse_report import *
+from .analytics import *
+from .content_version import *
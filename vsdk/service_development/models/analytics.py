@@ -0,0 +1,95 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from .voiceservice import VoiceService
+from .vs_element import VoiceServiceElement
+from .vse_choice import ChoiceOption
+
+
+ROLLUP_PERIOD_CHOICES = [('hour', _('Hour')), ('day', _('Day'))]
+
+
+class CallRollup(models.Model):
+    """
+    Number of calls, their duration and the reports submitted during them,
+    per Voice Service and hour or day in which the calls started. Maintained
+    incrementally from the CallSessions (see analytics.py).
+    """
+    service = models.ForeignKey(VoiceService, on_delete = models.CASCADE, related_name = '+')
+    period = models.CharField(_('Period'), max_length = 4, choices = ROLLUP_PERIOD_CHOICES)
+    start = models.DateTimeField(_('Start of the period'))
+    calls = models.PositiveIntegerField(_('Calls'), default = 0)
+    # Calls of which the end is known, and their summed duration in seconds
+    timed_calls = models.PositiveIntegerField(default = 0)
+    duration = models.FloatField(default = 0)
+    reports = models.PositiveIntegerField(_('Reports submitted'), default = 0)
+
+    class Meta:
+        verbose_name = _('Call Statistics')
+        verbose_name_plural = _('Call Statistics')
+        unique_together = [('service', 'period', 'start')]
+
+    def __str__(self):
+        return "%s %s %s: %s calls" % (self.service_id, self.period, self.start, self.calls)
+
+    @property
+    def mean_duration(self):
+        """Mean duration of the calls in seconds, or None"""
+        if not self.timed_calls:
+            return None
+        return self.duration / self.timed_calls
+
+
+class ElementRollup(models.Model):
+    """
+    Number of visits of a Voice Service Element, and of calls that ended
+    there, per hour or day in which the calls started.
+    """
+    service = models.ForeignKey(VoiceService, on_delete = models.CASCADE, related_name = '+')
+    period = models.CharField(_('Period'), max_length = 4, choices = ROLLUP_PERIOD_CHOICES)
+    start = models.DateTimeField(_('Start of the period'))
+    element = models.ForeignKey(VoiceServiceElement, on_delete = models.CASCADE, related_name = '+',
+            verbose_name = _('Element'))
+    visits = models.PositiveIntegerField(_('Visits'), default = 0)
+    exits = models.PositiveIntegerField(_('Calls ended here'), default = 0)
+
+    class Meta:
+        verbose_name = _('Element Statistics')
+        verbose_name_plural = _('Element Statistics')
+        unique_together = [('service', 'period', 'start', 'element')]
+
+    def __str__(self):
+        return "%s %s %s: %s visits" % (self.element_id, self.period, self.start, self.visits)
+
+
+class ChoiceOptionRollup(models.Model):
+    """
+    Number of times a Choice Option was selected, per hour or day in which
+    the calls started.
+    """
+    service = models.ForeignKey(VoiceService, on_delete = models.CASCADE, related_name = '+')
+    period = models.CharField(_('Period'), max_length = 4, choices = ROLLUP_PERIOD_CHOICES)
+    start = models.DateTimeField(_('Start of the period'))
+    choice_option = models.ForeignKey(ChoiceOption, on_delete = models.CASCADE, related_name = '+',
+            verbose_name = _('Choice option'))
+    selections = models.PositiveIntegerField(_('Selections'), default = 0)
+
+    class Meta:
+        verbose_name = _('Choice Option Statistics')
+        verbose_name_plural = _('Choice Option Statistics')
+        unique_together = [('service', 'period', 'start', 'choice_option')]
+
+    def __str__(self):
+        return "%s %s %s: %s selections" % (self.choice_option_id, self.period, self.start, self.selections)
+
+
+class RollupWatermark(models.Model):
+    """
+    The id of the last CallSession that has been added to the rollups.
+    """
+    name = models.CharField(max_length = 50, primary_key = True)
+    session_id = models.PositiveIntegerField(default = 0)
+    updated = models.DateTimeField(auto_now = True)
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.session_id)
@@ -0,0 +1,36 @@
+from django.db import models
+from django.db.models import F
+from django.utils.translation import ugettext_lazy as _
+
+
+class ContentVersion(models.Model):
+    """
+    A counter that is increased whenever data of which worker processes keep
+    copies in their caches changes. Signals only reach the process that made
+    the change, the other processes compare the counter with the version of
+    their cached copy.
+    """
+    # Voice Labels, Voice Fragments, Languages, report contents and filters,
+    # and the supported languages of services
+    VOICE_CONTENT = 'voice content'
+
+    name = models.CharField(max_length = 50, primary_key = True)
+    version = models.PositiveIntegerField(default = 0)
+
+    class Meta:
+        verbose_name = _('Content version')
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.version)
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Increases the version of name, in the current transaction.
+        """
+        if not cls.objects.filter(name = name).update(version = F('version') + 1):
+            cls.objects.get_or_create(name = name, defaults = {'version': 1})
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name = name).values_list('version', flat = True).first() or 0
@@ -7,11 +7,13 @@ from django.utils.translation import ugettext_lazy as _
 
 from . import KasaDakaUser
 from . import VoiceService, VoiceServiceElement
+from .voiceservice import get_supported_languages
 from . import Language
 
 from .vse_choice import Choice
 from .vse_choice import ChoiceOption
 from .user_input import UserReport
+from ..call_log import call_log_buffer, flush_call_log, write_behind_enabled
 
 
 class CallSession(models.Model):
@@ -43,33 +45,72 @@ class CallSession(models.Model):
         for the session.
         Returns a determined to be valid Language for the Session.
         Returns None if the language cannot be determined.
+
+        The result is remembered on this instance, and the session is only
+        saved when the determined language differs from the stored one.
         """
-        if self.service:
-            if self.service.supports_single_language:
-                self._language = self.service.supported_languages.all()[0]
-            elif self.user and self.user.language in self.service.supported_languages.all():
-                    self._language = self.user.language
-            elif self._language and not self._language in self.service.supported_languages.all():
-                    self._language = None
-        else:
-            self._language = None
+        resolved = getattr(self, '_resolved_language', None)
+        if resolved is not None and resolved[0] == self._language_resolution_key():
+            return resolved[1]
 
-        self.save()
-        return self._language
+        language = self._determine_language()
+        language_id = language.pk if language else None
+        if language_id != self._language_id:
+            self._language = language
+            if self.pk is not None:
+                self.save(update_fields = ['_language'])
+        self._resolved_language = (self._language_resolution_key(), language)
+        return language
+
+    def _language_resolution_key(self):
+        return (self.service_id, self.user_id, self._language_id)
+
+    def _determine_language(self):
+        if not self.service_id:
+            return None
+        supported_languages = dict((language.pk, language) for language in get_supported_languages(self.service_id))
+        if len(supported_languages) == 1:
+            return list(supported_languages.values())[0]
+        elif self.user and self.user.language_id in supported_languages:
+            return supported_languages[self.user.language_id]
+        # The language that was already set for this session, if it is supported
+        return supported_languages.get(self._language_id)
 
     def record_step(self, element = None, description = None):
         step = CallSessionStep(session = self, _visited_element = element, description = description)
         self.end = timezone.now()
-        self.save()
-        step.save()
+        if write_behind_enabled():
+            call_log_buffer.add_step(step)
+        else:
+            self.save()
+            step.save()
         return
 
     def record_choice(self, choice_element=None, choice_option_selected=None):
-        CallSessionChoice(
+        choice = CallSessionChoice(
             session=self,
             choice_element=choice_element,
             choice_option_selected=choice_option_selected
-        ).save()
+        )
+        if write_behind_enabled():
+            call_log_buffer.add_choice(choice)
+        else:
+            choice.save()
+
+    def iteration_start_time(self, start_element_id = None):
+        """
+        Returns the last time the starting element of the voice service has been
+        visited in this session. Input entered before this time belongs to an earlier
+        iteration through the voice service (when the user is able to restart the
+        service instead of terminating the call at some point).
+        """
+        if start_element_id is None:
+            start_element_id = self.service._start_element_id
+        flush_call_log()
+        return CallSessionStep.objects.filter(
+            session=self,
+            _visited_element=start_element_id
+        ).latest('time').time
 
     def link_to_user(self, user):
         self.user = user
@@ -78,7 +119,8 @@ class CallSession(models.Model):
 
 
 class CallSessionStep(models.Model):
-    time = models.DateTimeField(_('Time'),auto_now_add = True)
+    # Not auto_now_add, the time of a step is preserved when it is written behind
+    time = models.DateTimeField(_('Time'), default = timezone.now, editable = False)
     session = models.ForeignKey(CallSession, on_delete = models.CASCADE, related_name = "steps")
     _visited_element = models.ForeignKey(VoiceServiceElement, on_delete = models.SET_NULL, null = True)
     description = models.CharField(_('Description'),max_length = 1000,blank = True, null = True)
@@ -104,9 +146,24 @@ class CallSessionStep(models.Model):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._visited_element:
-            return VoiceServiceElement.objects.get_subclass(id = self._visited_element.id)
-        else: return None
+        if self._visited_element_id is None:
+            return None
+        element = getattr(self, '_visited_subclass', None)
+        if element is None or element.pk != self._visited_element_id:
+            element = self._visited_subclass = VoiceServiceElement.objects.get_subclass_by_id(self._visited_element_id)
+        return element
+
+    @staticmethod
+    def prefetch_visited_elements(steps):
+        """
+        Resolves the visited elements of steps to their subclasses in bulk,
+        so visited_element does not query per step.
+        """
+        elements = VoiceServiceElement.objects.subclasses_in_bulk(set(step._visited_element_id for step in steps))
+        for step in steps:
+            if step._visited_element_id in elements:
+                step._visited_subclass = elements[step._visited_element_id]
+        return steps
 
 
 class CallSessionChoice(models.Model):
@@ -118,7 +175,8 @@ class CallSessionChoice(models.Model):
     )
     time = models.DateTimeField(
         _('Time'),
-        auto_now_add=True
+        default=timezone.now,
+        editable=False
     )
     choice_element = models.ForeignKey(
         Choice,
@@ -146,6 +204,71 @@ class CallSessionChoice(models.Model):
                                    str(self.choice_option_selected))
 
 
+class CallTrace(models.Model):
+    """
+    Server-side timing of the HTTP requests (hops) of a call, recorded by
+    the VxmlMetricsMiddleware (see call_trace.py). The hops are stored
+    compactly as JSON, the totals are stored to find expensive calls.
+    """
+    session = models.OneToOneField(CallSession, on_delete = models.CASCADE, primary_key = True,
+            related_name = 'trace')
+    start = models.DateTimeField(_('Time of the first request'))
+    hop_count = models.PositiveIntegerField(_('Requests'), default = 0)
+    server_time = models.FloatField(_('Server time (ms)'), default = 0, db_index = True)
+    db_time = models.FloatField(_('Database time (ms)'), default = 0)
+    queries = models.PositiveIntegerField(_('Queries'), default = 0)
+    gap_time = models.FloatField(_('Time between requests (ms)'), default = 0,
+            help_text = _("Time spent by the VoiceXML interpreter, e.g. playing audio and waiting for input"))
+    hops = models.TextField(default = '[]', editable = False)
+
+    class Meta:
+        verbose_name = _('Call Trace')
+
+    def __str__(self):
+        return "%s: %s requests, %.0f ms" % (str(self.session), self.hop_count, self.server_time)
+
+    def hop_list(self):
+        """
+        Returns the hops of this trace as a list of TraceHops.
+        """
+        from ..call_trace import decode_hops
+        return decode_hops(self.hops)
+
+
+class CallSessionArchive(models.Model):
+    """
+    The compacted history of an old CallSession: its steps, and its choices
+    that do not belong to a report, stored as compressed JSON after the rows
+    themselves have been deleted (see retention.py).
+    """
+    session = models.OneToOneField(CallSession, on_delete = models.CASCADE, primary_key = True,
+            related_name = 'archive')
+    archived = models.DateTimeField(_('Time of compaction'), auto_now_add = True)
+    step_count = models.PositiveIntegerField(_('Steps'), default = 0)
+    choice_count = models.PositiveIntegerField(_('Choices'), default = 0)
+    history = models.BinaryField(editable = False)
+
+    class Meta:
+        verbose_name = _('Call Session Archive')
+
+    def __str__(self):
+        return "%s: %s steps, %s choices" % (str(self.session), self.step_count, self.choice_count)
+
+    def steps(self):
+        """
+        Returns the archived steps as ArchivedSteps.
+        """
+        from ..retention import decode_history
+        return decode_history(self.history)[0]
+
+    def choices(self):
+        """
+        Returns the archived choices as ArchivedChoices.
+        """
+        from ..retention import decode_history
+        return decode_history(self.history)[1]
+
+
 def lookup_or_create_session(voice_service, session_id=None, caller_id = None):
     if session_id:
         session = get_object_or_404(CallSession, pk = session_id)
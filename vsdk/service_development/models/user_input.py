@@ -46,6 +46,57 @@ class UserReport(models.Model):
 
     class Meta:
         verbose_name = _('User Report')
+        indexes = [models.Index(fields = ['report_element', 'time'])]
+
+
+class ReportAttribute(models.Model):
+    """
+    A choice option that was selected for a UserReport, denormalized from the
+    CallSessionChoices of the report when it is submitted. Used to look up the
+    latest reports with a given set of choice options (see RetrieveReports).
+    """
+    report = models.ForeignKey(
+        UserReport,
+        on_delete=models.CASCADE,
+        related_name="attributes"
+    )
+    report_element = models.ForeignKey(
+        'Report',
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    choice_element = models.ForeignKey(
+        'Choice',
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    choice_option_selected = models.ForeignKey(
+        'ChoiceOption',
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    # Time of the report
+    time = models.DateTimeField(_('Time'))
+
+    class Meta:
+        verbose_name = _('Report Attribute')
+        indexes = [models.Index(fields = ['report_element', 'choice_option_selected', 'time'])]
+
+    def __str__(self):
+        return '%s: %s' % (self.report_id, self.choice_option_selected_id)
+
+    @classmethod
+    def for_choices(cls, user_report, choices):
+        """
+        Returns (unsaved) attributes of user_report for the given CallSessionChoices.
+        """
+        return [cls(report = user_report,
+                    report_element_id = user_report.report_element_id,
+                    choice_element_id = choice.choice_element_id,
+                    choice_option_selected_id = choice.choice_option_selected_id,
+                    time = user_report.time)
+                for choice in choices
+                if user_report.report_element_id and choice.choice_element_id and choice.choice_option_selected_id]
 
 
 class SpokenUserInput(models.Model):
@@ -80,7 +131,8 @@ class SpokenUserInput(models.Model):
         """audio player tag for admin"""
         if self.audio:
             file_url = settings.MEDIA_URL + str(self.audio)
-            player_string = str('<audio src="%s" controls>'  % (file_url) + ugettext('Your browser does not support the audio element.') + '</audio>')
+            # Only loaded when played, there can be many players on a page
+            player_string = str('<audio src="%s" controls preload="none">'  % (file_url) + ugettext('Your browser does not support the audio element.') + '</audio>')
             return mark_safe(player_string)
 
     def get_voice_fragment_url(self):
@@ -1,5 +1,9 @@
+import os
+import struct
+
 from django.utils.translation import ugettext as _
-from vsdk import settings
+
+from ..cache import ProcessCache
 
 def validate_audio_file_extension(value):
     import os
@@ -14,11 +18,114 @@ def validate_audio_file_extension(value):
     if not ext.lower() in valid_extensions:
         raise ValidationError(_('Unsupported file extension. Only .wav files are supported.'))
 
+# Only the first bytes of a wave file are read to find its format chunk
+WAVE_HEADER_SIZE = 512
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Formats of the audio files that have been validated, per (file name, size)
+audio_file_format_cache = ProcessCache('audio file formats')
+
+
+def parse_wave_header(header):
+    """
+    Parses the RIFF/WAVE header in the bytes header. Returns a dict with
+    the format code, channels, sample rate and bit depth, or None if header
+    does not start with a valid wave header.
+    """
+    if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id = header[offset:offset + 4]
+        chunk_size = struct.unpack('<I', header[offset + 4:offset + 8])[0]
+        if chunk_id == b'fmt ':
+            chunk = header[offset + 8:offset + 8 + chunk_size]
+            if chunk_size < 16 or len(chunk) < 16:
+                return None
+            format_code, channels, sample_rate, _byte_rate, _block_align, bit_depth = struct.unpack('<HHIIHH', chunk[:16])
+            if format_code == WAVE_FORMAT_EXTENSIBLE and len(chunk) >= 26:
+                # The actual format is in the first bytes of the sub-format GUID
+                format_code = struct.unpack('<H', chunk[24:26])[0]
+            return {'format': format_code,
+                    'channels': channels,
+                    'sample_rate': sample_rate,
+                    'bit_depth': bit_depth}
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size % 2)
+    return None
+
+
+def is_telephony_wave_format(wave_format):
+    """
+    Returns True if wave_format (see parse_wave_header) is 8 kHz, 16 bit,
+    mono PCM.
+    """
+    return (wave_format is not None
+            and wave_format['format'] == WAVE_FORMAT_PCM
+            and wave_format['channels'] == 1
+            and wave_format['sample_rate'] == 8000
+            and wave_format['bit_depth'] == 16)
+
+
+def read_audio_file_header(value, size = WAVE_HEADER_SIZE):
+    """
+    Returns the first size bytes of the file in the FieldFile value. Files
+    in storages without local paths are opened through their storage.
+    """
+    try:
+        path = value.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        with open(path, 'rb') as audio_file:
+            return audio_file.read(size)
+    with value.storage.open(value.name, 'rb') as audio_file:
+        return audio_file.read(size)
+
+
 def validate_audio_file_format(value):
-    import os
+    """
+    Returns True if the FieldFile value is a wave file (.wav) with a sample
+    rate of 8 kHz, a bit depth of 16 bits, a single channel and the PCM codec.
+    Results are cached per file name and size.
+    """
+    #Required for Heroku, django-storages backend
+    try:
+        name = value.name
+    except NotImplementedError:
+        name = value.url
+    ext = os.path.splitext(name)[1]  # [0] returns path+filename
+    valid_extensions = ['.wav']
+    if not ext.lower() in valid_extensions:
+        return False
+
+    try:
+        key = (name, value.size)
+    except (NotImplementedError, OSError):
+        key = None
+
+    def validate():
+        try:
+            wave_format = parse_wave_header(read_audio_file_header(value))
+        except (OSError, ValueError):
+            return False
+        return is_telephony_wave_format(wave_format)
+
+    if key is None:
+        return validate()
+    return audio_file_format_cache.get(key, validate)
+
+
+def validate_audio_file_format_mediainfo(value):
+    """
+    Validates the format of value like validate_audio_file_format(), using
+    the output of the mediainfo command. Kept to compare the validators
+    (see the benchmark_audio_validation command).
+    """
     import subprocess
     import re
-    from django.core.exceptions import ValidationError
     #Required for Heroku, django-storages backend
     try:
         path_to_file = value.path
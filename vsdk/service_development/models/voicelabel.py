@@ -1,11 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 from django.utils.safestring import mark_safe
 
 
-from .validators import validate_audio_file_extension, validate_audio_file_format
+from ..cache import ProcessCache
+from .content_version import ContentVersion
+from .validators import validate_audio_file_extension
+
+
+# URLs of the interface Voice Fragments (numbers, pre/post choice option, etc.), per Language id,
+# versioned by the voice content version (see ContentVersion)
+interface_voice_label_url_cache = ProcessCache('interface voice label urls')
 
 
 class VoiceLabel(models.Model):
@@ -24,9 +31,12 @@ class VoiceLabel(models.Model):
     is_valid.short_description = _('Is valid')
 
     def validator(self, language):
-        errors = []        
-        if len(self.voicefragment_set.filter(language = language)) > 0:
-            errors.extend(self.voicefragment_set.filter(language=language)[0].validator())
+        errors = []
+        # Uses all() instead of filter(), so prefetched fragments are used (see validation.py)
+        voice_fragments = [voice_fragment for voice_fragment in self.voicefragment_set.all()
+                if voice_fragment.language_id == language.pk]
+        if voice_fragments:
+            errors.extend(voice_fragments[0].validator())
         else:
             errors.append(ugettext('"%(description_of_this_element)s" does not have a Voice Fragment for "%(language)s"') %{'description_of_this_element' : str(self),'language' : str(language)})
         return errors
@@ -119,32 +129,29 @@ class Language(models.Model):
     def __str__(self):
         return '%s (%s)' % (self.name, self.code)
 
+    interface_voice_label_fields = ('voice_label',
+                                    'error_message',
+                                    'select_language',
+                                    'pre_choice_option',
+                                    'post_choice_option')
+    interface_number_fields = ('zero', 'one', 'two', 'three', 'four',
+                               'five', 'six', 'seven', 'eight', 'nine')
+
     @property
     def get_description_voice_label_url(self):
         """
         Returns the URL of the Voice Fragment describing
         the language, in the language itself.
         """
-        return self.voice_label.get_voice_fragment_url(self)
+        return self.get_interface_voice_label_url_dict['voice_label']
 
     @property
     def get_interface_numbers_voice_label_url_list(self):
-        numbers = [
-                    self.zero,
-                    self.one,
-                    self.two,
-                    self.three,
-                    self.four,
-                    self.five,
-                    self.six,
-                    self.seven,
-                    self.eight,
-                    self.nine
-                    ]
-        result = []
-        for number in numbers:
-            result.append(number.get_voice_fragment_url(self))
-        return result
+        """
+        Returns a list containing the URLs of the Voice Fragments
+        of the numbers 0 to 9 (in that order).
+        """
+        return list(self._interface_voice_label_urls()['numbers'])
 
     @property
     def get_interface_voice_label_url_dict(self):
@@ -152,20 +159,52 @@ class Language(models.Model):
         Returns a dictionary containing all URLs of Voice
         Fragments of the hardcoded interface audio fragments.
         """
-        interface_voice_labels = {
-                'voice_label':self.voice_label,
-                'error_message':self.error_message,
-                'select_language':self.select_language,
-                'pre_choice_option':self.pre_choice_option,
-                'post_choice_option':self.post_choice_option,
-                }
-        for k, v in interface_voice_labels.items():
-            interface_voice_labels[k] = v.get_voice_fragment_url(self)
-        return interface_voice_labels
+        return dict(self._interface_voice_label_urls()['labels'])
+
+    def _interface_voice_label_urls(self):
+        """
+        Returns the (cached) URLs of all interface Voice Fragments in this language.
+        The cache is invalidated when a Language, Voice Label or Voice Fragment
+        is saved or deleted (see signals.py), or in other processes by the
+        version of the voice content. The version is read once per instance.
+        """
+        version = getattr(self, '_voice_content_version', None)
+        if version is None:
+            version = self._voice_content_version = ContentVersion.current(ContentVersion.VOICE_CONTENT)
+        return interface_voice_label_url_cache.get(self.pk, self._resolve_interface_voice_label_urls,
+                version = version)
+
+    def _resolve_interface_voice_label_urls(self):
+        fields = self.interface_voice_label_fields + self.interface_number_fields
+        label_ids = set(getattr(self, field + '_id') for field in fields)
+        fragment_urls = {}
+        for fragment in VoiceFragment.objects.filter(parent_id__in = label_ids, language = self).order_by('pk'):
+            fragment_urls.setdefault(fragment.parent_id, fragment.get_url())
+
+        def url(field):
+            label_id = getattr(self, field + '_id')
+            if label_id in fragment_urls:
+                return fragment_urls[label_id]
+            # Missing fragment, fail the same way as the uncached lookup
+            return getattr(self, field).get_voice_fragment_url(self)
+
+        return {'labels': dict((field, url(field)) for field in self.interface_voice_label_fields),
+                'numbers': tuple(url(field) for field in self.interface_number_fields)}
 
 
 
 class VoiceFragment(models.Model):
+    CONVERSION_PENDING = 'pending'
+    CONVERSION_CONVERTING = 'converting'
+    CONVERSION_CONVERTED = 'converted'
+    CONVERSION_FAILED = 'failed'
+    CONVERSION_STATUS_CHOICES = (
+            (CONVERSION_PENDING, _('Pending')),
+            (CONVERSION_CONVERTING, _('Converting')),
+            (CONVERSION_CONVERTED, _('Converted')),
+            (CONVERSION_FAILED, _('Failed')),
+            )
+
     parent = models.ForeignKey('VoiceLabel',
             on_delete = models.CASCADE)
     language = models.ForeignKey(
@@ -174,61 +213,64 @@ class VoiceFragment(models.Model):
     audio = models.FileField(_('Audio'),
             validators=[validate_audio_file_extension],
             help_text = _("Ensure your file is in the correct format! Wave (.wav) : Sample rate 8KHz, 16 bit, mono, Codec: PCM 16 LE (s16l)"))
+    conversion_status = models.CharField(_('Conversion status'),
+            max_length = 10,
+            choices = CONVERSION_STATUS_CHOICES,
+            default = CONVERSION_CONVERTED,
+            editable = False,
+            db_index = True)
+    conversion_error = models.TextField(_('Conversion error'),
+            blank = True,
+            editable = False)
 
 
     class Meta:
         verbose_name = _('Voice Fragment')
 
-    def convert_wav_to_correct_format(self):
-        from vsdk import settings
-        if not settings.KASADAKA:
-            pass
-
-        import subprocess
-        from os.path import basename
-        new_file_name = self.audio.path[:-4] + "_conv.wav"
-        subprocess.getoutput("sox -S %s -r 8k -b 16 -c 1 -e signed-integer %s"% (self.audio.path, new_file_name))
-        self.audio = basename(new_file_name)
-        
-        
+    def __init__(self, *args, **kwargs):
+        super(VoiceFragment, self).__init__(*args, **kwargs)
+        self._saved_audio_name = self.audio.name
 
+    def converted_audio_name(self):
+        return self.audio.name[:-4] + "_conv.wav"
 
     def save(self, *args, **kwargs):
+        """
+        Saves the fragment. On a KasaDaka system, new audio is queued for
+        conversion to the correct format (see audio_conversion.py) once the
+        transaction is committed.
+        """
+        from ..audio_conversion import conversion_enabled, convert_voice_fragment, audio_conversion_queue
+        audio_changed = self.pk is None or self.audio.name != self._saved_audio_name
+        queue_conversion = conversion_enabled() and audio_changed and bool(self.audio)
+        if queue_conversion:
+            self.conversion_status = self.CONVERSION_PENDING
+            self.conversion_error = ''
         super(VoiceFragment, self).save(*args, **kwargs)
-        from vsdk import settings
-        if  settings.KASADAKA:
-            format_correct = validate_audio_file_format(self.audio)
-            if not format_correct: 
-                self.convert_wav_to_correct_format()
-        super(VoiceFragment, self).save(*args, **kwargs)
-
-
-
+        self._saved_audio_name = self.audio.name
+        if queue_conversion:
+            transaction.on_commit(lambda: audio_conversion_queue.submit(convert_voice_fragment, self.pk))
 
     def __str__(self):
         return _("Voice Fragment: (%(name)s) %(name_parent)s") % {'name' : self.language.name, 'name_parent' : self.parent.name}
 
     def get_url(self):
-        return self.audio.url
+        """
+        Returns the URL of the audio, which changes whenever its content changes.
+        """
+        from ..media import versioned_media_url
+        return versioned_media_url(self.audio)
 
     def validator(self):
+        """
+        Checks whether the audio file is accessible. Accessibility is checked
+        in batches and cached for a while (see accessibility.py).
+        """
+        from ..accessibility import audio_file_accessible
         errors = []
-        #Temporary for ICT4D 2018, Heroku performance optimalization
-        return errors
-        try:
-            accessible = self.audio.storage.exists(self.audio.name)
-        except NotImplementedError:
-            import urllib.request
-            try:
-                response = urllib.request.urlopen(self.audio.url)
-                accessible = True
-            except urllib.error.HTTPError:
-                accessible = False
-
-
         if not self.audio:
             errors.append(ugettext('%s does not have an audio file')%str(self))
-        elif not accessible:
+        elif not audio_file_accessible(self.audio):
             errors.append(ugettext('%s audio file not accessible')%str(self))
         #TODO verift whether this really is not needed anymore
         #elif not validate_audio_file_format(self.audio):
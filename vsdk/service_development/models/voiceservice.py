@@ -9,9 +9,36 @@ from django.urls.exceptions import NoReverseMatch
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 
+from ..cache import ProcessCache
 from .voicelabel import VoiceLabel, Language, VoiceFragment
+from .content_version import ContentVersion
 from .vs_element import VoiceServiceElement
 
+
+# Supported languages (ordered by id), per VoiceService id, versioned by
+# the voice content version (see ContentVersion)
+supported_languages_cache = ProcessCache('supported languages')
+
+
+def get_supported_languages(service_id):
+    """
+    Returns a (cached) tuple of the Languages supported by the Voice Service
+    with service_id. The cache is invalidated when the supported languages of
+    a service change (see signals.py), or in other processes by the version
+    of the voice content.
+    """
+    version = ContentVersion.current(ContentVersion.VOICE_CONTENT)
+
+    def load():
+        languages = tuple(Language.objects.filter(voiceservice__pk = service_id).order_by('pk'))
+        for language in languages:
+            # Resolve the interface voice labels of this version (see Language)
+            language._voice_content_version = version
+        return languages
+
+    return supported_languages_cache.get(service_id, load, version = version)
+
+
 class VoiceService(models.Model):
     _urls_name = 'service-development:voice-service'
 
@@ -37,6 +64,19 @@ class VoiceService(models.Model):
 
     supported_languages = models.ManyToManyField(Language, blank = True,verbose_name=_('Supported languages'))
 
+    # Progress of pointing the telephony platform to this service (see telephony.py)
+    ACTIVATION_PENDING = 'pending'
+    ACTIVATION_DONE = 'done'
+    ACTIVATION_FAILED = 'failed'
+    activation_status_choices = [(ACTIVATION_PENDING, _('in progress')),
+                                 (ACTIVATION_DONE, _('completed')),
+                                 (ACTIVATION_FAILED, _('failed'))]
+    activation_status = models.CharField(_('Activation status'), max_length = 10, blank = True, editable = False,
+            choices = activation_status_choices)
+    activation_message = models.CharField(_('Activation message'), max_length = 1000, blank = True, editable = False)
+    call_history_retention_days = models.PositiveIntegerField(_('Keep call history for (days)'), null = True, blank = True,
+            help_text = _("The steps and choices of calls older than this are compacted into an archive per call. Leave empty to use the default of the system."))
+
     class Meta:
         verbose_name = _('Voice Service')
     
@@ -54,7 +94,7 @@ class VoiceService(models.Model):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        return VoiceServiceElement.objects.get_subclass(id = self._start_element.id)
+        return VoiceServiceElement.objects.get_subclass_by_id(self._start_element_id)
     _get_start_element.short_description = _('Starting element')
     start_element = property(_get_start_element)
 
@@ -62,7 +102,7 @@ class VoiceService(models.Model):
         """
         Returns True if this service supports only a single language
         """
-        return len(self.supported_languages.all()) == 1
+        return len(get_supported_languages(self.pk)) == 1
     _supports_single_language.short_description = _('Supports only a single language')
     supports_single_language = property(_supports_single_language)
 
@@ -93,17 +133,11 @@ class VoiceService(models.Model):
     is_valid.short_description = _('Is valid')
 
     def validator(self):
-        errors = []
-        if not self._start_element:
-            errors.append(ugettext('No starting element'))
-        else:
-            associated_elements = self.voiceservicesubelement_set.all()
-            for sub_element in associated_elements:
-                errors.extend(sub_element.get_subclass_object().validator())
-        if len(self.supported_languages.all()) == 0:
-            errors.append(ugettext('No supported languages'))
-
-        #deduplicate errors
-        errors = list(set(errors))
-        return errors
+        """
+        Returns a list of problems with this service and its elements. The
+        result is cached until the service or its elements change (see
+        validation.py).
+        """
+        from ..validation import get_service_validation
+        return list(get_service_validation(self).errors)
 
@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.contenttypes.models import ContentType
 from model_utils.managers import InheritanceManager
 from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
@@ -6,6 +7,54 @@ from django.utils.translation import ugettext
 
 from .voicelabel import VoiceLabel
 
+
+class VoiceServiceSubElementManager(InheritanceManager):
+    """
+    Resolves elements to their actual subclass using the subclass type that is
+    stored on every element, instead of joining all subclass tables like
+    InheritanceManager.get_subclass() and select_subclasses() do.
+    Elements without a stored subclass type (e.g. loaded from a fixture) are
+    resolved through the InheritanceManager; the backfill_subclass_types
+    command stores their type.
+    """
+
+    def get_subclass_by_id(self, id):
+        """
+        Returns the element with id as an instance of its actual subclass.
+        """
+        elements = self.subclasses_in_bulk([id])
+        if not elements:
+            raise self.model.DoesNotExist('%s matching query does not exist.' % self.model._meta.object_name)
+        return list(elements.values())[0]
+
+    def subclasses_in_bulk(self, ids = None, **filters):
+        """
+        Returns a dict mapping ids to elements (as their actual subclass), for the
+        elements with the given ids and/or matching filters.
+        Uses one query to look up the types, and one query per subclass.
+        """
+        queryset = self.get_queryset().filter(**filters)
+        if ids is not None:
+            queryset = queryset.filter(pk__in = [int(id) for id in ids if id is not None])
+        ids_by_type = {}
+        for id, subclass_type_id in queryset.values_list('pk', '_subclass_type'):
+            ids_by_type.setdefault(subclass_type_id, []).append(id)
+
+        elements = {}
+        unknown_ids = ids_by_type.pop(None, [])
+        for subclass_type_id, type_ids in ids_by_type.items():
+            model = ContentType.objects.get_for_id(subclass_type_id).model_class()
+            if model is None:
+                # Stale content type, e.g. of a removed model
+                unknown_ids.extend(type_ids)
+            else:
+                elements.update(model._base_manager.in_bulk(type_ids))
+        if unknown_ids:
+            elements.update((element.pk, element)
+                    for element in self.get_queryset().filter(pk__in = unknown_ids).select_subclasses())
+        return elements
+
+
 class VoiceServiceSubElement(models.Model):
     """
     A sub-element in a voice service (could be ChoiceOption, etc).
@@ -14,7 +63,7 @@ class VoiceServiceSubElement(models.Model):
 
     #use django_model_utils to be able to find out what is the subclass of this element
     #see: https://django-model-utils.readthedocs.io/en/latest/managers.html#inheritancemanager
-    objects = InheritanceManager()
+    objects = VoiceServiceSubElementManager()
 
     service = models.ForeignKey('VoiceService', on_delete = models.CASCADE,
             help_text=_("The service to which this element belongs"))
@@ -31,6 +80,14 @@ class VoiceServiceSubElement(models.Model):
             null = True,
             blank = True,
             )
+    # The actual subclass (e.g. Choice) of this element, stored on save
+    _subclass_type = models.ForeignKey(
+            ContentType,
+            on_delete = models.PROTECT,
+            null = True,
+            editable = False,
+            related_name = '+',
+            )
 
     class Meta:
         verbose_name = _('Voice Service Sub-Element')
@@ -38,6 +95,13 @@ class VoiceServiceSubElement(models.Model):
     def __str__(self):
         return "Sub-element: %s" % self.name
 
+    def save(self, *args, **kwargs):
+        # An element saved through a base class (e.g. as VoiceServiceElement)
+        # keeps the subclass type it was created with
+        if self._state.adding or self._subclass_type_id is None or not type(self).__subclasses__():
+            self._subclass_type = ContentType.objects.get_for_model(self)
+        super(VoiceServiceSubElement, self).save(*args, **kwargs)
+
     def is_valid(self):
         return len(self.validator()) == 0
     is_valid.boolean = True
@@ -65,7 +129,7 @@ class VoiceServiceSubElement(models.Model):
         return self.voice_label.get_voice_fragment_url(language)
 
     def get_subclass_object(self):
-        return VoiceServiceSubElement.objects.get_subclass(id = self.id)
+        return VoiceServiceSubElement.objects.get_subclass_by_id(self.id)
 
 
 class VoiceServiceElement(VoiceServiceSubElement):
@@ -73,7 +137,7 @@ class VoiceServiceElement(VoiceServiceSubElement):
     An element in a voice service (could be Choice, Message, etc.)
     Is accessible through HTTP in a generated VoiceXML
     """
-    objects = InheritanceManager()
+    objects = VoiceServiceSubElementManager()
     _urls_name = "" #This should be the same as in urls.py
 
     class Meta:
@@ -54,7 +54,7 @@ class ChoiceOption(VoiceServiceSubElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        return VoiceServiceSubElement.objects.get_subclass(id = self._redirect.id)
+        return VoiceServiceSubElement.objects.get_subclass_by_id(self._redirect_id)
 
     def __str__(self):
         return "(%s): %s" % (self.parent.name,self.name)
@@ -68,12 +68,12 @@ class ChoiceOption(VoiceServiceSubElement):
         errors = []
         errors.extend(super(ChoiceOption, self).validator())
         #check if redirect is present
-        if not self._redirect:
+        if not self._redirect_id:
             errors.append(ugettext('No redirect in choice option: "%s"')%str(self))
         else:
-            if self.service.id != self.parent.service.id:
+            if self.service_id != self.parent.service_id:
                 errors.append(ugettext('Choice option "%(name_of_element)s" not in correct (same) Voice Service as Choice element! ("%(name_service_of_element)s", should be "%(name_service_of_parent_of_element)s")')%{'name_of_element' : str(self),'name_service_of_element' : str(self.service),'name_service_of_parent_of_element' : str(self.parent.service)})
-            if self.redirect.service.id != self.parent.service.id:
+            if self._redirect.service_id != self.parent.service_id:
                 errors.append(ugettext('Redirect element of choice option "%(name_of_element)s" not in correct (same) Voice Service! ("%(name_service_of_element)s", should be "%(name_service_of_parent_of_element)s")')%{'name_of_element' : str(self),'name_service_of_element' : str(self.redirect.service),'name_service_of_parent_of_element' : str(self.service)})
 
         return errors
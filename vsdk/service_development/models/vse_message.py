@@ -29,8 +29,8 @@ class MessagePresentation(VoiceServiceElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._redirect :
-            return VoiceServiceElement.objects.get_subclass(id = self._redirect.id)
+        if self._redirect_id:
+            return VoiceServiceElement.objects.get_subclass_by_id(self._redirect_id)
         else: 
             return None
 
@@ -45,10 +45,10 @@ class MessagePresentation(VoiceServiceElement):
     def validator(self):
         errors = []
         errors.extend(super(MessagePresentation, self).validator())
-        if not self.final_element and not self._redirect:
+        if not self.final_element and not self._redirect_id:
             errors.append(ugettext('Message %s does not have a redirect element and is not a final element')%self.name)
         elif not self.final_element:
-            if self._redirect.id == self.id:
+            if self._redirect_id == self.id:
                 errors.append(ugettext('There is a loop in %s')%str(self))
 
 
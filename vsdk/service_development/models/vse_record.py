@@ -83,8 +83,8 @@ class Record(VoiceServiceElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._redirect:
-            return VoiceServiceElement.objects.get_subclass(id=self._redirect.id)
+        if self._redirect_id:
+            return VoiceServiceElement.objects.get_subclass_by_id(self._redirect_id)
         else:
             return None
 
@@ -99,7 +99,7 @@ class Record(VoiceServiceElement):
     def validator(self):
         errors = []
         errors.extend(super(Record, self).validator())
-        if not self._redirect:
+        if not self._redirect_id:
             errors.append(ugettext('Record %s does not have a redirect element') % self.name)
         return errors
 
@@ -58,8 +58,8 @@ class Report(VoiceServiceElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._redirect_yes:
-            return VoiceServiceElement.objects.get_subclass(id=self._redirect_yes.id)
+        if self._redirect_yes_id:
+            return VoiceServiceElement.objects.get_subclass_by_id(self._redirect_yes_id)
         else:
             return None
 
@@ -70,8 +70,8 @@ class Report(VoiceServiceElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._redirect_no:
-            return VoiceServiceElement.objects.get_subclass(id=self._redirect_no.id)
+        if self._redirect_no_id:
+            return VoiceServiceElement.objects.get_subclass_by_id(self._redirect_no_id)
         else:
             return None
 
@@ -86,9 +86,9 @@ class Report(VoiceServiceElement):
     def validator(self):
         errors = []
         errors.extend(super(Report, self).validator())
-        if not self._redirect_yes:
+        if not self._redirect_yes_id:
             errors.append(ugettext('Report %s does not have a redirect element for "yes"') % self.name)
-        if not self._redirect_no:
+        if not self._redirect_no_id:
             errors.append(ugettext('Report %s does not have a redirect element for "no"') % self.name)
         return errors
 
@@ -214,8 +214,8 @@ class RetrieveReports(VoiceServiceElement):
         instead of the VoiceServiceElement superclass object (which does
         not have specific fields and methods).
         """
-        if self._redirect:
-            return VoiceServiceElement.objects.get_subclass(id=self._redirect.id)
+        if self._redirect_id:
+            return VoiceServiceElement.objects.get_subclass_by_id(self._redirect_id)
         else:
             return None
 
@@ -229,8 +229,8 @@ class RetrieveReports(VoiceServiceElement):
 
     def validator(self):
         errors = []
-        errors.extend(super(Report, self).validator())
-        if not self._redirect:
+        errors.extend(super(RetrieveReports, self).validator())
+        if not self._redirect_id:
             errors.append(ugettext('Report %s does not have a redirect element for "yes"') % self.name)
         return errors
 
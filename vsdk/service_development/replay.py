@@ -0,0 +1,255 @@
+"""
+Replay of the call flows of Voice Services, for benchmarking.
+
+A CallFlowReplay acts like a VoiceXML browser on top of the Django test
+client: it starts a call, follows redirects and <goto>s, picks every DTMF
+option of choices, language selections and confirmations, posts fake
+recordings and submits reports. Every path through the call flow is
+replayed as a separate call, until it ends or would visit an element a
+second time. Audio is not fetched.
+
+The latency and number of SQL queries of every hop (HTTP request) are
+collected per kind of hop, e.g. "choice GET" or "record POST".
+"""
+import io
+import math
+import time
+import wave
+from urllib.parse import urlsplit
+from xml.etree import ElementTree as ET
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve, reverse
+
+VXML_NAMESPACE = '{http://www.w3.org/2001/vxml}'
+
+# Views that serve a single element, which are visited at most once per call
+ELEMENT_VIEWS = ('choice', 'message-presentation', 'record', 'report', 'retrieve-reports')
+
+
+def percentile(values, percent):
+    """
+    Returns the percentile of values (nearest rank), or None if there are
+    no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def silent_wave():
+    """A short, silent 8 kHz, 16 bit, mono wave file"""
+    content = io.BytesIO()
+    with wave.open(content, 'wb') as recording:
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(8000)
+        recording.writeframes(b'\0\0' * 8000)
+    return content.getvalue()
+
+
+class Hop(object):
+    """A request made while replaying a call"""
+
+    def __init__(self, kind, path, status, latency, queries):
+        self.kind = kind
+        self.path = path
+        self.status = status
+        self.latency = latency
+        self.queries = queries
+
+
+class HopStatistics(object):
+    """Latencies (in ms) and query counts of the hops of one kind"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def add(self, hop):
+        self.latencies.append(hop.latency)
+        self.queries.append(hop.queries)
+        if hop.status >= 400:
+            self.errors += 1
+
+    def summary(self):
+        return {'count': len(self.latencies),
+                'errors': self.errors,
+                'p50': percentile(self.latencies, 50),
+                'p90': percentile(self.latencies, 90),
+                'p99': percentile(self.latencies, 99),
+                'queries_median': percentile(self.queries, 50),
+                'queries_max': max(self.queries)}
+
+
+class Request(object):
+    """A transition from one VoiceXML document to the next"""
+
+    def __init__(self, method, url, data = None):
+        self.method = method
+        self.url = url
+        self.data = data or {}
+
+
+class CallFlowReplay(object):
+    """
+    Replays every path through the call flow of a Voice Service, see the
+    module documentation.
+    """
+
+    def __init__(self, service, max_paths = 1000, max_hops = 200, caller_id_prefix = '+990000'):
+        self.service = service
+        self.max_paths = max_paths
+        self.max_hops = max_hops
+        self.caller_id_prefix = caller_id_prefix
+        self.client = Client(raise_request_exception = False)
+        self.hops = []
+        self.paths = 0
+        self.failed_paths = 0
+
+    def run(self):
+        """
+        Replays all paths (up to max_paths), and returns the hops.
+        """
+        pending = [()]
+        while pending and self.paths < self.max_paths:
+            prefix = pending.pop()
+            decisions, alternatives = self.replay_call(prefix)
+            # Explore the other alternatives of every decision made after the prefix
+            for depth in range(len(alternatives) - 1, len(prefix) - 1, -1):
+                for alternative in range(alternatives[depth] - 1, 0, -1):
+                    pending.append(tuple(decisions[:depth]) + (alternative,))
+        return self.hops
+
+    def statistics(self):
+        """
+        Returns a dict mapping the kinds of hops to their HopStatistics.
+        """
+        statistics = {}
+        for hop in self.hops:
+            statistics.setdefault(hop.kind, HopStatistics(hop.kind)).add(hop)
+        return statistics
+
+    def replay_call(self, prefix):
+        """
+        Replays one call, taking the alternatives in prefix at the first
+        decisions and the first alternative after that. Returns the
+        decisions taken and the number of alternatives of every decision.
+        """
+        self.paths += 1
+        caller_id = '%s%06d' % (self.caller_id_prefix, self.paths)
+        request = Request('GET', '%s?%s' % (reverse('service-development:voice-service', args = [self.service.pk]),
+                'caller_id=%s' % caller_id))
+        decisions = []
+        alternatives = []
+        visited = set()
+        for i in range(self.max_hops):
+            response, url_name, kwargs = self.fetch(request)
+            if response.status_code in (301, 302, 303):
+                request = Request('GET', response['Location'])
+                continue
+            if response.status_code != 200:
+                self.failed_paths += 1
+                break
+            if url_name in ELEMENT_VIEWS and request.method == 'GET':
+                element = (url_name, kwargs.get('element_id'))
+                if element in visited:
+                    break
+                visited.add(element)
+            try:
+                document = ET.fromstring(response.content)
+            except ET.ParseError:
+                self.failed_paths += 1
+                break
+            transitions = self.transitions(url_name, document)
+            if not transitions:
+                break
+            if len(transitions) > 1:
+                depth = len(decisions)
+                decision = prefix[depth] if depth < len(prefix) else 0
+                # The call flow might have changed since the prefix was taken
+                decision = min(decision, len(transitions) - 1)
+                decisions.append(decision)
+                alternatives.append(len(transitions))
+                request = transitions[decision]
+            else:
+                request = transitions[0]
+        return decisions, alternatives
+
+    def fetch(self, request):
+        path = urlsplit(request.url).path
+        try:
+            match = resolve(path)
+            url_name, kwargs = match.url_name, match.kwargs
+        except Resolver404:
+            url_name, kwargs = None, {}
+        # The query log is limited, and has to be empty to count queries
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if request.method == 'POST':
+                response = self.client.post(request.url, request.data)
+            else:
+                response = self.client.get(request.url)
+            latency = (time.perf_counter() - start) * 1000
+        self.hops.append(Hop('%s %s' % (url_name, request.method), request.url,
+                response.status_code, latency, len(queries)))
+        return response, url_name, kwargs
+
+    def transitions(self, url_name, document):
+        """
+        Returns the Requests the caller can cause from document, in the
+        order of the DTMF options.
+        """
+        handler = getattr(self, 'transitions_' + (url_name or '').replace('-', '_'), None)
+        if handler is not None:
+            return handler(document)
+        return self.gotos(document)[:1]
+
+    def transitions_choice(self, document):
+        submit = self.find(document, 'submit')
+        return [Request('POST', submit.get('next'), {'option_id': assign.get('expr')})
+                for assign in self.assigns(document, 'option_id')]
+
+    def transitions_language_selection(self, document):
+        submit = self.find(document, 'submit')
+        pass_on = dict((assign.get('name'), unquote(assign.get('expr')))
+                for assign in document.iter(VXML_NAMESPACE + 'assign') if assign.get('name') != 'language_id')
+        return [Request('POST', submit.get('next'), dict(pass_on, language_id = unquote(assign.get('expr'))))
+                for assign in self.assigns(document, 'language_id')]
+
+    def transitions_record(self, document):
+        submit = self.find(document, 'submit')
+        if submit is None:
+            # Without confirmation, the recording is not submitted
+            return self.gotos(document)[-1:]
+        redirect = self.assigns(document, 'redirect')[0]
+        return [Request('POST', submit.get('next'), {
+                'redirect': unquote(redirect.get('expr')),
+                'recording': SimpleUploadedFile('recording.wav', silent_wave(), content_type = 'audio/wav')})]
+
+    def transitions_report(self, document):
+        submit = self.find(document, 'submit')
+        return [Request('POST', submit.get('next'))] + self.gotos(document)
+
+    def find(self, document, tag):
+        return document.find('.//' + VXML_NAMESPACE + tag)
+
+    def assigns(self, document, name):
+        return [assign for assign in document.iter(VXML_NAMESPACE + 'assign') if assign.get('name') == name]
+
+    def gotos(self, document):
+        return [Request('GET', goto.get('next')) for goto in document.iter(VXML_NAMESPACE + 'goto')
+                if goto.get('next') and not goto.get('next').startswith('#')]
+
+
+def unquote(expr):
+    """Returns the value of an ECMAScript string literal"""
+    return expr.strip("'")
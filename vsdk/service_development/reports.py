@@ -0,0 +1,167 @@
+"""
+Assembly of the user reports that are submitted through Report elements.
+
+A report consists of the latest recording or choice of the caller for
+every ReportContent of the Report element, since the caller last visited
+the start element of the service. These are fetched with one query per
+model, and used both to read the summary to the caller and to submit the
+report.
+
+The choice options of submitted reports are also stored as
+ReportAttributes, to look up the latest reports with a given set of
+choice options (for RetrieveReports elements) with a single query.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch
+
+from .models import VoiceServiceElement, Record, Choice, Report
+from .models import SpokenUserInput, CallSessionChoice, UserReport, ReportAttribute
+
+
+def report_content_element(report_content, graph):
+    """
+    Returns the (subclassed) Choice or Record element of a ReportContent.
+    """
+    element = graph.element(report_content.content_id)
+    if element is None:
+        element = VoiceServiceElement.objects.get_subclass_by_id(report_content.content_id)
+    return element
+
+
+def latest_per_element(queryset, element_field):
+    """
+    Returns a dict mapping element ids to the latest row of queryset for
+    that element.
+    """
+    latest = {}
+    for row in queryset.order_by('time', 'pk'):
+        latest[getattr(row, element_field + '_id')] = row
+    return latest
+
+
+def latest_session_input(session, since, record_ids = (), choice_ids = ()):
+    """
+    Returns two dicts with the latest SpokenUserInput per Record id and the
+    latest CallSessionChoice per Choice id of session, made at or after since.
+    """
+    recordings = {}
+    choices = {}
+    if record_ids:
+        recordings = latest_per_element(SpokenUserInput.objects.filter(
+                session = session,
+                record_element_id__in = record_ids,
+                time__gte = since), 'record_element')
+    if choice_ids:
+        choices = latest_per_element(CallSessionChoice.objects.filter(
+                session = session,
+                choice_element_id__in = choice_ids,
+                time__gte = since).select_related('choice_option_selected'), 'choice_element')
+    return recordings, choices
+
+
+class ReportAssembly(object):
+    """
+    The input of a session for the ReportContents of a Report element, as
+    a list of (report content, recording or choice) pairs in the order of
+    the report contents. Report contents without input are left out.
+    """
+
+    def __init__(self, report_element, session, graph):
+        self.report_element = report_element
+        self.session = session
+        self.graph = graph
+
+        contents = [(report_content, report_content_element(report_content, graph))
+                for report_content in graph.report_contents(report_element)]
+        # Ignore any input that has been entered before the last time the voice service's start
+        # element has been visited for this session. This allows for report elements even when the
+        # user has the ability to restart the service instead of terminating the call at some point.
+        iteration_start_time = session.iteration_start_time(graph.start_element_id)
+        recordings, choices = latest_session_input(session, iteration_start_time,
+                record_ids = [element.pk for _, element in contents if isinstance(element, Record)],
+                choice_ids = [element.pk for _, element in contents if isinstance(element, Choice)])
+
+        self.items = []
+        for report_content, element in contents:
+            if isinstance(element, Record):
+                row = recordings.get(element.pk)
+            elif isinstance(element, Choice):
+                row = choices.get(element.pk)
+            else:
+                row = None
+            if row is not None:
+                self.items.append((report_content, row))
+
+    def summary(self):
+        """
+        Returns the prompt and the value (the URL of the recording or of the
+        voice label of the chosen option) of every item, in the language of
+        the session.
+        """
+        language = self.session.language
+        summary = []
+        for report_content, row in self.items:
+            if isinstance(row, SpokenUserInput):
+                value = row.get_voice_fragment_url()
+            else:
+                value = self.graph.voice_fragment_url(row.choice_option_selected, language)
+            summary.append({
+                'voice_label': self.graph.voice_fragment_url(report_content, language),
+                'value': value,
+            })
+        return summary
+
+    def submit(self, user_report):
+        """
+        Attaches all recordings and choices to user_report, with one UPDATE
+        per model, and stores the ReportAttributes of the chosen options.
+        """
+        if not self.items:
+            return
+        with transaction.atomic():
+            for model in (SpokenUserInput, CallSessionChoice):
+                rows = [row for _, row in self.items if isinstance(row, model)]
+                if rows:
+                    model.objects.filter(pk__in = [row.pk for row in rows]).update(report = user_report)
+                    for row in rows:
+                        row.report = user_report
+            ReportAttribute.objects.bulk_create(ReportAttribute.for_choices(user_report,
+                    [row for _, row in self.items if isinstance(row, CallSessionChoice)]))
+
+
+def report_contents_by_content(report_element_id, graph):
+    """
+    Returns a dict mapping the ids of the content elements of a Report
+    element to its ReportContents.
+    """
+    report_element = graph.element(report_element_id, Report)
+    if report_element is None:
+        report_element = Report.objects.get(pk = report_element_id)
+    report_contents = {}
+    for report_content in graph.report_contents(report_element):
+        report_contents.setdefault(report_content.content_id, report_content)
+    return report_contents
+
+
+def latest_user_reports(report_element_id, choice_option_ids, max_amount):
+    """
+    Returns the latest max_amount UserReports of a Report element in which
+    all the given choice options were chosen, newest first, with their
+    choices and recordings prefetched.
+    """
+    user_reports = UserReport.objects.filter(report_element_id = report_element_id)
+    option_ids = set(choice_option_ids)
+    if option_ids:
+        report_ids = ReportAttribute.objects.filter(
+                report_element_id = report_element_id,
+                choice_option_selected_id__in = option_ids
+            ).values('report').annotate(
+                options = Count('choice_option_selected', distinct = True),
+                latest = Max('time')
+            ).filter(options = len(option_ids)).order_by('-latest', '-report').values_list(
+                'report', flat = True)[:max_amount]
+        user_reports = user_reports.filter(pk__in = list(report_ids))
+    return list(user_reports.order_by('-time', '-pk').prefetch_related(
+            Prefetch('choices', queryset = CallSessionChoice.objects.select_related(
+                'choice_option_selected').order_by('pk')),
+            Prefetch('recordings', queryset = SpokenUserInput.objects.order_by('pk')))[:max_amount])
@@ -0,0 +1,178 @@
+"""
+Retention of the call history.
+
+Every request of a call adds a CallSessionStep, so on long-running
+deployments the steps outgrow all other tables. CallSessions that are older
+than the retention period of their Voice Service (or CALL_HISTORY_RETENTION_DAYS
+by default) are compacted: their steps, and their choices that do not belong
+to a UserReport, are stored as compressed JSON in a CallSessionArchive, and
+the rows themselves are deleted.
+
+Sessions are compacted in batches of CALL_HISTORY_COMPACTION_BATCH, each in a
+short transaction, with a pause of CALL_HISTORY_COMPACTION_PAUSE seconds in
+between, so the database (SQLite in particular) is never write-locked for
+long and calls can continue in the meantime.
+"""
+import json
+import logging
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .background import BackgroundQueue
+from .call_log import flush_call_log
+
+logger = logging.getLogger(__name__)
+
+ArchivedStep = namedtuple('ArchivedStep', ('time', 'element_id', 'element', 'description'))
+ArchivedChoice = namedtuple('ArchivedChoice', ('time', 'choice_element_id', 'choice_option_id', 'choice_option'))
+
+# Compaction started from the admin runs in this pool of worker threads
+retention_queue = BackgroundQueue('call-history-retention', 'CALL_HISTORY_WORKERS', default_workers = 1)
+
+CompactionResult = namedtuple('CompactionResult', ('sessions', 'steps', 'choices'))
+
+
+def encode_history(steps, choices):
+    """
+    Returns the compressed JSON of lists of ArchivedSteps and ArchivedChoices.
+    """
+    history = {
+        'steps': [[step.time.timestamp(), step.element_id, step.element, step.description] for step in steps],
+        'choices': [[choice.time.timestamp(), choice.choice_element_id, choice.choice_option_id, choice.choice_option]
+                for choice in choices],
+    }
+    return zlib.compress(json.dumps(history, separators = (',', ':')).encode('utf-8'), 9)
+
+
+def decode_history(data):
+    """
+    Returns the lists of ArchivedSteps and ArchivedChoices in compressed JSON.
+    """
+    history = json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+    steps = [ArchivedStep(datetime.fromtimestamp(step[0], dt_timezone.utc), *step[1:]) for step in history['steps']]
+    choices = [ArchivedChoice(datetime.fromtimestamp(choice[0], dt_timezone.utc), *choice[1:])
+            for choice in history['choices']]
+    return steps, choices
+
+
+def retention_days(service):
+    """
+    Returns the number of days the call history of service is kept, or None
+    to keep it forever.
+    """
+    if service is not None and service.call_history_retention_days is not None:
+        return service.call_history_retention_days
+    return getattr(settings, 'CALL_HISTORY_RETENTION_DAYS', None)
+
+
+def expired_sessions(service, days = None):
+    """
+    Returns the CallSessions of service (None: without a service) that are
+    older than its retention period, and have not been compacted yet.
+    """
+    from .models import CallSession
+
+    if days is None:
+        days = retention_days(service)
+    if days is None:
+        return CallSession.objects.none()
+    return CallSession.objects.filter(service = service, start__lt = timezone.now() - timedelta(days = days),
+            archive__isnull = True)
+
+
+def compact_batch(session_ids):
+    """
+    Moves the history of the CallSessions with session_ids into archives.
+    Returns the numbers of steps and choices that were compacted.
+    """
+    from .models import CallSessionArchive, CallSessionChoice, CallSessionStep, VoiceServiceElement
+    from .models import ChoiceOption
+
+    with transaction.atomic():
+        steps = list(CallSessionStep.objects.filter(session_id__in = session_ids).order_by('time', 'pk').values_list(
+                'session_id', 'time', '_visited_element_id', 'description'))
+        choices = list(CallSessionChoice.objects.filter(session_id__in = session_ids, report__isnull = True).order_by(
+                'time', 'pk').values_list('session_id', 'time', 'choice_element_id', 'choice_option_selected_id'))
+        element_names = dict(VoiceServiceElement.objects.filter(
+                pk__in = set(step[2] for step in steps if step[2] is not None)).values_list('pk', 'name'))
+        option_names = dict(ChoiceOption.objects.filter(
+                pk__in = set(choice[3] for choice in choices if choice[3] is not None)).values_list('pk', 'name'))
+
+        archived_steps = dict((session_id, []) for session_id in session_ids)
+        archived_choices = dict((session_id, []) for session_id in session_ids)
+        for session_id, step_time, element_id, description in steps:
+            archived_steps[session_id].append(ArchivedStep(step_time, element_id, element_names.get(element_id), description))
+        for session_id, choice_time, choice_element_id, option_id in choices:
+            archived_choices[session_id].append(ArchivedChoice(choice_time, choice_element_id, option_id,
+                    option_names.get(option_id)))
+
+        CallSessionArchive.objects.bulk_create([CallSessionArchive(session_id = session_id,
+                step_count = len(archived_steps[session_id]), choice_count = len(archived_choices[session_id]),
+                history = encode_history(archived_steps[session_id], archived_choices[session_id]))
+                for session_id in session_ids])
+        CallSessionStep.objects.filter(session_id__in = session_ids).delete()
+        CallSessionChoice.objects.filter(session_id__in = session_ids, report__isnull = True).delete()
+    return len(steps), len(choices)
+
+
+def compact_sessions(sessions, batch_size = None, pause = None):
+    """
+    Compacts the history of the CallSessions in the sessions queryset, in
+    batches. Returns a CompactionResult.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'CALL_HISTORY_COMPACTION_BATCH', 100)
+    if pause is None:
+        pause = getattr(settings, 'CALL_HISTORY_COMPACTION_PAUSE', 0.1)
+    # Steps of the sessions might still be queued
+    flush_call_log()
+
+    session_ids = list(sessions.order_by('pk').values_list('pk', flat = True))
+    compacted_steps = compacted_choices = 0
+    for offset in range(0, len(session_ids), batch_size):
+        if offset and pause:
+            time.sleep(pause)
+        step_count, choice_count = compact_batch(session_ids[offset:offset + batch_size])
+        compacted_steps += step_count
+        compacted_choices += choice_count
+    return CompactionResult(len(session_ids), compacted_steps, compacted_choices)
+
+
+def compact_expired_history(service_ids = None, days = None, batch_size = None, pause = None):
+    """
+    Compacts the sessions older than the retention period of their Voice
+    Service, of the Voice Services with service_ids (None: all, including
+    sessions without a service). days overrides the retention periods.
+    Returns a CompactionResult.
+    """
+    from .models import VoiceService
+
+    services = VoiceService.objects.all()
+    if service_ids is not None:
+        services = services.filter(pk__in = service_ids)
+    services = list(services)
+    if service_ids is None:
+        services.append(None)
+
+    totals = CompactionResult(0, 0, 0)
+    for service in services:
+        result = compact_sessions(expired_sessions(service, days), batch_size, pause)
+        if result.sessions:
+            logger.info('Compacted %s call sessions of %s: %s steps, %s choices', result.sessions,
+                    service or 'no voice service', result.steps, result.choices)
+        totals = CompactionResult(*(total + count for total, count in zip(totals, result)))
+    return totals
+
+
+def schedule_compaction(service_ids = None):
+    """
+    Compacts the expired call history of the Voice Services with service_ids
+    in the background.
+    """
+    return retention_queue.submit(compact_expired_history, service_ids)
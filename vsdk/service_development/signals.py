@@ -0,0 +1,84 @@
+"""
+Signal receivers that keep the process-wide caches (see cache.py)
+consistent with the database.
+
+Signals only reach the process that made the change. For data that is
+shared by services (voice labels, languages, report contents), the
+ContentVersion is increased as well, which is part of the version of the
+call flow graphs (and the documents rendered from them) in all processes.
+"""
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Language, VoiceLabel, VoiceFragment
+from .models import ReportContent, RetrieveReportsFilter
+from .models import VoiceService, ContentVersion
+from .models import interface_voice_label_url_cache, supported_languages_cache
+from .accessibility import audio_accessibility_cache, cache_key
+from .callflow import call_flow_graph_cache
+from .validation import service_validation_cache
+from .vxml_cache import vxml_document_cache
+
+
+def voice_content_changed(fragments = (), language_id = None):
+    """
+    Invalidates the caches that depend on Voice Labels, Voice Fragments and
+    Languages, after fragments (or anything in the Language with
+    language_id, or all languages when it is None) changed. Called by the
+    receivers below, and after bulk operations, which do not send signals.
+    """
+    for fragment in fragments:
+        if fragment.audio:
+            audio_accessibility_cache.invalidate(cache_key(fragment.audio.storage, fragment.audio.name))
+    interface_voice_label_url_cache.invalidate(language_id)
+    ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+    call_flow_graph_cache.invalidate()
+    service_validation_cache.invalidate()
+    vxml_document_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=VoiceFragment)
+def voice_fragment_changed(sender, instance, **kwargs):
+    voice_content_changed([instance], instance.language_id)
+
+
+@receiver([post_save, post_delete], sender=VoiceLabel)
+def voice_label_changed(sender, instance, **kwargs):
+    voice_content_changed()
+
+
+@receiver([post_save, post_delete], sender=Language)
+def language_changed(sender, instance, **kwargs):
+    supported_languages_cache.invalidate()
+    voice_content_changed(language_id = instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ReportContent)
+@receiver([post_save, post_delete], sender=RetrieveReportsFilter)
+def call_flow_changed(sender, instance, **kwargs):
+    """
+    Rows that are part of a call flow graph, but are not elements (changes
+    to elements are detected through their modification date).
+    """
+    ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+    call_flow_graph_cache.invalidate()
+    vxml_document_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=VoiceService)
+def voice_service_changed(sender, instance, **kwargs):
+    supported_languages_cache.invalidate(instance.pk)
+    service_validation_cache.invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=VoiceService.supported_languages.through)
+def supported_languages_changed(sender, instance, reverse, action, **kwargs):
+    if action.startswith('post_'):
+        ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+    if reverse:
+        # Services were added to or removed from a Language
+        supported_languages_cache.invalidate()
+        service_validation_cache.invalidate()
+    else:
+        supported_languages_cache.invalidate(instance.pk)
+        service_validation_cache.invalidate(instance.pk)
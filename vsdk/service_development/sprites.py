@@ -0,0 +1,175 @@
+"""
+Pre-concatenated prompts ("audio sprites") of Choice menus.
+
+The prompt of a Choice consists of the voice label of the Choice, and for
+every option the pre choice option, option, post choice option and number
+fragments of the language. With CHOICE_MENU_SPRITES enabled, the whole
+prompt is concatenated into a single wave file, so the VoiceXML browser
+only has to fetch one file. Sprites are generated in the background and
+stored in CHOICE_MENU_SPRITE_DIR of the media storage. The name of a
+sprite contains a hash of the fragments it consists of, so changing a
+fragment results in a new sprite. Until a sprite is available, the
+individual fragments are used.
+
+Sprites can only be made of fragments in the local media storage, which
+all have to be 8 kHz, 16 bit, mono wave files.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import wave
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .background import BackgroundQueue
+from .cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# Channels, sample width (bytes) and frame rate of the fragments of a sprite
+SPRITE_WAVE_FORMAT = (1, 2, 8000)
+
+# Names of the sprites that are known to exist. A name contains the hash of
+# the fragments of the sprite, so an existing sprite never becomes outdated.
+available_sprite_cache = ProcessCache('choice menu sprites')
+# Names of the sprites that could not be generated, which are not generated
+# again until CHOICE_MENU_SPRITE_RETRY_INTERVAL seconds have passed
+failed_sprite_cache = ProcessCache('failed choice menu sprites',
+        ttl = getattr(settings, 'CHOICE_MENU_SPRITE_RETRY_INTERVAL', 300))
+# Names of the sprites that are being generated
+_generating = set()
+_generating_lock = threading.Lock()
+
+choice_menu_sprite_queue = BackgroundQueue('choice-menu-sprites', 'CHOICE_MENU_SPRITE_WORKERS')
+
+
+def sprites_enabled():
+    return getattr(settings, 'CHOICE_MENU_SPRITES', False)
+
+
+def choice_menu_prompt_urls(choice_element, language, graph):
+    """
+    Returns the URLs of the fragments of the prompt of a Choice, in the
+    order in which choice.xml plays them.
+    """
+    interface_urls = language.get_interface_voice_label_url_dict
+    numbers = language.get_interface_numbers_voice_label_url_list
+    urls = [graph.voice_fragment_url(choice_element, language)]
+    for number, choice_option in enumerate(graph.choice_options(choice_element), 1):
+        urls.append(interface_urls['pre_choice_option'])
+        urls.append(graph.voice_fragment_url(choice_option, language))
+        urls.append(interface_urls['post_choice_option'])
+        if number < len(numbers):
+            urls.append(numbers[number])
+    return urls
+
+
+def media_path(url):
+    """
+    Returns the local path of the media file at url, or None if it is not
+    stored in the local media storage.
+    """
+    path = unquote(urlsplit(url).path)
+    media_url = urlsplit(settings.MEDIA_URL).path
+    if not path.startswith(media_url):
+        return None
+    try:
+        return default_storage.path(path[len(media_url):])
+    except NotImplementedError:
+        return None
+
+
+def sprite_name(choice_element, language, urls):
+    digest = hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest()[:16]
+    return '%s/choice_%s_%s_%s.wav' % (getattr(settings, 'CHOICE_MENU_SPRITE_DIR', 'sprites'),
+            choice_element.pk, language.code, digest)
+
+
+def concatenate_wave_files(paths, destination):
+    """
+    Writes the concatenation of the wave files at paths to destination. The
+    file at destination is replaced atomically. Raises a ValueError when a
+    file is not in SPRITE_WAVE_FORMAT.
+    """
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok = True)
+    handle, temporary_path = tempfile.mkstemp(suffix = '.wav', dir = directory)
+    os.close(handle)
+    try:
+        sprite = wave.open(temporary_path, 'wb')
+        try:
+            sprite.setnchannels(SPRITE_WAVE_FORMAT[0])
+            sprite.setsampwidth(SPRITE_WAVE_FORMAT[1])
+            sprite.setframerate(SPRITE_WAVE_FORMAT[2])
+            for path in paths:
+                fragment = wave.open(path, 'rb')
+                try:
+                    if (fragment.getnchannels(), fragment.getsampwidth(), fragment.getframerate()) != SPRITE_WAVE_FORMAT:
+                        raise ValueError('%s is not an 8 kHz, 16 bit, mono wave file' % path)
+                    sprite.writeframes(fragment.readframes(fragment.getnframes()))
+                finally:
+                    fragment.close()
+        finally:
+            sprite.close()
+        os.replace(temporary_path, destination)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+def generate_sprite(name, paths):
+    try:
+        concatenate_wave_files(paths, default_storage.path(name))
+    except (OSError, ValueError, EOFError, wave.Error):
+        logger.exception('Could not generate choice menu sprite %s', name)
+        failed_sprite_cache.set(name, True)
+    finally:
+        with _generating_lock:
+            _generating.discard(name)
+
+
+def sprite_available(name):
+    if available_sprite_cache.lookup(name, False):
+        return True
+    if default_storage.exists(name):
+        available_sprite_cache.set(name, True)
+        return True
+    return False
+
+
+def choice_menu_sprite_url(choice_element, language, graph):
+    """
+    Returns the URL of the sprite of the prompt of a Choice in language, or
+    None if it is not available (yet), in which case it is generated in the
+    background.
+    """
+    if not sprites_enabled() or language is None:
+        return None
+    try:
+        urls = choice_menu_prompt_urls(choice_element, language, graph)
+    except IndexError:
+        # Missing Voice Fragments
+        return None
+    name = sprite_name(choice_element, language, urls)
+    # Sprites that are being generated, or failed recently, are not looked up in the storage
+    if name in _generating or failed_sprite_cache.lookup(name, False):
+        return None
+    if sprite_available(name):
+        return default_storage.url(name)
+
+    paths = [media_path(url) for url in urls]
+    if None in paths:
+        return None
+    with _generating_lock:
+        if name in _generating:
+            return None
+        _generating.add(name)
+    choice_menu_sprite_queue.submit(generate_sprite, name, paths)
+    # The sprite is generated right away when there are no workers
+    if sprite_available(name):
+        return default_storage.url(name)
+    return None
@@ -0,0 +1,166 @@
+"""
+Control of the telephony platform that serves the active Voice Service.
+
+Activating a service deactivates all other services in a single UPDATE,
+and points the dialplan of the telephony platform to the VoiceXML URL of
+the service. The dialplan is updated and reloaded in the background, after
+the activation has been committed; the progress is stored in the
+activation status of the service.
+
+The platform is controlled through the class in TELEPHONY_CONTROL, by
+default AsteriskControl. Tests use LocalTelephonyControl, which only
+remembers what it was asked to do.
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .background import BackgroundQueue
+
+logger = logging.getLogger(__name__)
+
+# Pool of worker threads updating the telephony platform. With
+# SERVICE_ACTIVATION_WORKERS set to 0, it is updated in the activating thread.
+activation_queue = BackgroundQueue('service-activation', 'SERVICE_ACTIVATION_WORKERS', default_workers = 1)
+
+
+class TelephonyControlError(Exception):
+    pass
+
+
+class TelephonyControl(object):
+    """
+    Interface to the telephony platform.
+    """
+
+    def point_to(self, vxml_url):
+        """
+        Makes incoming calls use the VoiceXML document at vxml_url, and
+        returns a message for the administrator. Raises a
+        TelephonyControlError when this is not possible.
+        """
+        raise NotImplementedError
+
+
+class AsteriskControl(TelephonyControl):
+    """
+    Rewrites the Vxml() application in ASTERISK_EXTENSIONS_FILE, and
+    reloads Asterisk with ASTERISK_RELOAD_COMMAND.
+    """
+    vxml_application = re.compile(r"(Vxml\()(.+)(\?callerid\=\$\{CALLERID\(num\)\}\))")
+
+    def point_to(self, vxml_url):
+        self.update_dialplan(settings.ASTERISK_EXTENSIONS_FILE, vxml_url)
+        self.reload()
+        return 'The Asterisk configuration has been changed to point to this service, and has been reloaded.'
+
+    def update_dialplan(self, path, vxml_url):
+        """
+        Replaces the file at path atomically with a version that points to
+        vxml_url.
+        """
+        try:
+            with open(path) as infile:
+                extensions = infile.read()
+        except OSError as error:
+            raise TelephonyControlError('The Asterisk configuration could not be read: %s' % error)
+        extensions = self.vxml_application.sub(lambda match: match.group(1) + vxml_url + match.group(3), extensions)
+
+        try:
+            handle, temporary_path = tempfile.mkstemp(dir = os.path.dirname(path), prefix = '.extensions')
+        except PermissionError:
+            # The directory is not writable, only the file itself
+            logger.warning('Could not replace %s atomically, writing it in place', path)
+            with open(path, 'w') as outfile:
+                outfile.write(extensions)
+            return
+        try:
+            with os.fdopen(handle, 'w') as outfile:
+                outfile.write(extensions)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            shutil.copymode(path, temporary_path)
+            os.replace(temporary_path, path)
+        except OSError as error:
+            os.remove(temporary_path)
+            raise TelephonyControlError('The Asterisk configuration could not be written: %s' % error)
+
+    def reload(self):
+        command = getattr(settings, 'ASTERISK_RELOAD_COMMAND', ['sudo', '/etc/init.d/asterisk', 'reload'])
+        try:
+            result = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                    universal_newlines = True, timeout = 60)
+        except (OSError, subprocess.TimeoutExpired) as error:
+            raise TelephonyControlError('Asterisk could not be reloaded: %s' % error)
+        if result.returncode != 0:
+            raise TelephonyControlError('Asterisk could not be reloaded: %s' % result.stdout.strip())
+
+
+class LocalTelephonyControl(TelephonyControl):
+    """
+    Stand-in for the telephony platform, which remembers the URLs it was
+    pointed to.
+    """
+    vxml_urls = []
+
+    def point_to(self, vxml_url):
+        self.vxml_urls.append(vxml_url)
+        return 'Pointed the local telephony stand-in to this service.'
+
+
+def get_telephony_control():
+    return import_string(getattr(settings, 'TELEPHONY_CONTROL',
+            'vsdk.service_development.telephony.AsteriskControl'))()
+
+
+def activate_voice_service(service):
+    """
+    Deactivates all other Voice Services, and points the telephony platform
+    to service in the background once the transaction is committed.
+    """
+    from .models import VoiceService
+
+    with transaction.atomic():
+        VoiceService.objects.exclude(pk = service.pk).filter(active = True).update(
+                active = False, modification_date = timezone.now())
+        service.activation_status = VoiceService.ACTIVATION_PENDING
+        service.activation_message = ''
+        VoiceService.objects.filter(pk = service.pk).update(active = True,
+                activation_status = service.activation_status, activation_message = '')
+        transaction.on_commit(lambda: activation_queue.submit(point_telephony_to, service.pk))
+
+
+def point_telephony_to(service_id):
+    """
+    Points the telephony platform to the Voice Service with service_id, and
+    stores the result in its activation status.
+    """
+    from .models import VoiceService
+
+    service = VoiceService.objects.filter(pk = service_id).first()
+    if service is None:
+        return None
+    vxml_url = getattr(settings, 'VXML_HOST_ADDRESS', '') + str(service.get_vxml_url())
+    try:
+        message = get_telephony_control().point_to(vxml_url)
+        status = VoiceService.ACTIVATION_DONE
+    except TelephonyControlError as error:
+        logger.error('Could not activate %s: %s', service, error)
+        message = str(error)
+        status = VoiceService.ACTIVATION_FAILED
+    except Exception as error:
+        logger.exception('Could not activate %s', service)
+        message = str(error)
+        status = VoiceService.ACTIVATION_FAILED
+    # Only when the service is still pending, it might have been activated again
+    VoiceService.objects.filter(pk = service_id, activation_status = VoiceService.ACTIVATION_PENDING).update(
+            activation_status = status, activation_message = message[:1000])
+    return status
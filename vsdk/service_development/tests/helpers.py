@@ -1,3 +1,6 @@
+import io
+import os
+import wave
 from xml.etree import ElementTree as ET
 
 import mock
@@ -80,3 +83,138 @@ def create_sample_voice_service(cls):
 
 
 
+def create_language_with_fragments(**kwargs):
+    """
+    Creates a Language of which all interface voice labels have a Voice Fragment.
+    """
+    from mixer.backend.django import mixer
+    language = mixer.blend('service_development.Language', **kwargs)
+    for field in Language.interface_voice_label_fields + Language.interface_number_fields:
+        VoiceFragment.objects.create(
+                parent = getattr(language, field),
+                language = language,
+                audio = '%s_%s.wav' % (field, language.code))
+    return language
+
+
+def create_voice_label(name, *languages):
+    voice_label = VoiceLabel.objects.create(name = name)
+    for language in languages:
+        VoiceFragment.objects.create(
+                parent = voice_label,
+                language = language,
+                audio = '%s_%s.wav' % (name, language.code))
+    return voice_label
+
+
+def create_call_flow(cls):
+    """
+    Creates a voice service in which every element type is used:
+
+    welcome message -> question (choice) -> option 1 -> recording -> report -> retrieve reports -> goodbye message
+                                         -> option 2 -> goodbye message
+    """
+    from ..models import MessagePresentation, Record, Report, ReportContent
+    from ..models import RetrieveReports, RetrieveReportsFilter, UserInputCategory
+
+    cls.language = create_language_with_fragments(code = 'en')
+    cls.voice_service = VoiceService.objects.create(
+            name = "call flow",
+            description = "all elements",
+            active = True,
+            registration = 'disabled')
+    cls.voice_service.supported_languages.add(cls.language)
+
+    def label(name):
+        return create_voice_label(name, cls.language)
+
+    cls.goodbye = MessagePresentation.objects.create(name = "goodbye",
+            service = cls.voice_service,
+            voice_label = label("goodbye"),
+            final_element = True)
+    cls.question = Choice.objects.create(name = "question",
+            service = cls.voice_service,
+            voice_label = label("question"))
+    cls.record = Record.objects.create(name = "recording",
+            service = cls.voice_service,
+            voice_label = label("record"),
+            not_heard_voice_label = label("not heard"),
+            repeat_voice_label = label("repeat"),
+            ask_confirmation_voice_label = label("confirm recording"),
+            final_voice_label = label("thanks"),
+            input_category = UserInputCategory.objects.create(name = "messages", service = cls.voice_service))
+    cls.report = Report.objects.create(name = "report",
+            service = cls.voice_service,
+            voice_label = label("report"),
+            ask_confirmation_voice_label = label("confirm report"))
+    cls.retrieve_reports = RetrieveReports.objects.create(name = "retrieve",
+            service = cls.voice_service,
+            voice_label = label("retrieve"),
+            pre_report_voice_label = label("pre report"),
+            no_reports_voice_label = label("no reports"),
+            report_element = cls.report,
+            _redirect = cls.goodbye)
+    cls.report._redirect_yes = cls.retrieve_reports
+    cls.report._redirect_no = cls.goodbye
+    cls.report.save()
+    cls.record._redirect = cls.report
+    cls.record.save()
+    cls.option1 = ChoiceOption.objects.create(name = "option1",
+            service = cls.voice_service,
+            parent = cls.question,
+            voice_label = label("option 1"),
+            _redirect = cls.record)
+    cls.option2 = ChoiceOption.objects.create(name = "option2",
+            service = cls.voice_service,
+            parent = cls.question,
+            voice_label = label("option 2"),
+            _redirect = cls.goodbye)
+    cls.welcome = MessagePresentation.objects.create(name = "welcome",
+            service = cls.voice_service,
+            voice_label = label("welcome"),
+            _redirect = cls.question)
+    ReportContent.objects.create(name = "question",
+            parent = cls.report,
+            content = cls.question,
+            voice_label = label("report question"))
+    ReportContent.objects.create(name = "recording",
+            parent = cls.report,
+            content = cls.record,
+            voice_label = label("report recording"))
+    RetrieveReportsFilter.objects.create(name = "question",
+            parent = cls.retrieve_reports,
+            choice_element = cls.question,
+            service = cls.voice_service)
+    cls.voice_service._start_element = cls.welcome
+    cls.voice_service.save()
+
+    cls.session = CallSession.objects.create(service = cls.voice_service,
+            _language = cls.language)
+
+
+def wave_bytes(channels = 1, sample_rate = 8000, sample_width = 2, frames = 80):
+    """
+    Returns the contents of a silent wave file.
+    """
+    data = io.BytesIO()
+    wave_file = wave.open(data, 'wb')
+    wave_file.setnchannels(channels)
+    wave_file.setframerate(sample_rate)
+    wave_file.setsampwidth(sample_width)
+    wave_file.writeframes(b'\0' * channels * sample_width * frames)
+    wave_file.close()
+    return data.getvalue()
+
+
+def store_voice_fragment_files():
+    """
+    Writes a wave file for every Voice Fragment to the media storage, so
+    they pass validation. Use with a temporary MEDIA_ROOT.
+    """
+    from ..accessibility import audio_accessibility_cache
+    audio_accessibility_cache.invalidate()
+    for voice_fragment in VoiceFragment.objects.all():
+        path = voice_fragment.audio.path
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as audio:
+            audio.write(wave_bytes())
@@ -0,0 +1,54 @@
+import tempfile
+
+import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db.models.fields.files import FieldFile
+from django.test import TestCase
+
+from ..accessibility import audio_accessibility_cache, check_audio_files, audio_file_accessible
+from ..models import VoiceFragment
+
+
+class TestAudioAccessibility(TestCase):
+
+    def setUp(self):
+        audio_accessibility_cache.invalidate()
+        self.field = VoiceFragment._meta.get_field('audio')
+
+    def check(self, storage, *names):
+        field_files = [FieldFile(None, self.field, name) for name in names]
+        for field_file in field_files:
+            field_file.storage = storage
+        results = check_audio_files(field_files)
+        return [results[(id(storage), name)] for name in names]
+
+    def test_directories_are_listed_once(self):
+        storage = FileSystemStorage(location = tempfile.mkdtemp())
+        storage.save('a/1.wav', ContentFile(b'1'))
+        with mock.patch.object(storage, 'listdir', wraps = storage.listdir) as listdir:
+            assert self.check(storage, 'a/1.wav', 'a/2.wav', 'b/3.wav') == [True, False, False]
+        assert listdir.call_count == 2
+
+    def test_results_are_cached(self):
+        storage = FileSystemStorage(location = tempfile.mkdtemp())
+        with mock.patch.object(storage, 'listdir', wraps = storage.listdir) as listdir:
+            self.check(storage, '1.wav')
+            self.check(storage, '1.wav')
+            assert listdir.call_count == 1
+            with mock.patch.object(audio_accessibility_cache, 'ttl', 0):
+                self.check(storage, '1.wav')
+            assert listdir.call_count == 2
+
+    @mock.patch('vsdk.service_development.accessibility.url_accessible')
+    def test_storage_without_listing_uses_head_requests(self, url_accessible):
+        url_accessible.side_effect = lambda url: url.endswith('1.wav')
+        storage = mock.MagicMock(spec = Storage, name = 'StorageMock')
+        storage.listdir.side_effect = NotImplementedError()
+        storage.url.side_effect = lambda name: 'http://example.com/' + name
+        assert self.check(storage, '1.wav', '2.wav') == [True, False]
+        assert sorted(call[0][0] for call in url_accessible.call_args_list) == [
+                'http://example.com/1.wav', 'http://example.com/2.wav']
+
+    def test_empty_field_file(self):
+        assert not audio_file_accessible(FieldFile(None, self.field, None))
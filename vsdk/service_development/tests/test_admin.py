@@ -0,0 +1,169 @@
+import re
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from mixer.backend.django import mixer
+
+from ..cache import ProcessCache
+from ..models import *
+
+from .helpers import create_call_flow, create_language_with_fragments
+
+
+@override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+class TestCallSessionAdmin(TestCase):
+    client = Client()
+
+    def setUp(self):
+        create_call_flow(self)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.session.user = KasaDakaUser.objects.create(caller_id = '0123', service = self.voice_service,
+                language = self.language)
+        self.session.save()
+
+    def record_call(self, session, hops):
+        elements = [self.welcome, self.question, self.record, self.report, self.goodbye]
+        for i in range(hops):
+            session.record_step(elements[i % len(elements)])
+            if i % 5 == 1:
+                session.record_choice(self.question, self.option1)
+
+    def change_view_queries(self, session, query = ''):
+        url = reverse('admin:service_development_callsession_change', args = [session.pk]) + query
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == 200
+        return response, len(queries)
+
+    def test_change_view_queries_do_not_grow(self):
+        short_call = CallSession.objects.create(service = self.voice_service, user = self.session.user)
+        self.record_call(short_call, 10)
+        self.record_call(self.session, 300)
+
+        short_queries = self.change_view_queries(short_call)[1]
+        response, queries = self.change_view_queries(self.session)
+        assert queries == short_queries
+        assert b'1&ndash;50 / 300' in response.content
+        assert b'?steps-page=2' in response.content
+
+    def test_change_view_pages(self):
+        self.record_call(self.session, 120)
+        response, queries = self.change_view_queries(self.session, '?steps-page=3')
+        assert b'101&ndash;120 / 120' in response.content
+        last_step = CallSessionStep.objects.filter(session = self.session).order_by('time', 'pk').last()
+        assert str(last_step.visited_element).encode() in response.content
+
+    def test_post_from_page(self):
+        self.record_call(self.session, 120)
+        response = self.change_view_queries(self.session, '?steps-page=2')[0]
+        content = response.content.decode('utf-8')
+        # The hidden inputs (management forms, ids of the shown rows, pages) of the change form
+        data = dict(re.findall(r'<input type="hidden" name="([^"]+)" value="([^"]*)"', content))
+        assert data['steps-page'] == '2'
+        assert data['steps-0-id'] == str(CallSessionStep.objects.filter(
+                session = self.session).order_by('time', 'pk')[50].pk)
+        # Submitted without the query string, the rows are bound to the page that was shown
+        url = reverse('admin:service_development_callsession_change', args = [self.session.pk])
+        response = self.client.post(url, data)
+        assert response.status_code == 302, response.context['inline_admin_formsets'][0].formset.errors
+        request = RequestFactory().post(url, data)
+        request.user = User.objects.get(username = 'admin')
+        inline = admin.site._registry[CallSession].get_inline_instances(request, self.session)[0]
+        formset = inline.get_formset(request, self.session)(data, instance = self.session)
+        assert [form.instance.pk for form in formset] == [int(data['steps-%s-id' % i]) for i in range(50)]
+        assert formset.page.number == 2
+
+    def test_changelist(self):
+        for i in range(5):
+            session = CallSession.objects.create(service = self.voice_service, user = self.session.user)
+            self.record_call(session, 3)
+        url = reverse('admin:service_development_callsession_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            assert self.client.get(url).status_code == 200
+        few_sessions = len(queries)
+        for i in range(5):
+            CallSession.objects.create(service = self.voice_service, user = self.session.user)
+        with CaptureQueriesContext(connection) as queries:
+            assert self.client.get(url).status_code == 200
+        assert len(queries) == few_sessions
+        # The language of sessions is not determined (and saved) while listing
+        assert not [query for query in queries if query['sql'].startswith('UPDATE')]
+
+
+@override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+class TestChangelistQueries(TestCase):
+    """The changelists of all registered models use a fixed number of queries"""
+    client = Client()
+
+    def setUp(self):
+        ProcessCache.invalidate_all()
+        create_call_flow(self)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.user = KasaDakaUser.objects.create(caller_id = '0123', service = self.voice_service,
+                language = self.language)
+        self.category = self.record.input_category
+
+    def create_row(self, model, i):
+        """Creates a row of model, related to the call flow"""
+        now = timezone.now() - timedelta(hours = i)
+        session = CallSession.objects.create(service = self.voice_service, user = self.user)
+        service = self.voice_service
+        label = self.welcome.voice_label
+        factories = {
+            VoiceService: lambda: mixer.blend(VoiceService, name = 'service %s' % i),
+            MessagePresentation: lambda: MessagePresentation.objects.create(name = 'message %s' % i,
+                    service = service, voice_label = label),
+            Choice: lambda: Choice.objects.create(name = 'choice %s' % i, service = service, voice_label = label),
+            Record: lambda: mixer.blend(Record, service = service),
+            Report: lambda: Report.objects.create(name = 'report %s' % i, service = service, voice_label = label),
+            RetrieveReports: lambda: mixer.blend(RetrieveReports, service = service, report_element = self.report),
+            CallSession: lambda: session,
+            CallTrace: lambda: CallTrace.objects.create(session = session, start = now),
+            CallRollup: lambda: CallRollup.objects.create(service = service, period = 'hour', start = now),
+            ElementRollup: lambda: ElementRollup.objects.create(service = service, period = 'hour', start = now,
+                    element = self.welcome),
+            ChoiceOptionRollup: lambda: ChoiceOptionRollup.objects.create(service = service, period = 'hour',
+                    start = now, choice_option = self.option1),
+            KasaDakaUser: lambda: KasaDakaUser.objects.create(caller_id = str(i), service = service,
+                    language = self.language),
+            Language: lambda: create_language_with_fragments(code = 'l%s' % i),
+            VoiceLabel: lambda: VoiceLabel.objects.create(name = 'label %s' % i),
+            SpokenUserInput: lambda: SpokenUserInput.objects.create(audio = 'uploads/%s.wav' % i, session = session,
+                    category = self.category),
+            UserInputCategory: lambda: UserInputCategory.objects.create(name = 'category %s' % i, service = service),
+            UserReport: lambda: UserReport.objects.create(session = session, report_element = self.report),
+        }
+        return factories[model]()
+
+    def changelist_queries(self, model):
+        """
+        Returns the number of queries of the first request of the changelist
+        of model, with empty caches, and of the second request.
+        """
+        url = reverse('admin:service_development_%s_changelist' % model._meta.model_name)
+        counts = []
+        ProcessCache.invalidate_all()
+        for request in range(2):
+            # Caches (e.g. of the validation of services) are filled by the first request
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            assert response.status_code == 200
+            counts.append(len(queries))
+        return tuple(counts)
+
+    def test_changelists(self):
+        models = [model for model in admin.site._registry if model._meta.app_label == 'service_development']
+        assert len(models) == 17
+        for model in models:
+            for i in range(2):
+                self.create_row(model, i)
+            few_rows = self.changelist_queries(model)
+            for i in range(2, 12):
+                self.create_row(model, i)
+            assert self.changelist_queries(model) == few_rows, model
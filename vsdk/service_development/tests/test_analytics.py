@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..analytics import period_start, update_rollups, watermark
+from ..models import CallRollup, CallSession, ChoiceOptionRollup, ElementRollup, UserReport
+from ..retention import compact_sessions, expired_sessions
+
+from .helpers import create_call_flow
+
+
+class TestAnalytics(TestCase):
+    client = Client()
+
+    def setUp(self):
+        create_call_flow(self)
+        self.start = timezone.make_aware(datetime(2020, 3, 2, 10, 15))
+        CallSession.objects.filter(pk = self.session.pk).update(start = self.start - timedelta(hours = 1))
+
+    def call(self, start, elements, option = None, report = False, minutes = 2):
+        session = CallSession.objects.create(service = self.voice_service, _language = self.language)
+        for element in elements:
+            session.record_step(element)
+        if option is not None:
+            session.record_choice(self.question, option)
+        if report:
+            UserReport.objects.create(session = session, report_element = self.report)
+        CallSession.objects.filter(pk = session.pk).update(start = start, end = start + timedelta(minutes = minutes))
+        return session
+
+    def test_period_start(self):
+        time = timezone.make_aware(datetime(2020, 3, 2, 0, 30))
+        assert period_start(time, 'hour') == timezone.make_aware(datetime(2020, 3, 2, 0, 0))
+        assert period_start(time, 'day') == timezone.make_aware(datetime(2020, 3, 2))
+
+    def test_update_rollups(self):
+        self.call(self.start, [self.welcome, self.question, self.record, self.report], self.option1, report = True)
+        self.call(self.start + timedelta(minutes = 10), [self.welcome, self.question, self.goodbye], self.option2,
+                minutes = 1)
+        assert update_rollups() == 3
+        assert watermark() == CallSession.objects.latest('pk').pk
+
+        hour = CallRollup.objects.get(period = 'hour', start = self.start.replace(minute = 0))
+        assert (hour.calls, hour.timed_calls, hour.reports) == (2, 2, 1)
+        assert hour.mean_duration == 90
+        day = CallRollup.objects.get(period = 'day')
+        assert day.calls == 3
+
+        visits = dict(ElementRollup.objects.filter(period = 'day').values_list('element_id', 'visits'))
+        assert visits == {self.welcome.pk: 2, self.question.pk: 2, self.record.pk: 1, self.report.pk: 1,
+                self.goodbye.pk: 1}
+        exits = dict(ElementRollup.objects.filter(period = 'day', exits__gt = 0).values_list('element_id', 'exits'))
+        assert exits == {self.report.pk: 1, self.goodbye.pk: 1}
+        selections = dict(ChoiceOptionRollup.objects.filter(period = 'hour').values_list('choice_option_id', 'selections'))
+        assert selections == {self.option1.pk: 1, self.option2.pk: 1}
+
+        # Only new sessions are added, to the existing rollups
+        assert update_rollups() == 0
+        self.call(self.start + timedelta(minutes = 20), [self.welcome])
+        with self.assertNumQueries(14):
+            assert update_rollups() == 1
+        assert ElementRollup.objects.get(period = 'hour', element = self.welcome, start = hour.start).visits == 3
+        assert ElementRollup.objects.get(period = 'hour', element = self.welcome, start = hour.start).exits == 1
+
+    def test_active_sessions_wait(self):
+        self.call(self.start, [self.welcome])
+        active = self.call(timezone.now(), [self.welcome])
+        self.call(self.start, [self.welcome])
+        assert update_rollups() == 2
+        assert watermark() == active.pk - 1
+
+    def test_chunks(self):
+        for i in range(5):
+            self.call(self.start, [self.welcome])
+        assert update_rollups(chunk_size = 2) == 6
+        assert CallRollup.objects.get(period = 'day').calls == 6
+
+    def test_rebuild_from_archives(self):
+        for i in range(3):
+            self.call(self.start, [self.welcome, self.question], self.option2)
+        update_rollups()
+        compact_sessions(expired_sessions(self.voice_service, days = 30), pause = 0)
+        ElementRollup.objects.all().update(visits = 0)
+
+        out = StringIO()
+        call_command('update_call_analytics', rebuild = True, chunk_size = 2, stdout = out)
+        assert 'Added 4 call sessions' in out.getvalue()
+        assert ElementRollup.objects.get(period = 'day', element = self.question).visits == 3
+        assert ChoiceOptionRollup.objects.get(period = 'day', choice_option = self.option2).selections == 3
+
+    @override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin(self):
+        self.call(self.start, [self.welcome, self.goodbye])
+        update_rollups()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        for model in ('callrollup', 'elementrollup', 'choiceoptionrollup'):
+            response = self.client.get(reverse('admin:service_development_%s_changelist' % model))
+            assert response.status_code == 200
+        response = self.client.get(reverse('admin:service_development_elementrollup_changelist'))
+        assert b'100%' in response.content
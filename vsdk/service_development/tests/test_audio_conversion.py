@@ -0,0 +1,103 @@
+import tempfile
+from io import StringIO
+
+import mock
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+
+from ..audio_conversion import convert_voice_fragment
+from ..models import VoiceFragment
+
+from .helpers import create_language_with_fragments, create_voice_label
+
+
+@override_settings(KASADAKA = True, AUDIO_CONVERSION_WORKERS = 0, MEDIA_ROOT = tempfile.mkdtemp())
+class TestAudioConversion(TestCase):
+
+    def setUp(self):
+        with override_settings(KASADAKA = False):
+            self.language = create_language_with_fragments(code = 'en')
+            self.voice_label = create_voice_label('welcome', self.language)
+        self.fragment = VoiceFragment.objects.get(parent = self.voice_label)
+
+    def upload(self, name = 'upload.wav'):
+        self.fragment.audio = name
+        # The fragment and the content version (see signals.py)
+        with self.assertNumQueries(2):
+            self.fragment.save()
+        return self.fragment
+
+    def test_saving_new_audio_queues_conversion(self):
+        assert self.fragment.conversion_status == VoiceFragment.CONVERSION_CONVERTED
+        self.upload()
+        assert VoiceFragment.objects.get(pk = self.fragment.pk).conversion_status == VoiceFragment.CONVERSION_PENDING
+
+    def test_saving_same_audio_does_not_queue_conversion(self):
+        self.fragment.save()
+        assert self.fragment.conversion_status == VoiceFragment.CONVERSION_CONVERTED
+
+    @override_settings(KASADAKA = False)
+    def test_no_conversion_without_kasadaka(self):
+        self.upload()
+        assert self.fragment.conversion_status == VoiceFragment.CONVERSION_CONVERTED
+
+    @mock.patch('vsdk.service_development.models.validators.validate_audio_file_format', return_value = True)
+    def test_correct_format(self, validate):
+        self.upload()
+        assert convert_voice_fragment(self.fragment.pk) == VoiceFragment.CONVERSION_CONVERTED
+        fragment = VoiceFragment.objects.get(pk = self.fragment.pk)
+        assert fragment.audio.name == 'upload.wav'
+        assert fragment.conversion_status == VoiceFragment.CONVERSION_CONVERTED
+
+    @mock.patch('vsdk.service_development.audio_conversion.convert_audio_file')
+    @mock.patch('vsdk.service_development.models.validators.validate_audio_file_format', return_value = False)
+    def test_conversion(self, validate, convert):
+        self.upload()
+        receiver = mock.MagicMock()
+        post_save.connect(receiver, sender = VoiceFragment)
+        try:
+            assert convert_voice_fragment(self.fragment.pk) == VoiceFragment.CONVERSION_CONVERTED
+        finally:
+            post_save.disconnect(receiver, sender = VoiceFragment)
+        assert convert.call_args[0][1].endswith('upload_conv.wav')
+        fragment = VoiceFragment.objects.get(pk = self.fragment.pk)
+        assert fragment.audio.name == 'upload_conv.wav'
+        # Caches are invalidated
+        assert receiver.call_args[1]['instance'].audio.name == 'upload_conv.wav'
+        # Already converted
+        assert convert_voice_fragment(self.fragment.pk) is None
+
+    @mock.patch('vsdk.service_development.audio_conversion.convert_audio_file', side_effect = OSError('sox: broken'))
+    @mock.patch('vsdk.service_development.models.validators.validate_audio_file_format', return_value = False)
+    def test_failed_conversion(self, validate, convert):
+        self.upload()
+        assert convert_voice_fragment(self.fragment.pk) == VoiceFragment.CONVERSION_FAILED
+        fragment = VoiceFragment.objects.get(pk = self.fragment.pk)
+        assert fragment.audio.name == 'upload.wav'
+        assert fragment.conversion_error == 'sox: broken'
+
+    @mock.patch('vsdk.service_development.models.validators.validate_audio_file_format', return_value = False)
+    def test_audio_replaced_while_converting(self, validate):
+        self.upload()
+
+        def replace_audio(path, new_path):
+            VoiceFragment.objects.filter(
+                    pk = self.fragment.pk).update(audio = 'other.wav', conversion_status = VoiceFragment.CONVERSION_PENDING)
+
+        with mock.patch('vsdk.service_development.audio_conversion.convert_audio_file', side_effect = replace_audio):
+            assert convert_voice_fragment(self.fragment.pk) is None
+        fragment = VoiceFragment.objects.get(pk = self.fragment.pk)
+        assert fragment.audio.name == 'other.wav'
+        assert fragment.conversion_status == VoiceFragment.CONVERSION_PENDING
+
+    @mock.patch('vsdk.service_development.models.validators.validate_audio_file_format', return_value = True)
+    def test_command(self, validate):
+        self.upload()
+        VoiceFragment.objects.filter(parent = self.language.voice_label).update(
+                conversion_status = VoiceFragment.CONVERSION_CONVERTING)
+        call_command('process_audio_conversions', stdout = StringIO())
+        assert VoiceFragment.objects.get(pk = self.fragment.pk).conversion_status == VoiceFragment.CONVERSION_CONVERTED
+        assert VoiceFragment.objects.filter(conversion_status = VoiceFragment.CONVERSION_CONVERTING).count() == 1
+        call_command('process_audio_conversions', requeue_stale = True, stdout = StringIO())
+        assert not VoiceFragment.objects.exclude(conversion_status = VoiceFragment.CONVERSION_CONVERTED).exists()
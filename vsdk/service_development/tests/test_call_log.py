@@ -0,0 +1,123 @@
+import tempfile
+import threading
+
+import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+
+from ..call_log import call_log_buffer, flush_call_log
+from ..models import CallSession, CallSessionStep, CallSessionChoice, UserReport
+
+from .helpers import create_call_flow
+
+
+@override_settings(CALL_LOG_WRITE_BEHIND = True, CALL_LOG_FLUSH_INTERVAL = 0)
+class TestWriteBehindCallLog(TestCase):
+    client = Client()
+
+    def setUp(self):
+        create_call_flow(self)
+
+    def tearDown(self):
+        flush_call_log()
+
+    def test_steps_written_on_flush(self):
+        self.session.record_step(self.welcome)
+        self.session.record_step(self.question)
+        self.session.record_choice(self.question, self.option1)
+        assert CallSessionStep.objects.count() == 0
+        assert CallSessionChoice.objects.count() == 0
+        times = [step.time for step in call_log_buffer._steps]
+
+        # Savepoint, update of the session end, two bulk inserts and release
+        with self.assertNumQueries(5):
+            flush_call_log()
+        steps = CallSessionStep.objects.filter(session = self.session).order_by('time')
+        assert [step.visited_element for step in steps] == [self.welcome, self.question]
+        assert [step.time for step in steps] == times, 'Time of the hop should be preserved'
+        assert CallSession.objects.get(pk = self.session.pk).end == self.session.end
+        assert CallSessionChoice.objects.get().choice_option_selected == self.option1
+
+    def test_requeued_when_database_is_locked(self):
+        self.session.record_step(self.welcome)
+        self.session.record_choice(self.question, self.option1)
+        with mock.patch.object(CallSessionStep.objects, 'bulk_create', side_effect = OperationalError('database is locked')):
+            flush_call_log()
+        assert CallSessionStep.objects.count() == 0
+        assert len(call_log_buffer) == 2
+
+        self.session.record_step(self.question)
+        flush_call_log()
+        steps = CallSessionStep.objects.filter(session = self.session).order_by('time')
+        assert [step.visited_element for step in steps] == [self.welcome, self.question]
+        assert CallSessionChoice.objects.count() == 1
+        assert CallSession.objects.get(pk = self.session.pk).end == self.session.end
+
+    def test_written_one_by_one_when_bulk_insert_fails(self):
+        self.session.record_step(self.welcome)
+        self.session.record_choice(self.question, self.option1)
+        with mock.patch.object(CallSessionChoice.objects, 'bulk_create', side_effect = ValueError):
+            flush_call_log()
+        assert len(call_log_buffer) == 0
+        assert CallSessionStep.objects.count() == 1
+        assert CallSessionChoice.objects.count() == 1
+
+    @override_settings(CALL_LOG_MAX_BUFFERED = 3)
+    def test_flush_when_buffer_full(self):
+        for i in range(3):
+            self.session.record_step(self.welcome)
+        assert CallSessionStep.objects.count() == 3
+        assert len(call_log_buffer) == 0
+
+    def test_flush_at_end_of_call(self):
+        self.client.get(self.welcome.get_absolute_url(self.session))
+        assert CallSessionStep.objects.count() == 0
+        self.client.get(self.goodbye.get_absolute_url(self.session))
+        assert CallSessionStep.objects.count() == 2
+
+    @override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+    def test_report_reads_consistent_call_log(self):
+        self.client.get(self.welcome.get_absolute_url(self.session))
+        self.client.post(self.question.get_absolute_url(self.session), {'option_id': self.option1.id})
+        recording = SimpleUploadedFile('recording.wav', b'RIFF', content_type = 'audio/wav')
+        self.client.post(self.record.get_absolute_url(self.session),
+                {'recording': recording, 'redirect': self.report.get_absolute_url(self.session)})
+        assert len(call_log_buffer) > 0
+        self.client.post(self.report.get_absolute_url(self.session))
+        assert UserReport.objects.get().choices.get().choice_option_selected == self.option1
+
+
+@override_settings(CALL_LOG_WRITE_BEHIND = True, CALL_LOG_FLUSH_INTERVAL = 0)
+class TestConcurrentCallLogFlush(TransactionTestCase):
+
+    def setUp(self):
+        create_call_flow(self)
+
+    def tearDown(self):
+        flush_call_log()
+
+    def test_flush_waits_for_timed_flush(self):
+        self.session.record_step(self.welcome)
+        writing = threading.Event()
+        bulk_create = CallSessionStep.objects.bulk_create
+
+        def slow_bulk_create(steps):
+            writing.set()
+            # Give the other thread time to flush while the rows are being written
+            threading.Timer(0.2, done.set).start()
+            done.wait(5)
+            return bulk_create(steps)
+
+        done = threading.Event()
+        with mock.patch.object(CallSessionStep.objects, 'bulk_create', side_effect = slow_bulk_create):
+            timer = threading.Thread(target = call_log_buffer._timed_flush)
+            timer.start()
+            assert writing.wait(5)
+            # The buffer is empty, but the steps have not been written yet
+            assert len(call_log_buffer) == 0
+            start_time = self.session.iteration_start_time(self.welcome.pk)
+            assert done.is_set()
+            timer.join()
+        assert start_time == CallSessionStep.objects.get().time
@@ -0,0 +1,108 @@
+from io import StringIO
+
+import mock
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..admin import format_trace_waterfall
+from ..cache import ProcessCache
+from ..call_trace import call_trace_buffer, merge_hops
+from ..models import CallSession, CallTrace
+
+from .helpers import create_call_flow
+
+
+class TestMergeHops(TestCase):
+
+    def test_merge(self):
+        trace = merge_hops(CallTrace(), [(100.5, 20.0, 5.0, 3, 'choice', 200), (100.0, 10.0, 2.0, 2, 'voice-service', 302)])
+        assert [hop.view for hop in trace.hop_list()] == ['voice-service', 'choice']
+        assert trace.hop_count == 2
+        assert trace.gap_time == 490
+
+        merge_hops(trace, [(103.0, 30.0, 10.0, 4, 'record', 200)])
+        hops = trace.hop_list()
+        assert [hop.offset for hop in hops] == [0, 500, 3000]
+        assert hops[2].gap == 2480
+        assert trace.server_time == 60
+        assert trace.db_time == 17
+        assert trace.queries == 9
+
+
+@override_settings(CALL_TRACING = True, CALL_TRACE_FLUSH_INTERVAL = 0)
+class TestCallTracing(TestCase):
+    client = Client()
+
+    def setUp(self):
+        ProcessCache.invalidate_all()
+        create_call_flow(self)
+
+    def call(self):
+        response = self.client.get(reverse('service-development:voice-service', args = [self.voice_service.id]),
+                {'caller_id': '+31612345678'})
+        session = CallSession.objects.latest('pk')
+        self.client.get(response['Location'])
+        call_trace_buffer.flush()
+        return session
+
+    def test_hops_are_traced(self):
+        session = self.call()
+        trace = CallTrace.objects.get(session = session)
+        assert [hop.view for hop in trace.hop_list()] == ['voice-service', 'message-presentation']
+        assert trace.queries == sum(hop.queries for hop in trace.hop_list())
+        assert trace.queries > 0
+        assert 'message-presentation' in format_trace_waterfall(trace)
+
+    def test_top_call_overhead(self):
+        session = self.call()
+        output = StringIO()
+        call_command('top_call_overhead', order = 'per-request', stdout = output)
+        assert str(session.pk) in output.getvalue()
+
+    def test_requeued_when_database_is_locked(self):
+        call_trace_buffer.add(self.session.pk, 100.0, 10.0, 2.0, 2, 'voice-service', 302)
+        with mock.patch.object(CallTrace.objects, 'bulk_create', side_effect = OperationalError('database is locked')):
+            call_trace_buffer.flush()
+        assert not CallTrace.objects.exists()
+        assert len(call_trace_buffer) == 1
+
+        call_trace_buffer.add(self.session.pk, 100.5, 20.0, 5.0, 3, 'choice', 200)
+        call_trace_buffer.flush()
+        trace = CallTrace.objects.get(session = self.session)
+        assert [hop.view for hop in trace.hop_list()] == ['voice-service', 'choice']
+
+    def test_trace_created_by_other_process(self):
+        select_for_update = CallTrace.objects.select_for_update
+        reads = []
+
+        def read_before_other_process():
+            # The first read does not see the trace created by the other process
+            reads.append(True)
+            return CallTrace.objects.none() if len(reads) == 1 else select_for_update()
+
+        merge_hops(CallTrace(session = self.session), [(100.0, 10.0, 2.0, 2, 'voice-service', 302)]).save()
+        call_trace_buffer.add(self.session.pk, 100.5, 20.0, 5.0, 3, 'choice', 200)
+        with mock.patch.object(CallTrace.objects, 'select_for_update', side_effect = read_before_other_process):
+            call_trace_buffer.flush()
+        trace = CallTrace.objects.get(session = self.session)
+        assert [hop.view for hop in trace.hop_list()] == ['voice-service', 'choice']
+        assert len(call_trace_buffer) == 0
+
+    @override_settings(CALL_TRACING = False)
+    def test_disabled(self):
+        self.call()
+        assert not CallTrace.objects.exists()
+
+    @override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_waterfall(self):
+        from django.contrib.auth.models import User
+        session = self.call()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        response = self.client.get(reverse('admin:service_development_callsession_change', args = [session.pk]))
+        assert response.status_code == 200
+        assert b'message-presentation' in response.content
+        response = self.client.get(reverse('admin:service_development_calltrace_changelist'))
+        assert response.status_code == 200
@@ -0,0 +1,101 @@
+import tempfile
+from xml.etree import ElementTree as ET
+
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..callflow import get_call_flow_graph, call_flow_graph_cache
+from ..models import Choice, ContentVersion, MessagePresentation, UserReport, VoiceFragment
+
+from .helpers import create_call_flow
+
+
+class TestCallFlowGraph(TestCase):
+    client = Client()
+
+    def setUp(self):
+        call_flow_graph_cache.invalidate()
+        create_call_flow(self)
+
+    def test_graph(self):
+        graph = get_call_flow_graph(self.voice_service.id)
+        assert graph.start_element == self.welcome
+        assert isinstance(graph.start_element, MessagePresentation)
+        assert graph.redirect(graph.start_element) == self.question
+        question = graph.element(self.question.id, Choice)
+        assert question == self.question
+        assert graph.element(self.question.id, MessagePresentation) is None
+        assert graph.choice_options(question) == (self.option1, self.option2)
+        assert graph.redirect(graph.choice_options(question)[0]) == self.record
+        report = graph.redirect(graph.element(self.record.id))
+        assert graph.redirect(report, '_redirect_yes') == self.retrieve_reports
+        assert graph.redirect(report, '_redirect_no') == self.goodbye
+        assert len(graph.report_contents(report)) == 2
+        assert graph.voice_fragment_url(question, self.language) == self.question.get_voice_fragment_url(self.language)
+
+    def test_graph_is_cached(self):
+        graph = get_call_flow_graph(self.voice_service.id)
+        with CaptureQueriesContext(connection) as queries:
+            assert get_call_flow_graph(self.voice_service.id) is graph
+        assert len(queries) == 1, 'Only the version of the service should be checked'
+
+    def test_graph_rebuilt_on_change(self):
+        graph = get_call_flow_graph(self.voice_service.id)
+        self.option2._redirect = self.welcome
+        self.option2.save()
+        new_graph = get_call_flow_graph(self.voice_service.id)
+        assert new_graph is not graph
+        assert new_graph.redirect(new_graph.element(self.option2.id)) == self.welcome
+
+    def test_graph_rebuilt_on_change_in_other_process(self):
+        graph = get_call_flow_graph(self.voice_service.id)
+        # Another process replaces the audio of a voice fragment: this process
+        # gets no signal, but the content version changes
+        fragment = VoiceFragment.objects.get(parent = self.question.voice_label, language = self.language)
+        VoiceFragment.objects.filter(pk = fragment.pk).update(audio = 'replaced.wav')
+        ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+        new_graph = get_call_flow_graph(self.voice_service.id)
+        assert new_graph is not graph
+        assert new_graph.voice_fragment_url(self.question, self.language).startswith('/uploads/replaced.wav')
+
+    def test_hop_queries(self):
+        url = reverse('service-development:choice',
+                kwargs = {'element_id': self.question.id, 'session_id': self.session.id})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == 200
+        assert ET.fromstring(response.content), 'Should produce valid XML'
+        assert not any('INNER JOIN "service_development_choice"' in query['sql'] or
+                'LEFT OUTER JOIN "service_development_choice"' in query['sql'] for query in queries.captured_queries)
+
+        response = self.client.post(url, {'option_id': self.option1.id})
+        self.assertRedirects(response, self.record.get_absolute_url(self.session), fetch_redirect_response = False)
+
+    @override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+    def test_walk_call_flow(self):
+        def get(element):
+            response = self.client.get(element.get_absolute_url(self.session))
+            assert response.status_code == 200
+            assert ET.fromstring(response.content), 'Should produce valid XML'
+            return response
+
+        get(self.welcome)
+        get(self.question)
+        self.client.post(self.question.get_absolute_url(self.session), {'option_id': self.option1.id})
+        get(self.record)
+        recording = SimpleUploadedFile('recording.wav', b'RIFF', content_type = 'audio/wav')
+        response = self.client.post(self.record.get_absolute_url(self.session),
+                {'recording': recording, 'redirect': self.report.get_absolute_url(self.session)})
+        assert response.status_code == 302
+        get(self.report)
+        response = self.client.post(self.report.get_absolute_url(self.session))
+        self.assertRedirects(response, self.retrieve_reports.get_absolute_url(self.session), fetch_redirect_response = False)
+        user_report = UserReport.objects.get(session = self.session)
+        assert user_report.choices.get().choice_option_selected == self.option1
+        assert user_report.recordings.count() == 1
+        response = get(self.retrieve_reports)
+        assert response.content.count(b"report%20recording_en.wav") == 1
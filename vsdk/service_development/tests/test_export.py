@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..export import ReportExport, format_cursor, parse_cursor
+from ..models import CallSessionChoice, SpokenUserInput, UserReport
+
+from .helpers import create_call_flow
+
+
+class TestReportExport(TestCase):
+    client = Client()
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        media_settings = self.settings(MEDIA_ROOT = self.media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.addCleanup(self.media_root.cleanup)
+        create_call_flow(self)
+        self.session.caller_id = '0123'
+        self.session.save()
+        self.reports = [self.create_report(i) for i in range(5)]
+
+    def create_report(self, i):
+        report = UserReport.objects.create(session = self.session, report_element = self.report)
+        UserReport.objects.filter(pk = report.pk).update(time = report.time + timedelta(minutes = i))
+        CallSessionChoice.objects.create(session = self.session, choice_element = self.question,
+                choice_option_selected = self.option1 if i % 2 else self.option2, report = report)
+        recording = SpokenUserInput(session = self.session, category = self.record.input_category,
+                record_element = self.record, report = report)
+        recording.audio.save('recording%s.wav' % i, ContentFile(b'RIFF%s' % str(i).encode()))
+        report.refresh_from_db()
+        return report
+
+    def test_csv(self):
+        export = ReportExport(UserReport.objects.all(), chunk_size = 2)
+        # Reports, and choices and recordings per chunk of reports
+        with self.assertNumQueries(7):
+            rows = list(csv.DictReader(io.StringIO(''.join(export.lines()))))
+        assert [int(row['id']) for row in rows] == [report.pk for report in self.reports]
+        assert rows[1]['answers'] == 'question: option1'
+        assert rows[1]['recordings'] == 'uploads/recording1.wav'
+        assert rows[0]['caller_id'] == '0123'
+        assert rows[0]['service'] == 'call flow'
+        assert export.cursor == (self.reports[-1].time, self.reports[-1].pk)
+
+    def test_ndjson_since(self):
+        export = ReportExport(UserReport.objects.all(), 'ndjson', since = self.reports[2].time)
+        rows = [json.loads(line) for line in export.lines()]
+        assert [row['id'] for row in rows] == [self.reports[3].pk, self.reports[4].pk]
+        assert rows[0]['answers'] == {'question': 'option1'}
+
+    def test_resume_with_same_time(self):
+        UserReport.objects.filter(pk = self.reports[4].pk).update(time = self.reports[3].time)
+        export = ReportExport(UserReport.objects.all())
+        rows = list(export.rows())
+        # Interrupted after the first of the reports with the same time
+        resumed = ReportExport(UserReport.objects.all(), since = (self.reports[3].time, self.reports[3].pk))
+        assert [row['id'] for row in resumed.rows()] == [self.reports[4].pk]
+        assert [row['id'] for row in rows][-2:] == [self.reports[3].pk, self.reports[4].pk]
+
+    def test_cursor_string(self):
+        cursor = (self.reports[0].time, self.reports[0].pk)
+        assert parse_cursor(format_cursor(cursor)) == cursor
+        assert parse_cursor(self.reports[0].time.isoformat()) == (self.reports[0].time, None)
+        with self.assertRaises(ValueError):
+            parse_cursor('yesterday')
+
+    def test_zip(self):
+        SpokenUserInput.objects.filter(report = self.reports[0]).first().audio.delete(save = False)
+        export = ReportExport(UserReport.objects.all(), chunk_size = 2)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(export.zip_chunks())))
+        names = archive.namelist()
+        assert names[0] == 'reports.csv'
+        # The missing recording is skipped
+        assert names[1:] == ['recordings/uploads/recording%s.wav' % i for i in range(1, 5)]
+        assert archive.read('recordings/uploads/recording3.wav') == b'RIFF3'
+        assert len(archive.read('reports.csv').splitlines()) == 6
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'reports.zip')
+            err = io.StringIO()
+            call_command('export_user_reports', zip = True, output = output, since = self.reports[0].time.isoformat(),
+                    service = self.voice_service.pk, stderr = err)
+            cursor = '%s,%s' % (self.reports[-1].time.isoformat(), self.reports[-1].pk)
+            assert 'resume with --since %s' % cursor in err.getvalue()
+            assert len(zipfile.ZipFile(output).namelist()) == 5
+
+        out = io.StringIO()
+        since = '%s,%s' % (self.reports[3].time.isoformat(), self.reports[3].pk)
+        call_command('export_user_reports', format = 'ndjson', since = since, stdout = out, stderr = io.StringIO())
+        assert [json.loads(line)['id'] for line in out.getvalue().splitlines()] == [self.reports[4].pk]
+
+        out = io.StringIO()
+        call_command('export_user_reports', format = 'ndjson', stdout = out, stderr = io.StringIO())
+        assert len(out.getvalue().splitlines()) == 5
+
+    @override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_action(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        response = self.client.post(reverse('admin:service_development_userreport_changelist'),
+                {'action': 'export_zip', '_selected_action': [report.pk for report in self.reports[:2]]})
+        assert response['Content-Type'] == 'application/zip'
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        assert archive.namelist() == ['reports.csv', 'recordings/uploads/recording0.wav',
+                'recordings/uploads/recording1.wav']
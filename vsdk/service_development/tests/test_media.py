@@ -0,0 +1,124 @@
+import os
+import tempfile
+
+from django.test import Client, TestCase, override_settings
+
+from ..callflow import call_flow_graph_cache
+from ..media import file_hash
+from ..models import ContentVersion, VoiceFragment, interface_voice_label_url_cache
+from ..vxml_cache import vxml_document_cache
+
+from .helpers import create_call_flow, wave_bytes
+
+
+class TestMedia(TestCase):
+    client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT = self.media_root)
+        self.settings.enable()
+        for cache in (call_flow_graph_cache, interface_voice_label_url_cache, vxml_document_cache):
+            cache.invalidate()
+        self.fragment = VoiceFragment.objects.get(parent = self.welcome.voice_label)
+        self.write(wave_bytes(frames = 10))
+
+    def tearDown(self):
+        self.settings.disable()
+
+    def write(self, content):
+        path = os.path.join(self.media_root, self.fragment.audio.name)
+        with open(path, 'wb') as audio:
+            audio.write(content)
+        # Make sure the modification time changes
+        os.utime(path, ns = (0, len(content)))
+
+    def test_versioned_url(self):
+        url = self.fragment.get_url()
+        assert url == '/uploads/welcome_en.wav?v=%s' % file_hash(self.fragment.audio.path)[:12]
+        self.write(wave_bytes(frames = 20))
+        assert self.fragment.get_url() != url
+        os.remove(self.fragment.audio.path)
+        assert self.fragment.get_url() == '/uploads/welcome_en.wav'
+
+    def test_serve_versioned(self):
+        response = self.client.get(self.fragment.get_url())
+        assert response.status_code == 200
+        assert b''.join(response.streaming_content) == wave_bytes(frames = 10)
+        assert response['ETag'] == '"%s"' % file_hash(self.fragment.audio.path)
+        assert 'max-age=31536000' in response['Cache-Control']
+        assert 'Last-Modified' in response
+
+    def test_serve_outdated_version(self):
+        url = self.fragment.get_url()
+        self.write(wave_bytes(frames = 20))
+        # A URL with the version of the previous content, e.g. from a worker
+        # that has not seen the change yet, is not cached
+        response = self.client.get(url)
+        assert b''.join(response.streaming_content) == wave_bytes(frames = 20)
+        assert response['Cache-Control'] == 'no-cache'
+
+    def test_serve_unversioned(self):
+        response = self.client.get('/uploads/welcome_en.wav')
+        assert response.status_code == 200
+        assert response['Cache-Control'] == 'no-cache'
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.fragment.get_url())['ETag']
+        response = self.client.get(self.fragment.get_url(), HTTP_IF_NONE_MATCH = etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        self.write(wave_bytes(frames = 30))
+        response = self.client.get('/uploads/welcome_en.wav', HTTP_IF_NONE_MATCH = etag)
+        assert response.status_code == 200
+
+    def test_not_found(self):
+        assert self.client.get('/uploads/missing.wav').status_code == 404
+        assert self.client.get('/uploads/../settings.py').status_code == 404
+
+    def test_vxml_document_validators(self):
+        url = self.welcome.get_absolute_url(self.session)
+        response = self.client.get(url)
+        assert response.status_code == 200
+        etag = response['ETag']
+        assert etag.endswith('-%s"' % self.session.pk)
+        assert 'no-cache' in response['Cache-Control']
+        assert self.fragment.get_url().encode() in response.content
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        assert response.status_code == 304
+        # Another session gets another document
+        other_url = self.welcome.get_absolute_url(type(self.session).objects.create(
+                service = self.voice_service, _language = self.language))
+        assert self.client.get(other_url, HTTP_IF_NONE_MATCH = etag).status_code == 200
+
+    def test_vxml_document_after_change_in_other_process(self):
+        url = self.welcome.get_absolute_url(self.session)
+        old_url = self.fragment.get_url()
+        assert old_url.encode() in self.client.get(url).content
+        # Another process points the fragment to new audio, this process gets no signal
+        with open(os.path.join(self.media_root, 'new.wav'), 'wb') as audio:
+            audio.write(wave_bytes(frames = 40))
+        VoiceFragment.objects.filter(pk = self.fragment.pk).update(audio = 'new.wav')
+        ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+        content = self.client.get(url).content
+        assert old_url.encode() not in content
+        assert VoiceFragment.objects.get(pk = self.fragment.pk).get_url().encode() in content
+
+    def test_choice_document_after_change_in_other_process(self):
+        url = self.question.get_absolute_url(self.session)
+        fragment = VoiceFragment.objects.get(parent = self.language.pre_choice_option, language = self.language)
+        old_url = fragment.get_url()
+        assert old_url.encode() in self.client.get(url).content
+        # Another process points an interface fragment to new audio, this process gets no signal
+        with open(os.path.join(self.media_root, 'new.wav'), 'wb') as audio:
+            audio.write(wave_bytes(frames = 40))
+        VoiceFragment.objects.filter(pk = fragment.pk).update(audio = 'new.wav')
+        ContentVersion.bump(ContentVersion.VOICE_CONTENT)
+        content = self.client.get(url).content
+        assert old_url.encode() not in content
+        assert VoiceFragment.objects.get(pk = fragment.pk).get_url().encode() in content
@@ -0,0 +1,108 @@
+import threading
+
+import mock
+
+from django.conf import settings
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..cache import ProcessCache
+from ..metrics import Histogram, MetricsRegistry, registry
+from ..middleware import _session_service_id, session_service_id
+from ..models import CallSession
+
+from .helpers import create_call_flow
+
+
+class TestMetricsRegistry(TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        assert histogram.cumulative_counts() == [(1, 2), (5, 3), ('+Inf', 4)]
+        assert histogram.sum == 14
+        assert histogram.count == 4
+
+    def test_threads_are_collected(self):
+        metrics_registry = MetricsRegistry()
+
+        def observe():
+            metrics_registry.observe('service-development:choice', 1, 0.01, 0.002, 3, 100)
+
+        threads = [threading.Thread(target = observe) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        observe()
+        metrics = metrics_registry.collect()[('service-development:choice', 1)]
+        assert metrics.duration.count == 4
+        assert metrics.queries.sum == 12
+        assert metrics.response_size == 400
+
+
+class TestVxmlMetricsMiddleware(TestCase):
+    client = Client()
+
+    def setUp(self):
+        ProcessCache.invalidate_all()
+        registry.reset()
+        create_call_flow(self)
+        self.url = reverse('service-development:choice',
+                kwargs = {'element_id': self.question.id, 'session_id': self.session.id})
+
+    def test_requests_are_recorded(self):
+        response = self.client.get(self.url)
+        metrics = registry.collect()[('service-development:choice', self.voice_service.id)]
+        assert metrics.duration.count == 1
+        assert metrics.queries.sum > 0
+        assert metrics.db_duration.sum > 0
+        assert metrics.response_size == len(response.content)
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.url)
+        response = self.client.get(reverse('service-development:metrics'))
+        assert response.status_code == 200
+        text = response.content.decode('utf-8')
+        assert ('vxml_request_duration_seconds_bucket{view="service-development:choice",service="%s",le="+Inf"} 1'
+                % self.voice_service.id) in text
+        assert 'vxml_cache_hits_total{cache="call flow graphs"}' in text
+        assert 'service-development:metrics' not in text, 'The metrics endpoint itself is not recorded'
+
+    @override_settings(VXML_METRICS_ALLOWED_IPS = ['10.0.0.1'])
+    def test_metrics_endpoint_allowed_ips(self):
+        assert self.client.get(reverse('service-development:metrics')).status_code == 403
+
+    def test_metrics_endpoint_localhost_by_default(self):
+        with self.settings():
+            del settings.VXML_METRICS_ALLOWED_IPS
+            assert self.client.get(reverse('service-development:metrics')).status_code == 200
+            assert self.client.get(reverse('service-development:metrics'),
+                    REMOTE_ADDR = '10.0.0.1').status_code == 403
+
+    @override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_other_requests_are_not_wrapped(self):
+        with mock.patch('vsdk.service_development.middleware.QueryTimer') as timer:
+            self.client.get(reverse('admin:login'))
+            self.client.get('/missing')
+        assert not timer.called
+        assert registry.collect() == {}
+
+    def test_unknown_session_is_not_cached(self):
+        _session_service_id.cache_clear()
+        session_id = CallSession.objects.latest('pk').pk + 1
+        assert session_service_id(session_id) is None
+        session = CallSession.objects.create(pk = session_id, service = self.voice_service)
+        assert session_service_id(session.pk) == self.voice_service.pk
+
+    @override_settings(VXML_SLOW_REQUEST_SECONDS = 0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('vsdk.service_development.middleware', 'WARNING') as logs:
+            self.client.get(self.url)
+        assert 'SELECT' in logs.output[0]
+
+    @override_settings(VXML_METRICS = False)
+    def test_disabled(self):
+        self.client.get(self.url)
+        assert registry.collect() == {}
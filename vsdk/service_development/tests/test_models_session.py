@@ -68,6 +68,39 @@ class TestCallSession(TestCase):
                 _language = self.lang2)
         assert obj.language == self.lang2 , 'If language set in session is supported by service, this language will be used.'
 
+    def test_get_session_language_memoized(self):
+        service = mixer.blend('service_development.VoiceService',
+                supported_languages = (self.lang, self.lang2))
+        user = mixer.blend('service_development.KasaDakaUser',
+                language = self.lang2)
+        obj = mixer.blend('service_development.CallSession',
+                service = service,
+                user = user,
+                _language = self.lang)
+        obj = CallSession.objects.get(pk = obj.pk)
+        with self.assertNumQueries(4):
+            # user, content version, supported languages and saving the changed language
+            assert obj.language == self.lang2
+        with self.assertNumQueries(0):
+            assert obj.language == self.lang2
+        assert CallSession.objects.get(pk = obj.pk)._language == self.lang2
+
+        obj = CallSession.objects.get(pk = obj.pk)
+        with self.assertNumQueries(2):
+            # user and content version, the language did not change so the session is not saved
+            assert obj.language == self.lang2
+
+    def test_get_session_language_supported_languages_changed(self):
+        service = mixer.blend('service_development.VoiceService',
+                supported_languages = (self.lang, self.lang2))
+        obj = mixer.blend('service_development.CallSession',
+                service = service,
+                _language = self.lang)
+        assert obj.language == self.lang
+        service.supported_languages.remove(self.lang)
+        obj = CallSession.objects.get(pk = obj.pk)
+        assert obj.language == self.lang2 , 'Single supported language should be used.'
+
     def test_record_step(self):
         session = mixer.blend('service_development.CallSession')
         choice_element = mixer.blend('service_development.Choice')
@@ -0,0 +1,49 @@
+import pytest
+pytestmark = pytest.mark.django_db
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Language, VoiceFragment
+from ..models import interface_voice_label_url_cache
+
+from .helpers import create_language_with_fragments
+
+
+class TestLanguageInterfaceVoiceLabels(TestCase):
+
+    def setUp(self):
+        interface_voice_label_url_cache.invalidate()
+        self.language = create_language_with_fragments()
+
+    def test_interface_urls(self):
+        urls = self.language.get_interface_voice_label_url_dict
+        assert urls['pre_choice_option'] == self.language.pre_choice_option.get_voice_fragment_url(self.language)
+        assert urls['voice_label'] == self.language.get_description_voice_label_url
+        numbers = self.language.get_interface_numbers_voice_label_url_list
+        assert len(numbers) == 10
+        assert numbers[3] == self.language.three.get_voice_fragment_url(self.language)
+
+    def test_interface_urls_are_cached(self):
+        misses = interface_voice_label_url_cache.misses
+        language = Language.objects.get(pk = self.language.pk)
+        language.get_interface_voice_label_url_dict
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(5):
+                language.get_interface_voice_label_url_dict
+                language.get_interface_numbers_voice_label_url_list
+        assert len(queries) == 0
+        assert interface_voice_label_url_cache.misses == misses + 1
+        assert interface_voice_label_url_cache.hits >= 10
+
+    def test_cache_invalidated_on_fragment_change(self):
+        self.language.get_interface_voice_label_url_dict
+        fragment = VoiceFragment.objects.get(parent = self.language.error_message, language = self.language)
+        fragment.audio = 'changed.wav'
+        fragment.save()
+        assert self.language.get_interface_voice_label_url_dict['error_message'].endswith('changed.wav')
+
+        fragment.delete()
+        with pytest.raises(IndexError):
+            self.language.get_interface_voice_label_url_dict
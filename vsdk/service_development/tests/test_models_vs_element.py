@@ -0,0 +1,94 @@
+import tempfile
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Choice, ChoiceOption, MessagePresentation, Record
+from ..models import VoiceServiceElement, VoiceServiceSubElement
+
+from .helpers import create_call_flow, store_voice_fragment_files
+
+
+class TestSubclassType(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+
+    def test_type_stored_on_save(self):
+        assert self.question._subclass_type == ContentType.objects.get_for_model(Choice)
+        assert VoiceServiceSubElement.objects.get(pk = self.option1.pk)._subclass_type.model_class() is ChoiceOption
+
+    def test_get_subclass_by_id(self):
+        ContentType.objects.get_for_model(Record)
+        with CaptureQueriesContext(connection) as queries:
+            element = VoiceServiceElement.objects.get_subclass_by_id(self.record.pk)
+        assert isinstance(element, Record)
+        assert element.pk == self.record.pk
+        assert len(queries) == 2
+        assert not any('LEFT OUTER JOIN' in query['sql'] for query in queries)
+
+    def test_get_subclass_by_id_missing(self):
+        with self.assertRaises(VoiceServiceElement.DoesNotExist):
+            VoiceServiceElement.objects.get_subclass_by_id(-1)
+
+    def test_redirects(self):
+        assert isinstance(self.welcome.redirect, Choice)
+        assert isinstance(self.option1.redirect, Record)
+        assert isinstance(self.voice_service.start_element, MessagePresentation)
+
+    def test_subclasses_in_bulk(self):
+        ids = [self.welcome.pk, self.goodbye.pk, self.question.pk, self.option1.pk, self.option2.pk]
+        for model in (MessagePresentation, Choice, ChoiceOption):
+            ContentType.objects.get_for_model(model)
+        with self.assertNumQueries(4):
+            elements = VoiceServiceSubElement.objects.subclasses_in_bulk(ids)
+        assert sorted(elements) == sorted(ids)
+        assert isinstance(elements[self.goodbye.pk], MessagePresentation)
+        assert isinstance(elements[self.option2.pk], ChoiceOption)
+
+    def test_missing_type_is_resolved(self):
+        VoiceServiceSubElement.objects.filter(pk = self.question.pk).update(_subclass_type = None)
+        with CaptureQueriesContext(connection) as queries:
+            element = VoiceServiceElement.objects.get_subclass_by_id(self.question.pk)
+        assert isinstance(element, Choice)
+        # Reading does not write, the backfill command stores the type
+        assert not [query for query in queries if query['sql'].startswith('UPDATE')]
+        assert VoiceServiceSubElement.objects.get(pk = self.question.pk)._subclass_type_id is None
+
+    def test_stale_type_is_resolved(self):
+        removed = ContentType.objects.create(app_label = 'service_development', model = 'removedelement')
+        VoiceServiceSubElement.objects.filter(pk = self.question.pk).update(_subclass_type = removed)
+        assert isinstance(VoiceServiceElement.objects.get_subclass_by_id(self.question.pk), Choice)
+
+    def test_redirect_does_not_load_base_element(self):
+        welcome = MessagePresentation.objects.get(pk = self.welcome.pk)
+        # The subclass types and the subclass
+        with self.assertNumQueries(2):
+            assert welcome.redirect == self.question
+        welcome._redirect = None
+        with self.assertNumQueries(0):
+            assert welcome.redirect is None
+
+    def test_save_as_base_class_keeps_type(self):
+        VoiceServiceElement.objects.get(pk = self.question.pk).save()
+        VoiceServiceSubElement.objects.get(pk = self.option1.pk).save()
+        assert isinstance(VoiceServiceElement.objects.get_subclass_by_id(self.question.pk), Choice)
+        elements = VoiceServiceSubElement.objects.subclasses_in_bulk([self.question.pk, self.option1.pk])
+        assert isinstance(elements[self.question.pk], Choice)
+        assert isinstance(elements[self.option1.pk], ChoiceOption)
+
+    def test_backfill_command(self):
+        VoiceServiceSubElement.objects.update(_subclass_type = None)
+        call_command('backfill_subclass_types', batch_size = 3, stdout = StringIO())
+        assert not VoiceServiceSubElement.objects.filter(_subclass_type__isnull = True).exists()
+        assert VoiceServiceSubElement.objects.get(pk = self.record.pk)._subclass_type.model_class() is Record
+
+    @override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+    def test_service_validator(self):
+        store_voice_fragment_files()
+        assert self.voice_service.validator() == []
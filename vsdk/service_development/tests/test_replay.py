@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from io import StringIO
+
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from ..cache import ProcessCache
+from ..models import CallSession, UserReport, VoiceFragment
+from ..replay import CallFlowReplay, percentile
+
+from .helpers import create_call_flow
+
+
+@override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+class TestCallFlowReplay(TestCase):
+
+    def setUp(self):
+        ProcessCache.invalidate_all()
+        create_call_flow(self)
+
+    def test_all_paths_are_replayed(self):
+        replay = CallFlowReplay(self.voice_service)
+        replay.run()
+        # option 1 -> report yes, option 1 -> report no, option 2
+        assert replay.paths == 3
+        assert replay.failed_paths == 0
+        assert CallSession.objects.filter(service = self.voice_service).count() == 3 + 1
+        assert UserReport.objects.count() == 1
+
+        statistics = replay.statistics()
+        assert statistics['choice POST'].summary()['count'] == 3
+        assert statistics['report POST'].summary()['count'] == 1
+        assert statistics['retrieve-reports GET'].summary()['count'] == 1
+        assert all(hop.status < 400 for hop in replay.hops)
+        assert all(hop.queries > 0 for hop in replay.hops)
+
+    def test_max_paths(self):
+        replay = CallFlowReplay(self.voice_service, max_paths = 2)
+        replay.run()
+        assert replay.paths == 2
+
+
+@override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+@mock.patch('vsdk.service_development.management.commands.benchmark_call_flows.fixture_database', nullcontext)
+class TestBenchmarkCallFlows(TestCase):
+    """The command, replaying the current database instead of fixture databases"""
+
+    def setUp(self):
+        ProcessCache.invalidate_all()
+        create_call_flow(self)
+        self.baseline = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        self.stdout = StringIO()
+
+    def benchmark(self, **options):
+        call_command('benchmark_call_flows', 'calls.json', service_ids = [self.voice_service.pk],
+                baseline = self.baseline, stdout = self.stdout, **options)
+
+    def test_baseline(self):
+        self.benchmark(save_baseline = True)
+        # Replaying the same database again can take a few more queries per hop
+        self.benchmark(tolerance = 5)
+
+        with open(self.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        baseline['calls.json %s removed GET' % self.voice_service.pk] = 1
+        with open(self.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        with self.assertRaisesRegex(CommandError, 'not replayed'):
+            self.benchmark(tolerance = 5)
+
+    def test_failed_paths(self):
+        VoiceFragment.objects.filter(parent = self.goodbye.voice_label).delete()
+        with self.assertRaisesRegex(CommandError, 'failed paths'):
+            self.benchmark(save_baseline = True)
+        assert not os.path.exists(self.baseline)
+
+    def test_fixture_not_loaded(self):
+        with mock.patch('vsdk.service_development.management.commands.benchmark_call_flows.fixture_database',
+                side_effect = CommandError('Could not load calls.json')):
+            with self.assertRaisesRegex(CommandError, 'Could not load calls.json'):
+                self.benchmark(save_baseline = True)
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 90) == 5
+    assert percentile(values, 0) == 1
+    assert percentile([], 50) is None
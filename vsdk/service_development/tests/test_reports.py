@@ -0,0 +1,123 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import TestCase
+
+from ..callflow import get_call_flow_graph, call_flow_graph_cache
+from ..models import CallSession, CallSessionChoice, SpokenUserInput, UserReport, UserInputCategory
+from ..models import ReportAttribute
+from ..reports import ReportAssembly, latest_user_reports
+from ..views.vse_retrieve_reports import get_reports
+
+from .helpers import create_call_flow
+
+
+class TestReportAssembly(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+
+    def setUp(self):
+        call_flow_graph_cache.invalidate()
+        self.graph = get_call_flow_graph(self.voice_service.pk)
+        self.report_element = self.graph.element(self.report.pk)
+        now = timezone.now()
+        category = UserInputCategory.objects.get(service = self.voice_service)
+
+        # Input of an earlier iteration through the service is ignored
+        self.old_choice = CallSessionChoice.objects.create(session = self.session, time = now - timedelta(minutes = 2),
+                choice_element = self.question, choice_option_selected = self.option1)
+        self.session.record_step(self.welcome)
+        self.first_choice = CallSessionChoice.objects.create(session = self.session, time = now + timedelta(seconds = 1),
+                choice_element = self.question, choice_option_selected = self.option1)
+        self.choice = CallSessionChoice.objects.create(session = self.session, time = now + timedelta(seconds = 2),
+                choice_element = self.question, choice_option_selected = self.option2)
+        self.recording = SpokenUserInput.objects.create(session = self.session, audio = 'recording.wav',
+                category = category, record_element = self.record)
+
+    def test_summary(self):
+        with self.assertNumQueries(3):
+            assembly = ReportAssembly(self.report_element, self.session, self.graph)
+        with self.assertNumQueries(0):
+            summary = assembly.summary()
+        assert [row for _, row in assembly.items] == [self.choice, self.recording]
+        assert summary[0]['voice_label'] == self.graph.voice_fragment_url(assembly.items[0][0], self.language)
+        assert summary[0]['value'] == self.graph.voice_fragment_url(self.option2, self.language)
+        assert summary[1]['value'] == self.recording.get_voice_fragment_url()
+
+    def test_submit(self):
+        user_report = UserReport.objects.create(session = self.session, report_element = self.report)
+        assembly = ReportAssembly(self.report_element, self.session, self.graph)
+        with self.assertNumQueries(5):
+            # Including the savepoint
+            assembly.submit(user_report)
+        assert list(user_report.choices.all()) == [self.choice]
+        attribute = ReportAttribute.objects.get(report = user_report)
+        assert attribute.choice_option_selected_id == self.option2.pk
+        assert attribute.report_element_id == self.report.pk
+        assert list(user_report.recordings.all()) == [self.recording]
+        assert CallSessionChoice.objects.get(pk = self.first_choice.pk).report is None
+        assert CallSessionChoice.objects.get(pk = self.old_choice.pk).report is None
+
+    def test_no_input(self):
+        CallSessionChoice.objects.all().delete()
+        SpokenUserInput.objects.all().delete()
+        assembly = ReportAssembly(self.report_element, self.session, self.graph)
+        assert assembly.summary() == []
+        user_report = UserReport.objects.create(session = self.session, report_element = self.report)
+        with self.assertNumQueries(0):
+            assembly.submit(user_report)
+
+
+class TestLatestUserReports(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+        category = UserInputCategory.objects.get(service = cls.voice_service)
+        cls.user_reports = []
+        for option in (cls.option1, cls.option2, cls.option1):
+            session = CallSession.objects.create(service = cls.voice_service, _language = cls.language)
+            user_report = UserReport.objects.create(session = session, report_element = cls.report)
+            choice = CallSessionChoice.objects.create(session = session, choice_element = cls.question,
+                    choice_option_selected = option, report = user_report)
+            SpokenUserInput.objects.create(session = session, audio = 'recording.wav',
+                    category = category, record_element = cls.record, report = user_report)
+            ReportAttribute.objects.bulk_create(ReportAttribute.for_choices(user_report, [choice]))
+            cls.user_reports.append(user_report)
+
+    def test_latest_user_reports(self):
+        first, second, third = self.user_reports
+        assert latest_user_reports(self.report.pk, [self.option1.pk], 10) == [third, first]
+        assert latest_user_reports(self.report.pk, [self.option1.pk], 1) == [third]
+        assert latest_user_reports(self.report.pk, [self.option2.pk], 10) == [second]
+        assert latest_user_reports(self.report.pk, [], 10) == [third, second, first]
+        assert latest_user_reports(self.report.pk, [self.option1.pk, self.option2.pk], 10) == []
+
+    def test_get_reports(self):
+        call_flow_graph_cache.invalidate()
+        graph = get_call_flow_graph(self.voice_service.pk)
+        retrieve_element = graph.element(self.retrieve_reports.pk)
+        self.session.record_step(self.welcome)
+        self.session.record_choice(self.question, self.option1)
+
+        # Independent of the number of reports
+        with self.assertNumQueries(8):
+            filter_choices_selected, reports = get_reports(retrieve_element, self.session, graph)
+        assert filter_choices_selected == [{
+            'voice_label': graph.voice_fragment_url(graph.report_contents(graph.element(self.report.pk))[0],
+                                                    self.language),
+            'value': graph.voice_fragment_url(self.option1, self.language)}]
+        # Only the recordings, the filtered choice is not repeated
+        assert len(reports) == 2
+        assert [len(report) for report in reports] == [1, 1]
+        assert reports[0][0]['value'] == self.user_reports[2].recordings.get().get_voice_fragment_url()
+
+    def test_rebuild_command(self):
+        ReportAttribute.objects.all().delete()
+        call_command('rebuild_report_attributes', batch_size = 2, stdout = StringIO())
+        assert ReportAttribute.objects.count() == 3
+        assert latest_user_reports(self.report.pk, [self.option2.pk], 10) == [self.user_reports[1]]
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import CallSession, CallSessionArchive, CallSessionChoice, CallSessionStep, UserReport
+from ..retention import compact_expired_history, compact_sessions, expired_sessions, retention_days
+
+from .helpers import create_call_flow
+
+
+class TestRetention(TestCase):
+    client = Client()
+
+    def setUp(self):
+        create_call_flow(self)
+        self.old_sessions = [self.create_session(days_ago = 40) for i in range(3)]
+        self.recent_session = self.create_session(days_ago = 1)
+
+    def create_session(self, days_ago):
+        session = CallSession.objects.create(service = self.voice_service, _language = self.language)
+        session.record_step(self.welcome)
+        session.record_step(self.question)
+        session.record_step(description = 'hangup')
+        session.record_choice(self.question, self.option2)
+        CallSession.objects.filter(pk = session.pk).update(start = timezone.now() - timedelta(days = days_ago))
+        return session
+
+    def test_retention_days(self):
+        assert retention_days(self.voice_service) is None
+        assert not expired_sessions(self.voice_service).exists()
+        with override_settings(CALL_HISTORY_RETENTION_DAYS = 90):
+            assert retention_days(self.voice_service) == 90
+            self.voice_service.call_history_retention_days = 30
+            assert retention_days(self.voice_service) == 30
+
+    def test_compact_sessions(self):
+        report = UserReport.objects.create(session = self.old_sessions[0], report_element = self.report)
+        CallSessionChoice.objects.create(session = self.old_sessions[0], choice_element = self.question,
+                choice_option_selected = self.option1, report = report)
+
+        result = compact_sessions(expired_sessions(self.voice_service, days = 30), batch_size = 2, pause = 0)
+        assert result == (3, 9, 3)
+        assert CallSessionStep.objects.filter(session__in = self.old_sessions).count() == 0
+        assert CallSessionStep.objects.filter(session = self.recent_session).count() == 3
+        # Choices of reports are kept
+        assert list(CallSessionChoice.objects.filter(session__in = self.old_sessions)) == list(report.choices.all())
+
+        archive = CallSessionArchive.objects.get(session = self.old_sessions[0])
+        assert (archive.step_count, archive.choice_count) == (3, 1)
+        steps = archive.steps()
+        assert [step.element for step in steps] == ['welcome', 'question', None]
+        assert [step.element_id for step in steps] == [self.welcome.pk, self.question.pk, None]
+        assert steps[2].description == 'hangup'
+        assert [choice.choice_option for choice in archive.choices()] == ['option2']
+
+        # Compacted sessions are not compacted again
+        assert not expired_sessions(self.voice_service, days = 30).exists()
+
+    def test_compact_expired_history(self):
+        self.voice_service.call_history_retention_days = 30
+        self.voice_service.save()
+        result = compact_expired_history()
+        assert result.sessions == 3
+        assert CallSessionArchive.objects.count() == 3
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compact_call_history', days = 10, service = [self.voice_service.pk], pause = 0, stdout = out)
+        assert 'Compacted 3 call sessions: 9 steps, 3 choices' in out.getvalue()
+
+    @override_settings(STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_archived_history(self):
+        compact_sessions(expired_sessions(self.voice_service, days = 30))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        response = self.client.get(reverse('admin:service_development_callsession_change',
+                args = [self.old_sessions[0].pk]))
+        assert response.status_code == 200
+        assert b'hangup' in response.content
+        assert b'option2' in response.content
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import wave
+
+import mock
+
+from django.test import Client, TestCase, override_settings
+
+from .. import sprites
+from ..callflow import get_call_flow_graph, call_flow_graph_cache
+from ..models import VoiceFragment, interface_voice_label_url_cache
+from ..sprites import choice_menu_prompt_urls, choice_menu_sprite_url
+from ..vxml_cache import vxml_document_cache
+
+from .helpers import create_call_flow, wave_bytes
+
+
+class TestChoiceMenuSprites(TestCase):
+    client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT = self.media_root, CHOICE_MENU_SPRITES = True,
+                CHOICE_MENU_SPRITE_WORKERS = 0)
+        self.settings.enable()
+        for fragment in VoiceFragment.objects.all():
+            with open(os.path.join(self.media_root, fragment.audio.name), 'wb') as audio:
+                audio.write(wave_bytes(frames = 100))
+        for cache in (call_flow_graph_cache, interface_voice_label_url_cache, vxml_document_cache,
+                sprites.available_sprite_cache, sprites.failed_sprite_cache):
+            cache.invalidate()
+        self.graph = get_call_flow_graph(self.voice_service.pk)
+        self.question = self.graph.element(self.question.pk)
+
+    def tearDown(self):
+        self.settings.disable()
+
+    def test_prompt_urls(self):
+        urls = choice_menu_prompt_urls(self.question, self.language, self.graph)
+        interface_urls = self.language.get_interface_voice_label_url_dict
+        assert len(urls) == 1 + 2 * 4
+        assert urls[0] == self.graph.voice_fragment_url(self.question, self.language)
+        assert urls[1:5] == [interface_urls['pre_choice_option'],
+                self.graph.voice_fragment_url(self.option1, self.language),
+                interface_urls['post_choice_option'],
+                self.language.get_interface_numbers_voice_label_url_list[1]]
+
+    def test_sprite(self):
+        url = choice_menu_sprite_url(self.question, self.language, self.graph)
+        assert url.startswith('/uploads/sprites/choice_%s_en_' % self.question.pk)
+        sprite = wave.open(os.path.join(self.media_root, url[len('/uploads/'):]), 'rb')
+        assert sprite.getnframes() == 9 * 100
+        assert (sprite.getnchannels(), sprite.getsampwidth(), sprite.getframerate()) == (1, 2, 8000)
+        sprite.close()
+
+        response = self.client.get(self.question.get_absolute_url(self.session))
+        assert response.content.count(b'<audio ') == 1
+        assert url.encode() in response.content
+
+    def test_invalid_fragment(self):
+        fragment = VoiceFragment.objects.get(parent = self.option2.voice_label)
+        with open(os.path.join(self.media_root, fragment.audio.name), 'wb') as audio:
+            audio.write(wave_bytes(sample_rate = 16000))
+        assert choice_menu_sprite_url(self.question, self.language, self.graph) is None
+        response = self.client.get(self.question.get_absolute_url(self.session))
+        assert response.content.count(b'<audio ') == 9
+
+    def test_existing_sprite_is_not_looked_up_again(self):
+        url = choice_menu_sprite_url(self.question, self.language, self.graph)
+        with mock.patch.object(sprites.default_storage, 'exists') as exists:
+            assert choice_menu_sprite_url(self.question, self.language, self.graph) == url
+        assert not exists.called
+
+    def test_failed_sprite_is_retried(self):
+        fragment = VoiceFragment.objects.get(parent = self.option2.voice_label)
+        path = os.path.join(self.media_root, fragment.audio.name)
+        with open(path, 'wb') as audio:
+            audio.write(wave_bytes(sample_rate = 16000))
+        assert choice_menu_sprite_url(self.question, self.language, self.graph) is None
+        with open(path, 'wb') as audio:
+            audio.write(wave_bytes(frames = 100))
+        with mock.patch.object(sprites.default_storage, 'exists') as exists:
+            assert choice_menu_sprite_url(self.question, self.language, self.graph) is None
+        assert not exists.called, 'The failure is remembered'
+        with mock.patch.object(sprites.failed_sprite_cache, 'ttl', 0):
+            assert choice_menu_sprite_url(self.question, self.language, self.graph) is not None
+
+    @override_settings(CHOICE_MENU_SPRITES = False)
+    def test_disabled(self):
+        assert choice_menu_sprite_url(self.question, self.language, self.graph) is None
+        assert not os.path.exists(os.path.join(self.media_root, 'sprites'))
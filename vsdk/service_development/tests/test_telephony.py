@@ -0,0 +1,99 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from django.test import TestCase, override_settings
+from mixer.backend.django import mixer
+
+from ..models import VoiceService
+from ..telephony import (AsteriskControl, LocalTelephonyControl, TelephonyControlError, activate_voice_service,
+        point_telephony_to)
+
+EXTENSIONS = """[default]
+exten => 1234,1,Answer()
+exten => 1234,n,Vxml(http://old.example/vxml/start/1?callerid=${CALLERID(num)})
+exten => 1234,n,Hangup()
+"""
+
+
+class TestAsteriskControl(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'extensions.conf')
+        with open(self.path, 'w') as outfile:
+            outfile.write(EXTENSIONS)
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_update_dialplan(self):
+        AsteriskControl().update_dialplan(self.path, 'http://127.0.0.1/vxml/start/7')
+        with open(self.path) as infile:
+            extensions = infile.read()
+        assert 'Vxml(http://127.0.0.1/vxml/start/7?callerid=${CALLERID(num)})' in extensions
+        assert 'old.example' not in extensions
+        assert stat.S_IMODE(os.stat(self.path).st_mode) == 0o640
+        # No temporary files are left behind
+        assert os.listdir(self.directory) == ['extensions.conf']
+
+    def test_missing_dialplan(self):
+        with self.assertRaises(TelephonyControlError):
+            AsteriskControl().update_dialplan(os.path.join(self.directory, 'missing.conf'), 'http://127.0.0.1/')
+
+    def test_reload(self):
+        with override_settings(ASTERISK_RELOAD_COMMAND = [sys.executable, '-c', 'pass']):
+            AsteriskControl().reload()
+        with override_settings(ASTERISK_RELOAD_COMMAND = [sys.executable, '-c', 'print("no asterisk"); exit(1)']):
+            with self.assertRaisesRegex(TelephonyControlError, 'no asterisk'):
+                AsteriskControl().reload()
+
+    def test_point_to(self):
+        with override_settings(ASTERISK_EXTENSIONS_FILE = self.path,
+                ASTERISK_RELOAD_COMMAND = [sys.executable, '-c', 'pass']):
+            AsteriskControl().point_to('http://127.0.0.1/vxml/start/3')
+        with open(self.path) as infile:
+            assert 'Vxml(http://127.0.0.1/vxml/start/3?' in infile.read()
+
+
+@override_settings(TELEPHONY_CONTROL = 'vsdk.service_development.telephony.LocalTelephonyControl',
+        VXML_HOST_ADDRESS = 'http://127.0.0.1', SERVICE_ACTIVATION_WORKERS = 0)
+class TestActivation(TestCase):
+
+    def setUp(self):
+        LocalTelephonyControl.vxml_urls = []
+        self.services = [mixer.blend(VoiceService, active = True) for i in range(3)]
+
+    def test_activate(self):
+        service = self.services[1]
+        # Savepoint, deactivation, activation and release
+        with self.assertNumQueries(4):
+            activate_voice_service(service)
+        assert list(VoiceService.objects.filter(active = True)) == [service]
+        assert service.activation_status == VoiceService.ACTIVATION_PENDING
+
+        # The telephony platform is updated once the activation is committed
+        assert LocalTelephonyControl.vxml_urls == []
+        assert point_telephony_to(service.pk) == VoiceService.ACTIVATION_DONE
+        assert LocalTelephonyControl.vxml_urls == ['http://127.0.0.1' + service.get_vxml_url()]
+        service.refresh_from_db()
+        assert service.activation_status == VoiceService.ACTIVATION_DONE
+        assert service.activation_message
+
+    def test_failed_activation(self):
+        service = self.services[0]
+        activate_voice_service(service)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TELEPHONY_CONTROL = 'vsdk.service_development.telephony.AsteriskControl',
+                    ASTERISK_EXTENSIONS_FILE = os.path.join(directory, 'extensions.conf')):
+                assert point_telephony_to(service.pk) == VoiceService.ACTIVATION_FAILED
+        service.refresh_from_db()
+        assert service.activation_status == VoiceService.ACTIVATION_FAILED
+        assert 'could not be read' in service.activation_message
+
+    def test_missing_service(self):
+        assert point_telephony_to(0) is None
+        assert LocalTelephonyControl.vxml_urls == []
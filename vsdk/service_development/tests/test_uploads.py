@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+
+from ..models import SpokenUserInput
+from ..uploads import SpooledRecording, recording_size_limit, save_recording, write_recording
+
+from .helpers import create_call_flow
+
+
+class TestRecordingUpload(TestCase):
+    client = Client()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_call_flow(cls)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT = self.media_root, FILE_UPLOAD_TEMP_DIR = self.spool_dir,
+                RECORDING_UPLOAD_BYTES_PER_SECOND = 100, RECORDING_UPLOAD_OVERHEAD = 100)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    def post(self, content):
+        recording = SimpleUploadedFile('recording.wav', content, content_type = 'audio/wav')
+        return self.client.post(self.record.get_absolute_url(self.session),
+                {'redirect': self.report.get_absolute_url(self.session), 'recording': recording})
+
+    def test_size_limit(self):
+        assert recording_size_limit(10) == 1100
+
+    def test_upload(self):
+        content = b'RIFF' + b'\0' * 1000
+        response = self.post(content)
+        assert response.status_code == 302
+        recording = SpokenUserInput.objects.get(session = self.session)
+        assert recording.audio.name == 'uploads/recording_%s_%s.wav' % (self.session.pk, self.record.pk)
+        with recording.audio.open('rb') as audio:
+            assert audio.read() == content
+        # The spool file was moved into place
+        assert os.listdir(self.spool_dir) == []
+
+    def test_upload_too_large(self):
+        self.record.max_time_input = 1
+        self.record.save()
+        response = self.post(b'\0' * 1000)
+        assert response.status_code == 413
+        assert not SpokenUserInput.objects.exists()
+        assert os.listdir(self.spool_dir) == []
+
+    def test_upload_without_recording(self):
+        response = self.client.post(self.record.get_absolute_url(self.session),
+                {'redirect': self.report.get_absolute_url(self.session)})
+        assert response.status_code == 400
+
+    @override_settings(RECORDING_STORAGE_IN_BACKGROUND = True)
+    def test_background_storage(self):
+        path = os.path.join(self.spool_dir, 'spooled.upload.wav')
+        recording = SpooledRecording(path, 'recording.wav', 'audio/wav', None)
+        recording.write(b'RIFF')
+        spoken_user_input = SpokenUserInput(session = self.session, record_element = self.record,
+                category = self.record.input_category)
+        save_recording(spoken_user_input, recording, 'background.wav')
+
+        # Saved before the file is written to storage
+        assert SpokenUserInput.objects.get(pk = spoken_user_input.pk).audio.name == 'uploads/background.wav'
+        assert os.path.exists(path)
+
+        write_recording(spoken_user_input.pk, path, 'uploads/background.wav')
+        assert not os.path.exists(path)
+        with open(os.path.join(self.media_root, 'uploads', 'background.wav'), 'rb') as audio:
+            assert audio.read() == b'RIFF'
@@ -0,0 +1,117 @@
+import os
+import tempfile
+
+import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from ..accessibility import audio_accessibility_cache
+from ..models import VoiceService, VoiceServiceSubElement, MessagePresentation, VoiceFragment
+from ..validation import get_service_validation, validate_service, element_validation_errors
+from ..validation import service_validation_cache
+
+from .helpers import create_call_flow, create_voice_label, store_voice_fragment_files
+
+
+def legacy_errors(service):
+    """The errors of service, validating element by element"""
+    errors = []
+    for element in VoiceServiceSubElement.objects.filter(service = service).select_subclasses():
+        errors.extend(element.validator())
+    return set(errors)
+
+
+class TestServiceValidation(TestCase):
+
+    def setUp(self):
+        self.settings = override_settings(MEDIA_ROOT = tempfile.mkdtemp())
+        self.settings.enable()
+        service_validation_cache.invalidate()
+        create_call_flow(self)
+        store_voice_fragment_files()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    def add_messages(self, amount):
+        for number in range(amount):
+            MessagePresentation.objects.create(name = "message %s" % number,
+                    service = self.voice_service,
+                    voice_label = create_voice_label("message %s" % number, self.language),
+                    _redirect = self.goodbye)
+        store_voice_fragment_files()
+
+    def test_valid_service(self):
+        assert self.voice_service.validator() == []
+        assert self.voice_service.is_valid()
+
+    def test_same_errors_as_element_validators(self):
+        self.add_messages(2)
+        MessagePresentation.objects.create(name = "no redirect", service = self.voice_service)
+        self.option1._redirect = None
+        self.option1.save()
+        VoiceFragment.objects.filter(parent = self.question.voice_label).delete()
+        errors = self.voice_service.validator()
+        assert len(errors) == 4
+        assert set(errors) == legacy_errors(self.voice_service)
+
+    def test_queries_do_not_depend_on_size(self):
+        with CaptureQueriesContext(connection) as small:
+            validate_service(VoiceService.objects.get(pk = self.voice_service.pk))
+        self.add_messages(10)
+        with CaptureQueriesContext(connection) as large:
+            validate_service(VoiceService.objects.get(pk = self.voice_service.pk))
+        assert len(large) == len(small)
+
+    def test_result_is_cached(self):
+        errors = self.voice_service.validator()
+        with CaptureQueriesContext(connection) as queries:
+            assert self.voice_service.validator() == errors
+        assert len(queries) == 1, 'Only the version of the service should be checked'
+
+    def test_invalidated_on_changes(self):
+        assert self.voice_service.is_valid()
+        self.welcome._redirect = None
+        self.welcome.save()
+        assert not self.voice_service.is_valid()
+        self.welcome._redirect = self.question
+        self.welcome.save()
+        assert self.voice_service.is_valid()
+
+        # Voice Fragments are not part of the version of the service
+        VoiceFragment.objects.filter(parent = self.goodbye.voice_label).delete()
+        assert not self.voice_service.is_valid()
+
+    def test_element_errors(self):
+        self.option2._redirect = None
+        self.option2.save()
+        validation = get_service_validation(self.voice_service.pk)
+        assert validation.errors_of(self.welcome) == []
+        assert len(validation.errors_of(self.option2)) == 1
+        assert validation.errors_of(self.question) == validation.errors_of(self.option2)
+        assert element_validation_errors(self.option2) == self.option2.validator()
+
+    def test_errors_in_language_of_request(self):
+        VoiceService.objects.filter(pk = self.voice_service.pk).update(_start_element = None)
+
+        def translate(message):
+            return '%s: %s' % (translation.get_language(), message)
+
+        with mock.patch('vsdk.service_development.validation.ugettext', side_effect = translate):
+            with translation.override('fr'):
+                assert get_service_validation(self.voice_service.pk).errors == ('fr: No starting element',)
+            with translation.override('en'):
+                assert get_service_validation(self.voice_service.pk).errors == ('en: No starting element',)
+
+    def test_inaccessible_audio_file(self):
+        assert self.voice_service.is_valid()
+        os.remove(VoiceFragment.objects.get(parent = self.goodbye.voice_label).audio.path)
+        assert self.voice_service.is_valid(), 'Accessibility is cached'
+        audio_accessibility_cache.invalidate()
+        service_validation_cache.invalidate()
+        errors = self.voice_service.validator()
+        assert len(errors) == 1
+        assert 'not accessible' in errors[0]
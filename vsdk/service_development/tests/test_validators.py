@@ -0,0 +1,85 @@
+import os
+import struct
+import tempfile
+
+import mock
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models.fields.files import FieldFile
+from django.test import SimpleTestCase
+
+from ..models import VoiceFragment
+from ..models.validators import parse_wave_header, validate_audio_file_format, audio_file_format_cache
+
+from .helpers import wave_bytes
+
+
+class RemoteStorage(FileSystemStorage):
+    """A storage without local paths, e.g. S3"""
+
+    def path(self, name):
+        raise NotImplementedError
+
+    def _open(self, name, mode = 'rb'):
+        return File(open(os.path.join(self.location, name), mode))
+
+    def size(self, name):
+        return os.path.getsize(os.path.join(self.location, name))
+
+
+class TestWaveHeader(SimpleTestCase):
+
+    def setUp(self):
+        audio_file_format_cache.invalidate()
+        self.directory = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location = self.directory, base_url = '/uploads/')
+
+    def field_file(self, name, content):
+        with open(os.path.join(self.directory, name), 'wb') as audio_file:
+            audio_file.write(content)
+        field = VoiceFragment._meta.get_field('audio')
+        audio = FieldFile(None, field, name)
+        audio.storage = self.storage
+        return audio
+
+    def test_parse(self):
+        assert parse_wave_header(wave_bytes()) == {'format': 1, 'channels': 1, 'sample_rate': 8000, 'bit_depth': 16}
+        assert parse_wave_header(wave_bytes(channels = 2))['channels'] == 2
+        assert parse_wave_header(b'ID3\x03') is None
+        assert parse_wave_header(wave_bytes()[:30]) is None
+
+    def test_parse_extensible_format_after_other_chunk(self):
+        fmt = struct.pack('<HHIIHHHHI', 0xFFFE, 1, 8000, 16000, 2, 16, 22, 16, 4) + struct.pack('<H', 1) + b'\0' * 14
+        info = b'LIST' + struct.pack('<I', 5) + b'INFO\0' + b'\0'
+        header = b'RIFF' + struct.pack('<I', 100) + b'WAVE' + info + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+        assert parse_wave_header(header) == {'format': 1, 'channels': 1, 'sample_rate': 8000, 'bit_depth': 16}
+
+    def test_validate(self):
+        assert validate_audio_file_format(self.field_file('valid.wav', wave_bytes()))
+        assert not validate_audio_file_format(self.field_file('stereo.wav', wave_bytes(channels = 2)))
+        assert not validate_audio_file_format(self.field_file('44k.wav', wave_bytes(sample_rate = 44100)))
+        assert not validate_audio_file_format(self.field_file('8bit.wav', wave_bytes(sample_width = 1)))
+        assert not validate_audio_file_format(self.field_file('valid.mp3', wave_bytes()))
+        assert not validate_audio_file_format(self.field_file('empty.wav', b''))
+
+    def test_validate_fixture_audio(self):
+        fixture = os.path.join(os.path.dirname(__file__), '..', '..', 'uploads', '1_en.wav')
+        with open(fixture, 'rb') as audio_file:
+            assert validate_audio_file_format(self.field_file('1_en.wav', audio_file.read()))
+
+    def test_results_are_cached(self):
+        audio = self.field_file('valid.wav', wave_bytes())
+        assert validate_audio_file_format(audio)
+        misses = audio_file_format_cache.misses
+        with mock.patch('vsdk.service_development.models.validators.read_audio_file_header') as read:
+            assert validate_audio_file_format(audio)
+        assert not read.called
+        assert audio_file_format_cache.misses == misses
+        # A different file with the same name is validated again
+        audio = self.field_file('valid.wav', wave_bytes(channels = 2))
+        assert not validate_audio_file_format(audio)
+
+    def test_remote_storage(self):
+        self.storage = RemoteStorage(location = self.directory)
+        assert validate_audio_file_format(self.field_file('remote.wav', wave_bytes()))
+        assert not validate_audio_file_format(self.field_file('stereo.wav', wave_bytes(channels = 2)))
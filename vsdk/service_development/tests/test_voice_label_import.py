@@ -0,0 +1,132 @@
+import csv
+import io
+import os
+import tempfile
+import zipfile
+
+import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from mixer.backend.django import mixer
+
+from ..cache import ProcessCache
+from ..models import ContentVersion, Language, VoiceFragment, VoiceLabel
+from ..voice_label_import import import_voice_labels
+
+from .helpers import wave_bytes
+
+
+class TestVoiceLabelImport(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        media_settings = self.settings(MEDIA_ROOT = self.media_root.name, KASADAKA = False)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.addCleanup(self.media_root.cleanup)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        ProcessCache.invalidate_all()
+        self.english = mixer.blend(Language, code = 'en')
+        self.dutch = mixer.blend(Language, code = 'nl')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as audio_file:
+            audio_file.write(content)
+
+    def results(self, results):
+        return dict((result.path, (result.status, result.message)) for result in results)
+
+    def test_directory(self):
+        welcome = VoiceLabel.objects.create(name = 'welcome')
+        existing = VoiceFragment(parent = welcome, language = self.english)
+        existing.audio.save('old.wav', ContentFile(wave_bytes()))
+        self.write('welcome/en.wav', wave_bytes(frames = 160))
+        self.write('welcome/nl.wav', wave_bytes())
+        self.write('goodbye/en.wav', wave_bytes(sample_rate = 16000))
+        self.write('goodbye/fr.wav', wave_bytes())
+        self.write('goodbye/nl.wav', b'not audio')
+        self.write('readme.txt', b'')
+
+        version = ContentVersion.current(ContentVersion.VOICE_CONTENT)
+        results = self.results(import_voice_labels(self.directory.name, workers = 0))
+        # Other processes see the change
+        assert ContentVersion.current(ContentVersion.VOICE_CONTENT) > version
+        assert results == {
+            'readme.txt': ('skipped', 'Not named <label>/<language code>.wav'),
+            'goodbye/fr.wav': ('failed', 'Unknown language code'),
+            'goodbye/nl.wav': ('failed', 'Not a wave file'),
+            'goodbye/en.wav': ('created', 'Not in the correct format (8 kHz, 16 bit, mono PCM), and not converted'),
+            'welcome/en.wav': ('updated', ''),
+            'welcome/nl.wav': ('created', ''),
+        }
+        assert VoiceLabel.objects.filter(name__in = ['welcome', 'goodbye']).count() == 2
+        existing.refresh_from_db()
+        assert existing.audio.name == 'welcome_en.wav'
+        assert existing.audio.read() == wave_bytes(frames = 160)
+        goodbye = VoiceLabel.objects.get(name = 'goodbye')
+        assert goodbye.get_voice_fragment_url(self.english).startswith('/uploads/goodbye_en.wav')
+        assert welcome.get_voice_fragment_url(self.dutch).startswith('/uploads/welcome_nl.wav')
+
+    def test_zip(self):
+        archive_path = os.path.join(self.directory.name, 'labels.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.writestr('labels/', b'')
+            archive.writestr('labels/welcome/en.wav', wave_bytes())
+            archive.writestr('labels/welcome/nl.wav', wave_bytes())
+            archive.writestr('more/welcome/nl.wav', wave_bytes(frames = 160))
+
+        results = self.results(import_voice_labels(archive_path, workers = 2))
+        assert results == {
+            'labels/welcome/en.wav': ('created', ''),
+            'labels/welcome/nl.wav': ('skipped', 'Replaced by more/welcome/nl.wav'),
+            'more/welcome/nl.wav': ('created', ''),
+        }
+        fragment = VoiceFragment.objects.get(language = self.dutch)
+        assert fragment.audio.read() == wave_bytes(frames = 160)
+
+    def test_queries(self):
+        for i in range(10):
+            self.write('label%s/en.wav' % i, wave_bytes())
+            self.write('label%s/nl.wav' % i, wave_bytes())
+        # Languages, labels (before and after creating them), fragments, bulk creates and the
+        # content version, in a savepoint
+        with self.assertNumQueries(9):
+            import_voice_labels(self.directory.name, workers = 0)
+        assert VoiceFragment.objects.count() == 20
+
+    def test_converted_on_kasadaka(self):
+        def convert(source, destination):
+            with open(destination, 'wb') as converted:
+                converted.write(wave_bytes(frames = 40))
+
+        self.write('welcome/en.wav', wave_bytes(channels = 2))
+        with self.settings(KASADAKA = True), mock.patch(
+                'vsdk.service_development.voice_label_import.convert_audio_file', side_effect = convert):
+            results = import_voice_labels(self.directory.name, workers = 0)
+        assert [(result.status, result.message) for result in results] == [('created', 'Converted')]
+        assert VoiceFragment.objects.get(parent__name = 'welcome').audio.read() == wave_bytes(frames = 40)
+
+    @mock.patch('vsdk.service_development.voice_label_import.convert_audio_file', side_effect = OSError('sox: broken'))
+    def test_conversion_fails(self, convert_audio_file):
+        self.write('welcome/en.wav', wave_bytes(channels = 2))
+        with self.settings(KASADAKA = True):
+            results = import_voice_labels(self.directory.name, workers = 0)
+        assert [(result.status, result.message) for result in results] == [('failed', 'sox: broken')]
+        assert not VoiceLabel.objects.filter(name = 'welcome').exists()
+
+    def test_command(self):
+        self.write('welcome/en.wav', wave_bytes())
+        self.write('welcome/de.wav', wave_bytes())
+        report_path = os.path.join(self.directory.name, 'report.csv')
+        out = io.StringIO()
+        call_command('import_voice_labels', self.directory.name, workers = 0, report = report_path, stdout = out)
+        assert 'Created 1, updated 0, skipped 0, failed 1 voice fragments' in out.getvalue()
+        with open(report_path) as report:
+            rows = list(csv.DictReader(report))
+        assert [(row['path'], row['status']) for row in rows] == [('welcome/de.wav', 'failed'),
+                ('welcome/en.wav', 'created')]
@@ -0,0 +1,59 @@
+from xml.etree import ElementTree as ET
+
+from django.test import Client, TestCase, override_settings
+
+from ..models import CallSession, VoiceFragment
+from ..vxml_cache import vxml_document_cache, vxml_document_cache_statistics, SESSION_ID_PLACEHOLDER
+
+from .helpers import create_call_flow
+
+
+class TestVoiceXMLDocumentCache(TestCase):
+    client = Client()
+
+    def setUp(self):
+        vxml_document_cache.invalidate()
+        vxml_document_cache_statistics.reset()
+        create_call_flow(self)
+        self.other_session = CallSession.objects.create(service = self.voice_service,
+                _language = self.language)
+
+    def get(self, element, session, **params):
+        response = self.client.get(element.get_absolute_url(session), params)
+        assert response.status_code == 200
+        assert ET.fromstring(response.content), 'Should produce valid XML'
+        return response.content.decode()
+
+    def test_document_cached_per_element(self):
+        for element in (self.welcome, self.question, self.record):
+            first = self.get(element, self.session)
+            second = self.get(element, self.other_session)
+            assert vxml_document_cache_statistics[element.id]['hits'] == 1
+            assert vxml_document_cache_statistics[element.id]['misses'] == 1
+            assert str(SESSION_ID_PLACEHOLDER) not in second
+            assert element.get_absolute_url(self.other_session) in second or element == self.welcome
+            for quote in '"\'':
+                first = first.replace('/%s%s' % (self.session.id, quote), '/%s%s' % (self.other_session.id, quote))
+            assert first == second
+
+    def test_session_steps_still_recorded(self):
+        self.get(self.question, self.session)
+        self.get(self.question, self.session)
+        assert self.session.steps.filter(_visited_element = self.question).count() == 2
+
+    def test_request_with_parameters_not_cached(self):
+        self.get(self.question, self.session, foo = 'bar')
+        assert self.question.id not in vxml_document_cache_statistics.as_dict()
+
+    @override_settings(VXML_DOCUMENT_CACHE = False)
+    def test_disabled(self):
+        self.get(self.question, self.session)
+        assert vxml_document_cache_statistics.as_dict() == {}
+
+    def test_invalidated_when_fragment_changes(self):
+        self.get(self.welcome, self.session)
+        fragment = VoiceFragment.objects.get(parent = self.welcome.voice_label)
+        fragment.audio = 'new_welcome.wav'
+        fragment.save()
+        assert 'new_welcome.wav' in self.get(self.welcome, self.session)
+        assert vxml_document_cache_statistics[self.welcome.id]['misses'] == 2
@@ -0,0 +1,144 @@
+"""
+Handling of recordings uploaded by the VoiceXML browser (see the Record
+element).
+
+Recordings are streamed to a spool file on disk while the request is
+parsed, instead of being buffered in memory, and uploads that are larger
+than the maximum recording time allows are rejected. File system storages
+move the spool file into place. Other storages (e.g. SFTP) can be slow,
+so the spool file is written to them in the background, after the caller
+has been redirected.
+"""
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.db import transaction
+
+from .background import BackgroundQueue
+
+logger = logging.getLogger(__name__)
+
+# Pool of worker threads writing recordings to storages other than the file system
+recording_storage_queue = BackgroundQueue('recording-storage', 'RECORDING_STORAGE_WORKERS')
+
+
+def recording_size_limit(max_time_input):
+    """
+    Returns the maximum size in bytes of a recording of max_time_input seconds.
+    """
+    return (max_time_input * getattr(settings, 'RECORDING_UPLOAD_BYTES_PER_SECOND', 32000)
+            + getattr(settings, 'RECORDING_UPLOAD_OVERHEAD', 64 * 1024))
+
+
+class SpooledRecording(UploadedFile):
+    """
+    An uploaded file that is spooled to a file on disk. Unlike a
+    TemporaryUploadedFile, the file is not removed when it is closed, so it
+    can be written to storage after the request.
+    """
+
+    def __init__(self, path, name, content_type, charset, content_type_extra = None):
+        super(SpooledRecording, self).__init__(open(path, 'w+b'), name, content_type, 0, charset, content_type_extra)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RecordingUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to spool files in FILE_UPLOAD_TEMP_DIR, and
+    stops the upload when a file is larger than max_size bytes.
+    """
+
+    def __init__(self, request, max_size):
+        super(RecordingUploadHandler, self).__init__(request)
+        self.max_size = max_size
+        self.size_exceeded = False
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super(RecordingUploadHandler, self).new_file(*args, **kwargs)
+        handle, path = tempfile.mkstemp(suffix = '.upload.wav', dir = settings.FILE_UPLOAD_TEMP_DIR)
+        os.close(handle)
+        self.file = SpooledRecording(path, self.file_name, self.content_type, self.charset, self.content_type_extra)
+        self.received = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.size_exceeded = True
+            self.file.discard()
+            raise StopUpload()
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.discard()
+
+
+def stores_in_background(storage):
+    """
+    Returns True if files should be written to storage in the background.
+    """
+    in_background = getattr(settings, 'RECORDING_STORAGE_IN_BACKGROUND', None)
+    if in_background is None:
+        return not isinstance(storage, FileSystemStorage)
+    return in_background
+
+
+def write_recording(spoken_user_input_id, path, name):
+    """
+    Writes the spool file at path to storage as name, and removes it.
+    """
+    from .models import SpokenUserInput
+
+    storage = SpokenUserInput._meta.get_field('audio').storage
+    try:
+        with open(path, 'rb') as spool:
+            stored_name = storage.save(name, File(spool))
+        if stored_name != name:
+            SpokenUserInput.objects.filter(pk = spoken_user_input_id).update(audio = stored_name)
+    finally:
+        os.remove(path)
+
+
+def save_recording(spoken_user_input, recording, name):
+    """
+    Saves spoken_user_input with recording (a SpooledRecording) as its audio
+    file, named name.
+    """
+    field = spoken_user_input._meta.get_field('audio')
+    if not stores_in_background(field.storage):
+        # The storage moves the spool file into place
+        spoken_user_input.audio = recording
+        spoken_user_input.audio.name = name
+        spoken_user_input.save()
+        recording.discard()
+        return
+
+    stored_name = field.generate_filename(spoken_user_input, name)
+    spoken_user_input.audio = stored_name
+    spoken_user_input.save()
+    recording.close()
+    transaction.on_commit(lambda: recording_storage_queue.submit(write_recording,
+            spoken_user_input.pk, recording.temporary_file_path(), stored_name))
@@ -0,0 +1,181 @@
+"""
+Bulk validation of Voice Services.
+
+Validating a service used to walk the ORM element by element: every voice
+label, voice fragment, supported language, redirect and choice option was
+resolved with its own query, so the number of queries grew with the size
+of the service. Here everything the validators need is loaded up front
+with a fixed number of queries, after which the validators of the models
+run in memory.
+
+The result is cached per service until the service or one of its elements
+changes (see callflow.call_flow_graph_version), until a voice label,
+voice fragment or language changes (see signals.py), or until the
+accessibility of the audio files has to be checked again (see
+accessibility.py).
+"""
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import translation
+from django.utils.translation import ugettext
+
+from .accessibility import check_audio_files
+from .cache import ProcessCache
+from .callflow import call_flow_graph_version
+from .models import VoiceService, VoiceServiceSubElement, Choice, ChoiceOption
+
+# Validation results, per VoiceService id, in the language of the request that
+# validated it. These expire with the accessibility of audio files, which can
+# change without the database changing.
+service_validation_cache = ProcessCache('voice service validation',
+        ttl = getattr(settings, 'AUDIO_ACCESSIBILITY_TTL', 300))
+
+
+class ServiceValidation(object):
+    """
+    The result of validating a Voice Service: the (deduplicated) errors of
+    the service, and the errors per element id.
+    """
+
+    def __init__(self, service_id, errors = (), element_errors = None):
+        self.service_id = service_id
+        self.errors = tuple(errors)
+        self.element_errors = element_errors or {}
+
+    def is_valid(self):
+        return len(self.errors) == 0
+
+    def errors_of(self, element):
+        """
+        Returns the errors of element, or None if it was not validated as
+        part of this service.
+        """
+        return self.element_errors.get(element.pk)
+
+
+def load_elements(service):
+    """
+    Returns the elements of service (as their actual subclass) ordered by
+    id, with everything their validators use loaded.
+    """
+    elements = VoiceServiceSubElement.objects.subclasses_in_bulk(service_id = service.pk)
+    ordered = [elements[element_id] for element_id in sorted(elements)]
+
+    choices = [element for element in ordered if isinstance(element, Choice)]
+    prefetch_related_objects(choices, Prefetch('choice_options',
+            queryset = ChoiceOption.objects.order_by('pk')))
+
+    # Choice options are validated by their Choice as well, use the
+    # instances of the service where possible.
+    related = list(ordered)
+    for choice in choices:
+        options = [elements.get(option.pk, option) for option in choice.choice_options.all()]
+        choice._prefetched_objects_cache['choice_options'] = options
+        related.extend(option for option in options if option.pk not in elements)
+    prefetch_related_objects(related, 'voice_label__voicefragment_set')
+    check_voice_fragments(service, related)
+
+    foreign = []
+    for element in related:
+        if element.service_id == service.pk:
+            element.service = service
+        else:
+            foreign.append(element)
+        if isinstance(element, ChoiceOption):
+            if element.parent_id in elements:
+                element.parent = elements[element.parent_id]
+            else:
+                foreign.append(element)
+            if element._redirect_id in elements:
+                element._redirect = elements[element._redirect_id]
+            elif element._redirect_id:
+                foreign.append(element)
+    # Elements that refer to other services, which only happens when a
+    # service is not valid
+    foreign = list(dict((id(element), element) for element in foreign).values())
+    prefetch_related_objects(foreign, 'service__supported_languages')
+    options = [element for element in foreign if isinstance(element, ChoiceOption)]
+    prefetch_related_objects(options, 'parent__service', '_redirect')
+    return ordered
+
+
+def check_voice_fragments(service, elements):
+    """
+    Checks whether the audio files of the Voice Fragments of elements (in
+    the languages of service) are accessible, in a single batch. The
+    results are cached, and used by VoiceFragment.validator().
+    """
+    language_ids = set(language.pk for language in service.supported_languages.all())
+    check_audio_files(voice_fragment.audio
+            for element in elements if element.voice_label
+            for voice_fragment in element.voice_label.voicefragment_set.all()
+            if voice_fragment.language_id in language_ids)
+
+
+def validate_service(service):
+    """
+    Validates service and all of its elements, using a fixed number of
+    queries. Returns a ServiceValidation.
+    """
+    prefetch_related_objects([service], 'supported_languages')
+    errors = []
+    element_errors = {}
+    if not service._start_element_id:
+        errors.append(ugettext('No starting element'))
+    else:
+        for element in load_elements(service):
+            element_errors[element.pk] = element.validator()
+            errors.extend(element_errors[element.pk])
+    if len(service.supported_languages.all()) == 0:
+        errors.append(ugettext('No supported languages'))
+
+    # deduplicate errors
+    return ServiceValidation(service.pk, list(dict.fromkeys(errors)), element_errors)
+
+
+def get_service_validation(service):
+    """
+    Returns the (cached) ServiceValidation of service, a VoiceService or
+    its id, with the errors in the active language.
+    """
+    service_id = getattr(service, 'pk', service)
+    if service_id is None:
+        # Unsaved service
+        return validate_service(service)
+    version = call_flow_graph_version(service_id)
+    if version is None:
+        return ServiceValidation(service_id)
+    # Validates a fresh instance, the caller's instance might have unsaved changes
+    return service_validation_cache.get(service_id,
+            lambda: validate_service(VoiceService.objects.get(pk = service_id)),
+            version = (version, translation.get_language()))
+
+
+def prefetch_service_validations(elements):
+    """
+    Looks up the (cached) ServiceValidations of the services of elements
+    once per service, for element_validation_errors.
+    """
+    validations = {}
+    for element in elements:
+        if element.service_id is not None:
+            if element.service_id not in validations:
+                validations[element.service_id] = get_service_validation(element.service_id)
+            element._service_validation = validations[element.service_id]
+    return elements
+
+
+def element_validation_errors(element):
+    """
+    Returns the errors of element, from the (cached) validation of its
+    service when possible.
+    """
+    if element.pk is None or element.service_id is None:
+        return element.validator()
+    validation = getattr(element, '_service_validation', None)
+    if validation is None or validation.service_id != element.service_id:
+        validation = get_service_validation(element.service_id)
+    errors = validation.errors_of(element)
+    if errors is None:
+        return element.validator()
+    return list(errors)
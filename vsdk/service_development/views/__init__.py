@@ -7,3 +7,5 @@ from .vse_retrieve_reports import *
 from .user import *
 from .voiceservice import *
 from .language import *
+from .media import *
+from .vxml_metrics import *
@@ -4,11 +4,12 @@ from django.views.generic import TemplateView
 from django.http.response import HttpResponseRedirect
 
 from ..models import CallSession, VoiceService, Language
+from ..models import get_supported_languages
 
 class LanguageSelection(TemplateView):
 
     def render_language_selection_form(self, request, session, redirect_url):
-        languages = session.service.supported_languages.all()
+        languages = get_supported_languages(session.service_id)
 
         # This is the redirect URL to POST the language selected
         redirect_url_POST = reverse('service-development:language-selection', args = [session.id])
@@ -0,0 +1,51 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from ..media import file_hash, VERSION_LENGTH
+
+
+def serve_media(request, path):
+    """
+    Serves a file from MEDIA_ROOT with a content hash ETag and Last-Modified
+    header, and answers conditional requests with 304 Not Modified.
+    Versioned URLs (see media.versioned_media_url()) can be cached for
+    MEDIA_VERSIONED_MAX_AGE seconds, other URLs, and URLs with the version
+    of a previous content of the file, for MEDIA_MAX_AGE seconds.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('"%s" does not exist' % path)
+    if not os.path.isfile(full_path):
+        raise Http404('"%s" does not exist' % path)
+
+    digest = file_hash(full_path)
+    if digest is None:
+        raise Http404('"%s" does not exist' % path)
+    etag = '"%s"' % digest
+    last_modified = int(os.stat(full_path).st_mtime)
+    if request.GET.get('v') == digest[:VERSION_LENGTH]:
+        max_age = getattr(settings, 'MEDIA_VERSIONED_MAX_AGE', 365 * 24 * 60 * 60)
+    else:
+        max_age = getattr(settings, 'MEDIA_MAX_AGE', 0)
+
+    response = get_conditional_response(request, etag = etag, last_modified = last_modified)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response = FileResponse(open(full_path, 'rb'), content_type = content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if max_age:
+        patch_cache_control(response, public = True, max_age = max_age)
+    else:
+        patch_cache_control(response, no_cache = True)
+    return response
@@ -3,6 +3,7 @@ from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 
 from ..models import VoiceService, lookup_or_create_session, lookup_kasadaka_user_by_caller_id
+from ..callflow import get_call_flow_graph
 
 from . import base
 
@@ -61,4 +62,4 @@ def voice_service_start(request, voice_service_id, session_id = None):
         return base.redirect_add_get_parameters('service-development:language-selection',
                         session.id,
                         redirect_url = return_url)
-    return base.redirect_to_voice_service_element(voice_service.start_element, session)
+    return base.redirect_to_voice_service_element(get_call_flow_graph(voice_service.id).start_element, session)
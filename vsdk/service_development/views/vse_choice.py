@@ -1,18 +1,21 @@
 from django.shortcuts import render, get_object_or_404, get_list_or_404, redirect
 
 from ..models import *
+from ..callflow import get_call_flow_graph
+from ..vxml_cache import render_element
+from ..sprites import choice_menu_sprite_url
 
 
-def choice_options_resolve_voice_labels(choice_options, language):
+def choice_options_resolve_voice_labels(choice_options, language, graph):
     """
     Returns a list of voice labels belonging to the provided list of choice_options.
     """
     choice_options_voice_labels = []
     for choice_option in choice_options:
-        choice_options_voice_labels.append(choice_option.get_voice_fragment_url(language))
+        choice_options_voice_labels.append(graph.voice_fragment_url(choice_option, language))
     return choice_options_voice_labels
 
-def choice_generate_context(request, choice_element, session):
+def choice_generate_context(choice_element, session, graph, url, choice_menu_sprite = None):
     """
     Returns a dict that can be used to generate the choice VXML template
     choice = this Choice element object
@@ -20,35 +23,43 @@ def choice_generate_context(request, choice_element, session):
     choice_options = iterable of ChoiceOption object belonging to this Choice element
     choice_options_voice_labels = list of resolved Voice Label URL's referencing to the choice_options in the same position
     choice_options_redirect_urls = list of resolved redirection URL's referencing to the choice_options in the same position
+    choice_menu_sprite = URL of the whole prompt as a single audio file, if available (see sprites.py)
         """
-    choice_options = choice_element.choice_options.all()
+    choice_options = graph.choice_options(choice_element)
     language = session.language
     context = {
         'choice': choice_element,
-        'choice_voice_label': choice_element.get_voice_fragment_url(language),
+        'choice_voice_label': graph.voice_fragment_url(choice_element, language),
         'choice_options': choice_options,
-        'choice_options_voice_labels': choice_options_resolve_voice_labels(choice_options, language),
+        'choice_options_voice_labels': choice_options_resolve_voice_labels(choice_options, language, graph),
         'choice_options_ids': [choice_option.pk for choice_option in choice_options],
         'language': language,
-        'url': request.get_full_path(False)
+        'choice_menu_sprite': choice_menu_sprite,
+        'url': url
     }
     return context
 
 
 def choice(request, element_id, session_id):
-    choice_element = get_object_or_404(Choice, pk=element_id)
     session = get_object_or_404(CallSession, pk=session_id)
+    graph = get_call_flow_graph(session.service_id)
+    choice_element = graph.get_element_or_404(Choice, element_id)
 
     if request.method == "POST":
         if 'option_id' not in request.POST:
             raise ValueError('Incorrect request, no choice specified')
-        choice_option_selected = get_object_or_404(ChoiceOption, pk=request.POST['option_id'])
+        choice_option_selected = graph.get_element_or_404(ChoiceOption, request.POST['option_id'])
         session.record_choice(choice_element, choice_option_selected)
 
-        return redirect(choice_option_selected.redirect.get_absolute_url(session))
+        return redirect(graph.redirect(choice_option_selected).get_absolute_url(session))
 
     session.record_step(choice_element)
-    context = choice_generate_context(request, choice_element, session)
 
-    return render(request, 'choice.xml', context, content_type='text/xml')
+    choice_menu_sprite = choice_menu_sprite_url(choice_element, session.language, graph)
+
+    def generate_context(session, url):
+        return choice_generate_context(choice_element, session, graph, url, choice_menu_sprite)
+
+    return render_element(request, 'choice.xml', choice_element, session, graph, generate_context,
+            variant = choice_menu_sprite)
 
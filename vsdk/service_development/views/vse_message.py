@@ -1,29 +1,38 @@
 from django.shortcuts import render, get_object_or_404, get_list_or_404, redirect
 
 from ..models import *
+from ..call_log import flush_call_log
+from ..callflow import get_call_flow_graph
+from ..vxml_cache import render_element
 
-def message_presentation_get_redirect_url(message_presentation_element,session):
+def message_presentation_get_redirect_url(message_presentation_element, session, graph):
     if not message_presentation_element.final_element:
-        return message_presentation_element.redirect.get_absolute_url(session)
+        return graph.redirect(message_presentation_element).get_absolute_url(session)
     else:
         return None
 
 
 
-def message_presentation_generate_context(message_presentation_element,session):
+def message_presentation_generate_context(message_presentation_element, session, graph):
     language = session.language
-    message_voice_fragment_url = message_presentation_element.get_voice_fragment_url(language)
-    redirect_url = message_presentation_get_redirect_url(message_presentation_element,session)
+    message_voice_fragment_url = graph.voice_fragment_url(message_presentation_element, language)
+    redirect_url = message_presentation_get_redirect_url(message_presentation_element, session, graph)
     context = {'message_voice_fragment_url':message_voice_fragment_url,
             'redirect_url':redirect_url}
     return context
 
 
 def message_presentation(request, element_id, session_id):
-    message_presentation_element = get_object_or_404(MessagePresentation, pk=element_id)
     session = get_object_or_404(CallSession, pk=session_id)
+    graph = get_call_flow_graph(session.service_id)
+    message_presentation_element = graph.get_element_or_404(MessagePresentation, element_id)
     session.record_step(message_presentation_element)
-    context = message_presentation_generate_context(message_presentation_element, session)
+    if message_presentation_element.final_element:
+        # End of the call, write the call log of this session
+        flush_call_log()
 
-    return render(request, 'message_presentation.xml', context, content_type='text/xml')
+    def generate_context(session, url):
+        return message_presentation_generate_context(message_presentation_element, session, graph)
+
+    return render_element(request, 'message_presentation.xml', message_presentation_element, session, graph, generate_context)
 
@@ -1,21 +1,25 @@
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render, get_object_or_404, get_list_or_404, redirect
 
 from ..models import *
+from ..callflow import get_call_flow_graph
+from ..uploads import RecordingUploadHandler, recording_size_limit, save_recording
+from ..vxml_cache import render_element
 
 
-def record_get_redirect_url(record_element, session):
-    return record_element.redirect.get_absolute_url(session)
+def record_get_redirect_url(record_element, session, graph):
+    return graph.redirect(record_element).get_absolute_url(session)
 
-def record_generate_context(record_element, session):
+def record_generate_context(record_element, session, graph):
     language = session.language
-    redirect_url = record_get_redirect_url(record_element, session)
+    redirect_url = record_get_redirect_url(record_element, session, graph)
 
 
-    voice_label = record_element.voice_label.get_voice_fragment_url(language)
-    ask_confirmation_voice_label = record_element.ask_confirmation_voice_label.get_voice_fragment_url(language)
-    repeat_voice_label = record_element.repeat_voice_label.get_voice_fragment_url(language)
-    final_voice_label = record_element.final_voice_label.get_voice_fragment_url(language)
-    did_not_hear_voice_label = record_element.not_heard_voice_label.get_voice_fragment_url(language)
+    voice_label = graph.voice_fragment_url(record_element, language)
+    ask_confirmation_voice_label = graph.voice_fragment_url(record_element, language, 'ask_confirmation_voice_label')
+    repeat_voice_label = graph.voice_fragment_url(record_element, language, 'repeat_voice_label')
+    final_voice_label = graph.voice_fragment_url(record_element, language, 'final_voice_label')
+    did_not_hear_voice_label = graph.voice_fragment_url(record_element, language, 'not_heard_voice_label')
     max_time_input = record_element.max_time_input
 
 
@@ -34,26 +38,31 @@ def record_generate_context(record_element, session):
 
 
 def record(request, element_id, session_id):
-    record_element = get_object_or_404(Record, pk=element_id)
-    voice_service = record_element.service
-    session = lookup_or_create_session(voice_service, session_id)
+    session = get_object_or_404(CallSession, pk=session_id)
+    graph = get_call_flow_graph(session.service_id)
+    record_element = graph.get_element_or_404(Record, element_id)
 
 
     if request.method == "POST":
-        session = get_object_or_404(CallSession, pk=session_id)
-
         value = 'audio file'
 
+        # Stream the recording to disk, and refuse recordings longer than allowed
+        upload_handler = RecordingUploadHandler(request, recording_size_limit(record_element.max_time_input))
+        request.upload_handlers = [upload_handler]
+        recording = request.FILES.get('recording')
+        if recording is None:
+            if upload_handler.size_exceeded:
+                return HttpResponse(status = 413)
+            return HttpResponseBadRequest()
+
         result = SpokenUserInput()
 
         result.session = session
 
-        result.audio = request.FILES['recording']
-        result.audio.name = 'recording_%s_%s.wav' % (session_id, element_id)
         result.category = record_element.input_category
         result.record_element = record_element
 
-        result.save()
+        save_recording(result, recording, 'recording_%s_%s.wav' % (session_id, element_id))
 
         #if record_element.map_to_call_session_property in vars(session).keys():
         #    setattr(session, record_element.map_to_call_session_property, value)
@@ -63,9 +72,11 @@ def record(request, element_id, session_id):
 
 
     session.record_step(record_element)
-    context = record_generate_context(record_element, session)
 
-    context['url'] = request.get_full_path(False)
+    def generate_context(session, url):
+        context = record_generate_context(record_element, session, graph)
+        context['url'] = url
+        return context
 
-    return render(request, 'record.xml', context, content_type='text/xml')
+    return render_element(request, 'record.xml', record_element, session, graph, generate_context)
 
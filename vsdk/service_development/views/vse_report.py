@@ -1,66 +1,28 @@
 from django.shortcuts import render, get_object_or_404, redirect
 
-from ..models import VoiceServiceElement
-from ..models import Record
-from ..models import SpokenUserInput
-from ..models import lookup_or_create_session
-from ..models import Choice
-from ..models import CallSessionChoice
-from ..models import CallSessionStep
+from ..models import CallSession
 from ..models import Report
 from ..models import UserReport
+from ..callflow import get_call_flow_graph
+from ..reports import ReportAssembly
 
 
-def report_get_redirect_no_url(report_element, session):
-    return report_element.redirect_no.get_absolute_url(session)
-
-
-def report_get_summary(report_element, session):
-    summary = []
-    # Ignore any input that has been entered before the last time the voice service's start
-    # element has been visited for this session. This allows for report elements even when the
-    # user has the ability to restart the service instead of terminating the call at some point.
-    iteration_start_time = CallSessionStep.objects.filter(
-        session=session,
-        _visited_element=session.service.start_element
-    ).latest('time').time
-    for report_content in report_element.report_contents.all():
-        element = VoiceServiceElement.objects.get_subclass(id=report_content.content.id)
-        if isinstance(element, Record):
-            recorded_input = SpokenUserInput.objects.filter(
-                session=session,
-                record_element=element,
-                time__gte=iteration_start_time
-            )
-            if recorded_input.exists():
-                summary.append({
-                    'voice_label': report_content.voice_label.get_voice_fragment_url(session.language),
-                    'value': recorded_input.latest('time').get_voice_fragment_url(),
-                })
-        elif isinstance(element, Choice):
-            stored_choice = CallSessionChoice.objects.filter(
-                session=session,
-                choice_element=element,
-                time__gte=iteration_start_time
-            )
-            if stored_choice.exists():
-                summary.append({
-                    'voice_label': report_content.voice_label.get_voice_fragment_url(session.language),
-                    'value': stored_choice.latest('time').choice_option_selected.voice_label
-                                          .get_voice_fragment_url(session.language),
-                })
-
-    return summary
-
-
-def report_generate_context(request, report_element, session):
+def report_get_redirect_no_url(report_element, session, graph):
+    return graph.redirect(report_element, '_redirect_no').get_absolute_url(session)
+
+
+def report_get_summary(report_element, session, graph):
+    return ReportAssembly(report_element, session, graph).summary()
+
+
+def report_generate_context(request, report_element, session, graph):
     language = session.language
-    redirect_no_url = report_get_redirect_no_url(report_element, session)
+    redirect_no_url = report_get_redirect_no_url(report_element, session, graph)
 
-    voice_label = report_element.voice_label.get_voice_fragment_url(language)
-    ask_confirmation_voice_label = report_element.ask_confirmation_voice_label.get_voice_fragment_url(language)
+    voice_label = graph.voice_fragment_url(report_element, language)
+    ask_confirmation_voice_label = graph.voice_fragment_url(report_element, language, 'ask_confirmation_voice_label')
 
-    summary = report_get_summary(report_element, session)
+    summary = report_get_summary(report_element, session, graph)
 
     context = {
         'report': report_element,
@@ -75,9 +37,9 @@ def report_generate_context(request, report_element, session):
 
 
 def report(request, element_id, session_id):
-    report_element = get_object_or_404(Report, pk=element_id)
-    voice_service = report_element.service
-    session = lookup_or_create_session(voice_service, session_id)
+    session = get_object_or_404(CallSession, pk=session_id)
+    graph = get_call_flow_graph(session.service_id)
+    report_element = graph.get_element_or_404(Report, element_id)
 
     if request.method == "POST":
         new_report = UserReport()
@@ -85,35 +47,11 @@ def report(request, element_id, session_id):
         new_report.report_element = report_element
         new_report.save()
 
-        # Ignore any input that has been entered before the last time the voice service's start
-        # element has been visited for this session. This allows for report elements even when the
-        # user has the ability to restart the service instead of terminating the call at some point.
-        iteration_start_time = CallSessionStep.objects.filter(
-            session=session,
-            _visited_element=session.service.start_element
-        ).latest('time').time
-        for report_content in report_element.report_contents.all():
-            element = VoiceServiceElement.objects.get_subclass(id=report_content.content.id)
-            if isinstance(element, Record):
-                recording_or_choice = SpokenUserInput.objects.filter(
-                    session=session,
-                    record_element=element,
-                    time__gte=iteration_start_time
-                )
-            elif isinstance(element, Choice):
-                recording_or_choice = CallSessionChoice.objects.filter(
-                    session=session,
-                    choice_element=element,
-                    time__gte=iteration_start_time
-                )
-            if recording_or_choice.exists():
-                recording_or_choice = recording_or_choice.latest('time')
-                recording_or_choice.report = new_report
-                recording_or_choice.save()
-
-        return redirect(report_element.redirect_yes.get_absolute_url(session))
+        ReportAssembly(report_element, session, graph).submit(new_report)
+
+        return redirect(graph.redirect(report_element, '_redirect_yes').get_absolute_url(session))
 
     session.record_step(report_element)
-    context = report_generate_context(request, report_element, session)
+    context = report_generate_context(request, report_element, session, graph)
 
     return render(request, 'report.xml', context, content_type='text/xml')
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from ..metrics import prometheus_text
+
+
+def metrics(request):
+    """
+    Serves the metrics of the VoiceXML requests handled by this worker
+    process, in the Prometheus text format. Only clients in
+    VXML_METRICS_ALLOWED_IPS (default: localhost) have access, or anyone
+    when it is set to None.
+    """
+    allowed_ips = getattr(settings, 'VXML_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if allowed_ips is not None and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(), content_type = 'text/plain; version=0.0.4; charset=utf-8')
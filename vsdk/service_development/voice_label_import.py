@@ -0,0 +1,221 @@
+"""
+Bulk import of Voice Labels from a ZIP archive or directory of audio files.
+
+Files are named <label>/<language code>.wav: every directory is a Voice
+Label (created when no label with that name exists), and every file in it
+the Voice Fragment of that label in the Language with that code (replaced
+when it exists).
+
+The files are validated, and converted to the format of the telephony
+platform when conversion is enabled (see audio_conversion.py), in a pool of
+VOICE_LABEL_IMPORT_WORKERS processes (default: one per core). The labels
+and fragments are then created and updated in bulk, in a single
+transaction. Every file gets a line in the report of the import.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils.text import slugify
+
+from .audio_conversion import conversion_enabled, convert_audio_file
+from .models.validators import WAVE_HEADER_SIZE, is_telephony_wave_format, parse_wave_header
+
+# Result of importing a file. status is 'created', 'updated', 'skipped' or 'failed'.
+ImportResult = namedtuple('ImportResult', ('path', 'label', 'language', 'status', 'message'))
+
+# A file to import, with the path of the (extracted) file
+ImportFile = namedtuple('ImportFile', ('path', 'source', 'label', 'language'))
+
+
+def prepare_audio(source, destination, convert):
+    """
+    Validates the wave file at source. When it is not in the format of the
+    telephony platform, converts it to destination if convert is set. Runs
+    in a worker process. Returns the path of the file to store and a
+    message, or raises a ValueError or OSError.
+    """
+    with open(source, 'rb') as audio_file:
+        wave_format = parse_wave_header(audio_file.read(WAVE_HEADER_SIZE))
+    if wave_format is None:
+        raise ValueError('Not a wave file')
+    if is_telephony_wave_format(wave_format):
+        return source, ''
+    if not convert:
+        return source, 'Not in the correct format (8 kHz, 16 bit, mono PCM), and not converted'
+    convert_audio_file(source, destination)
+    return destination, 'Converted'
+
+
+def import_workers():
+    workers = getattr(settings, 'VOICE_LABEL_IMPORT_WORKERS', None)
+    return os.cpu_count() or 1 if workers is None else workers
+
+
+def collect_files(path, staging_directory):
+    """
+    Returns the ImportFiles in the ZIP archive or directory at path, and
+    ImportResults of the entries that are skipped. Files in archives are
+    extracted to staging_directory.
+    """
+    files = []
+    skipped = []
+
+    def add(name, source):
+        parts = name.replace('\\', '/').strip('/').split('/')
+        label = parts[-2] if len(parts) >= 2 else ''
+        language, extension = os.path.splitext(parts[-1])
+        if not label or extension.lower() != '.wav':
+            skipped.append(ImportResult(name, None, None, 'skipped', 'Not named <label>/<language code>.wav'))
+        else:
+            files.append(ImportFile(name, source, label, language))
+
+    if os.path.isdir(path):
+        for directory, directories, names in os.walk(path):
+            directories.sort()
+            for name in sorted(names):
+                source = os.path.join(directory, name)
+                add(os.path.relpath(source, path), source)
+    else:
+        with zipfile.ZipFile(path) as archive:
+            for number, info in enumerate(archive.infolist()):
+                if info.is_dir():
+                    continue
+                source = os.path.join(staging_directory, 'source%s.wav' % number)
+                with archive.open(info) as member, open(source, 'wb') as extracted:
+                    shutil.copyfileobj(member, extracted)
+                add(info.filename, source)
+    return files, skipped
+
+
+def prepare_files(files, staging_directory, workers):
+    """
+    Runs prepare_audio for files in a process pool (in this process with 0
+    workers). Returns a list of (path to store, message) or exceptions.
+    """
+    convert = conversion_enabled()
+    arguments = [(import_file.source, os.path.join(staging_directory, 'converted%s.wav' % number), convert)
+            for number, import_file in enumerate(files)]
+    if not workers:
+        futures = None
+    else:
+        executor = ProcessPoolExecutor(max_workers = workers)
+        futures = [executor.submit(prepare_audio, *args) for args in arguments]
+    results = []
+    try:
+        for number, args in enumerate(arguments):
+            try:
+                results.append(futures[number].result() if futures else prepare_audio(*args))
+            except (OSError, ValueError) as error:
+                results.append(error)
+    finally:
+        if futures:
+            executor.shutdown()
+    return results
+
+
+def import_voice_labels(path, workers = None):
+    """
+    Imports the Voice Labels in the ZIP archive or directory at path.
+    Returns a list of ImportResults, one per file.
+    """
+    from .models import Language, VoiceFragment
+
+    if workers is None:
+        workers = import_workers()
+    with tempfile.TemporaryDirectory() as staging_directory:
+        files, results = collect_files(path, staging_directory)
+        languages = dict((language.code, language) for language in Language.objects.all())
+
+        # The last file of a label and language is imported
+        selected = {}
+        for import_file in files:
+            if import_file.language not in languages:
+                results.append(ImportResult(import_file.path, import_file.label, import_file.language, 'failed',
+                        'Unknown language code'))
+                continue
+            previous = selected.get((import_file.label, import_file.language))
+            if previous is not None:
+                results.append(ImportResult(previous.path, previous.label, previous.language, 'skipped',
+                        'Replaced by %s' % import_file.path))
+            selected[(import_file.label, import_file.language)] = import_file
+        files = list(selected.values())
+
+        prepared = []
+        for import_file, result in zip(files, prepare_files(files, staging_directory, workers)):
+            if isinstance(result, Exception):
+                results.append(ImportResult(import_file.path, import_file.label, import_file.language, 'failed',
+                        str(result)))
+            else:
+                prepared.append((import_file, result[0], result[1]))
+
+        audio_field = VoiceFragment._meta.get_field('audio')
+        stored = []
+        try:
+            for import_file, source, message in prepared:
+                name = audio_field.generate_filename(None, '%s_%s.wav' % (slugify(import_file.label) or 'label',
+                        import_file.language))
+                with open(source, 'rb') as audio_file:
+                    stored.append(audio_field.storage.save(name, File(audio_file), max_length = audio_field.max_length))
+            results.extend(save_voice_fragments(prepared, stored, languages))
+        except Exception:
+            for name in stored:
+                audio_field.storage.delete(name)
+            raise
+    return results
+
+
+def save_voice_fragments(prepared, stored, languages):
+    """
+    Creates or updates the Voice Labels and Fragments of the prepared files,
+    stored under the names in stored, in a single transaction. Returns their
+    ImportResults.
+    """
+    from .models import VoiceFragment, VoiceLabel
+    from .signals import voice_content_changed
+
+    label_names = set(import_file.label for import_file, source, message in prepared)
+    with transaction.atomic():
+        labels = {}
+        for label in VoiceLabel.objects.filter(name__in = label_names).order_by('-pk'):
+            # The oldest label with a name
+            labels[label.name] = label
+        VoiceLabel.objects.bulk_create([VoiceLabel(name = name) for name in sorted(label_names - set(labels))])
+        for label in VoiceLabel.objects.filter(name__in = label_names - set(labels)).order_by('-pk'):
+            labels[label.name] = label
+
+        existing = {}
+        for fragment in VoiceFragment.objects.filter(parent__in = labels.values()).order_by('-pk'):
+            existing[(fragment.parent_id, fragment.language_id)] = fragment
+
+        results = []
+        new_fragments = []
+        updated_fragments = []
+        for (import_file, source, message), name in zip(prepared, stored):
+            label = labels[import_file.label]
+            language = languages[import_file.language]
+            fragment = existing.get((label.pk, language.pk))
+            if fragment is None:
+                new_fragments.append(VoiceFragment(parent = label, language = language, audio = name))
+                status = 'created'
+            else:
+                fragment.audio = name
+                updated_fragments.append(fragment)
+                status = 'updated'
+            results.append(ImportResult(import_file.path, import_file.label, import_file.language, status, message))
+        VoiceFragment.objects.bulk_create(new_fragments)
+        # Converted in the worker processes
+        for fragment in updated_fragments:
+            fragment.conversion_status = VoiceFragment.CONVERSION_CONVERTED
+            fragment.conversion_error = ''
+        VoiceFragment.objects.bulk_update(updated_fragments, ['audio', 'conversion_status', 'conversion_error'])
+        # Bulk operations do not send signals
+        voice_content_changed(new_fragments + updated_fragments)
+    return results
+
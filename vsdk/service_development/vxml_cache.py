@@ -0,0 +1,136 @@
+"""
+Cache of rendered VoiceXML documents.
+
+For most elements the generated VoiceXML only depends on the element, the
+language of the caller and the version of the call flow graph. The only
+session specific part is the session id in the URLs of the document.
+These documents are rendered once with a placeholder session id, and the
+placeholder is replaced by the id of the actual session when serving.
+
+Cached documents are served with an ETag, so the VoiceXML browser can
+revalidate its copy of a document instead of downloading it again.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .cache import ProcessCache
+
+logger = logging.getLogger(__name__)
+
+# Session id with which cached documents are rendered. It only ends up in
+# the URLs of the document, and is unlikely to occur anywhere else.
+SESSION_ID_PLACEHOLDER = 918273645546372819
+
+# Rendered documents, per (element id, language id, template name, variant)
+vxml_document_cache = ProcessCache('rendered VoiceXML documents')
+
+
+class PlaceholderSession(object):
+    """
+    Stands in for a CallSession while rendering a cacheable document.
+    Behaves like the session, except for its id.
+    """
+    id = pk = SESSION_ID_PLACEHOLDER
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class DocumentCacheStatistics(object):
+    """
+    Keeps track of the hit ratio and the rendering time saved, per element.
+    """
+
+    def __init__(self):
+        self._elements = {}
+        self._lock = threading.Lock()
+
+    def record(self, element, hit, render_time, serve_time):
+        with self._lock:
+            stats = self._elements.setdefault(element.pk, {'hits': 0, 'misses': 0, 'time_saved': 0.0})
+            if hit:
+                stats['hits'] += 1
+                stats['time_saved'] += max(render_time - serve_time, 0)
+            else:
+                stats['misses'] += 1
+            stats = dict(stats)
+
+        lookups = stats['hits'] + stats['misses']
+        interval = getattr(settings, 'VXML_DOCUMENT_CACHE_LOG_INTERVAL', 100)
+        level = logging.INFO if interval and lookups % interval == 0 else logging.DEBUG
+        logger.log(level, 'VoiceXML document cache %s for "%s" (%s): hit ratio %.2f (%s/%s), %.1f ms saved',
+                'hit' if hit else 'miss', element.name, element.pk,
+                stats['hits'] / lookups, stats['hits'], lookups, stats['time_saved'] * 1000)
+
+    def __getitem__(self, element_id):
+        with self._lock:
+            return dict(self._elements[element_id])
+
+    def as_dict(self):
+        with self._lock:
+            return dict((element_id, dict(stats)) for element_id, stats in self._elements.items())
+
+    def reset(self):
+        with self._lock:
+            self._elements.clear()
+
+
+vxml_document_cache_statistics = DocumentCacheStatistics()
+
+
+def render_element(request, template_name, element, session, graph, generate_context, variant = None):
+    """
+    Renders the VoiceXML template of element for session.
+
+    generate_context(session, url) should return the template context, in
+    which url is the URL of the element for this session. When the document
+    is cacheable it is called with a PlaceholderSession, so it should not
+    depend on anything else than the element, the session language and
+    variant (any other hashable value the document depends on).
+    Requests with GET parameters are never cached.
+    """
+    cacheable = (getattr(settings, 'VXML_DOCUMENT_CACHE', True)
+            and not request.GET
+            and graph.version is not None
+            and element in graph)
+    if not cacheable:
+        context = generate_context(session, request.get_full_path(False))
+        return render(request, template_name, context, content_type='text/xml')
+
+    language = session.language
+    key = (element.pk, language.pk if language else None, template_name, variant)
+    rendered = {}
+
+    def render_document():
+        start = time.perf_counter()
+        placeholder = PlaceholderSession(session)
+        context = generate_context(placeholder, element.get_absolute_url(placeholder))
+        content = render_to_string(template_name, context, request)
+        rendered['time'] = time.perf_counter() - start
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+        return (tuple(content.split(str(SESSION_ID_PLACEHOLDER))), rendered['time'], digest)
+
+    start = time.perf_counter()
+    parts, render_time, digest = vxml_document_cache.get(key, render_document, version = graph.version)
+    # The document only changes with the cached document, so the VoiceXML browser
+    # can keep it as long as it revalidates it.
+    etag = '"%s-%s"' % (digest, session.id)
+    response = get_conditional_response(request, etag = etag)
+    if response is None:
+        response = HttpResponse(str(session.id).join(parts), content_type='text/xml')
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache = True)
+    vxml_document_cache_statistics.record(element, 'time' not in rendered, render_time,
+            time.perf_counter() - start)
+    return response
@@ -0,0 +1,53 @@
+"""
+Base class of the write-behind buffers of call logging (see call_log.py and
+call_trace.py), which queue rows in the worker process and write them to
+the database in bulk.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+
+class WriteBehindBuffer(object):
+    """
+    Thread-safe queue that is flushed by a timer, at most the number of
+    milliseconds in the flush_interval_setting (0: no timer) after the first
+    row was queued. Subclasses queue rows under _lock and implement flush(),
+    which should call _cancel_flush() while holding _lock, and hold
+    _flush_lock from taking the queued rows until they are written, so a
+    flush waits for a flush in progress (e.g. by the timer) to finish.
+    """
+    flush_interval_setting = None
+    default_flush_interval = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _schedule_flush(self):
+        interval = getattr(settings, self.flush_interval_setting, self.default_flush_interval)
+        if not interval:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(interval / 1000.0, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread has its own database connection
+            connection.close()
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'vsdk.service_development.middleware.VxmlMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -198,6 +199,78 @@ else:
 #Only set this to True when sox and mediainfo are available, and local storage is used for static files.
 KASADAKA = False
 
+# Number of background threads converting uploaded audio to the correct format
+# (on KasaDaka systems). With 0, audio is converted while saving.
+AUDIO_CONVERSION_WORKERS = 2
+
+# Recordings are refused when they are larger than the maximum recording time of the
+# Record element allows, at this many bytes per second (16 bit, 16 kHz), plus the overhead.
+RECORDING_UPLOAD_BYTES_PER_SECOND = 32000
+RECORDING_UPLOAD_OVERHEAD = 64 * 1024
+# Write recordings to storage in background threads. None: only for storages that
+# are not on the local file system (e.g. SFTP).
+RECORDING_STORAGE_IN_BACKGROUND = None
+RECORDING_STORAGE_WORKERS = 2
+
+# Play the prompt of Choice menus as a single, pre-concatenated audio file, which is
+# generated in the background in this directory of the media storage.
+CHOICE_MENU_SPRITES = False
+CHOICE_MENU_SPRITE_DIR = 'sprites'
+CHOICE_MENU_SPRITE_WORKERS = 1
+# Seconds after which a sprite that could not be generated is tried again
+CHOICE_MENU_SPRITE_RETRY_INTERVAL = 300
+
+# Serve media files through Django, with ETags and conditional GET. Versioned URLs of
+# Voice Fragments (which change when the audio changes) are cached for a year, other
+# media files are revalidated on every request.
+SERVE_MEDIA = DEBUG
+MEDIA_VERSIONED_MAX_AGE = 365 * 24 * 60 * 60
+MEDIA_MAX_AGE = 0
+
+# Validation checks whether the audio files of Voice Fragments are accessible, by listing
+# the directories of the storage, or with HEAD requests (using this many threads) when
+# the storage can not be listed. Results are cached for AUDIO_ACCESSIBILITY_TTL seconds.
+AUDIO_ACCESSIBILITY_TTL = 300
+AUDIO_ACCESSIBILITY_WORKERS = 8
+AUDIO_ACCESSIBILITY_TIMEOUT = 5
+
+# Record the duration, queries and response size of VoiceXML requests, served at
+# vxml/metrics in the Prometheus text format (to VXML_METRICS_ALLOWED_IPS, None: anyone).
+# Requests that take longer than VXML_SLOW_REQUEST_SECONDS are logged with their SQL.
+VXML_METRICS = True
+VXML_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+VXML_SLOW_REQUEST_SECONDS = None
+
+# Trace the server time, queries and time between requests of every call (CallTrace).
+# Hops are written to the database every CALL_TRACE_FLUSH_INTERVAL milliseconds, or
+# when CALL_TRACE_MAX_BUFFERED are queued.
+CALL_TRACING = False
+CALL_TRACE_FLUSH_INTERVAL = 2000
+CALL_TRACE_MAX_BUFFERED = 500
+
+# Compact the steps and choices of calls older than this number of days (None: keep
+# them), unless their Voice Service has its own retention period. Sessions are compacted
+# CALL_HISTORY_COMPACTION_BATCH at a time, pausing CALL_HISTORY_COMPACTION_PAUSE seconds
+# in between, with the compact_call_history command or from the admin.
+CALL_HISTORY_RETENTION_DAYS = None
+CALL_HISTORY_COMPACTION_BATCH = 100
+CALL_HISTORY_COMPACTION_PAUSE = 0.1
+CALL_HISTORY_WORKERS = 1
+
+# Call statistics per service and hour or day are updated with the update_call_analytics
+# command, from the call sessions that have been inactive for CALL_ANALYTICS_IDLE_MINUTES,
+# CALL_ANALYTICS_CHUNK sessions per transaction.
+CALL_ANALYTICS_IDLE_MINUTES = 60
+CALL_ANALYTICS_CHUNK = 500
+
+# User reports are exported (export_user_reports command, or from the admin) in chunks
+# of this many reports.
+REPORT_EXPORT_CHUNK_SIZE = 500
+
+# Audio files of voice labels imported in bulk (import_voice_labels command) are validated
+# and converted in this many processes. None uses one per core, 0 imports in this process.
+VOICE_LABEL_IMPORT_WORKERS = None
+
 LOCALE_PATHS = (
         os.path.join(os.path.abspath(os.path.dirname(__file__)), 'locale'),
             )
@@ -209,6 +282,27 @@ LANGUAGES = (
                  )
 ASTERISK_EXTENSIONS_FILE = '/etc/asterisk/extensions.conf'
 VXML_HOST_ADDRESS = 'http://127.0.0.1'
+# Activating a Voice Service points the telephony platform to it in the background,
+# through this class (see service_development/telephony.py). LocalTelephonyControl
+# only remembers what it was asked to do.
+TELEPHONY_CONTROL = 'vsdk.service_development.telephony.AsteriskControl'
+ASTERISK_RELOAD_COMMAND = ['sudo', '/etc/init.d/asterisk', 'reload']
+SERVICE_ACTIVATION_WORKERS = 1
+
+# Cache the rendered VoiceXML of elements that do not depend on session data
+VXML_DOCUMENT_CACHE = True
+# Log the hit ratio of the VoiceXML document cache every N requests of an element
+VXML_DOCUMENT_CACHE_LOG_INTERVAL = 100
+
+# Queue call session steps and choices in the worker, and write them in bulk
+# every CALL_LOG_FLUSH_INTERVAL milliseconds (0: only at the end of a call or
+# when read), or when CALL_LOG_MAX_BUFFERED rows are queued. Rows are only written
+# on read by the worker that queued them: with several worker processes, keep
+# CALL_LOG_FLUSH_INTERVAL low, as it bounds how long reports, call statistics and
+# the admin of other workers can miss the latest steps of a call.
+CALL_LOG_WRITE_BEHIND = False
+CALL_LOG_FLUSH_INTERVAL = 500
+CALL_LOG_MAX_BUFFERED = 200
 
 LOGGING = {
     'version': 1,
@@ -236,6 +330,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'vsdk': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     }
 }
 
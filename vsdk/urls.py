@@ -13,18 +13,29 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+from urllib.parse import urlsplit
+
 from django.conf.urls import url, include
 from django.contrib import admin
 from django.conf.urls.static import static
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 
+from vsdk.service_development.views import serve_media
+
 admin.site.site_header = _("KasaDaka Voice Services")
 
 urlpatterns = [
     url(r'^', admin.site.urls),
     url(r'^vxml/', include('vsdk.service_development.urls')),
-] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+
+# Media files (Voice Fragments, recordings) are served with caching headers
+if getattr(settings, 'SERVE_MEDIA', settings.DEBUG) and not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        url(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
 
 #if not settings.DEBUG:
 #        urlpatterns += urlpatterns('',